@@ -3,36 +3,57 @@ LangChain chains for travel document analysis
 Uses structured output with Pydantic models
 """
 
+import asyncio
+import logging
+from pydantic import ValidationError
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
-from app.config import load_google_llm
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import RunnableLambda
+from app.config import settings, load_google_llm
 from app.models.schemas import TravelAnalysis
+from app.chains.registry import chain_registry
+from app.chains.output_repair import ParseMetrics, parse_json_object
+from app.services.response_cache import response_cache, normalize_text
+from app.services.singleflight import SingleFlight
+from app.services.governor import UpstreamBusyError
+from app.services.resilience import gemini_upstream
+from app.services.metrics import observe_chain, observe_stage
 
+# Parse-failure and retry counters for the analysis chain
+parse_metrics = ParseMetrics()
 
-def create_analysis_chain(language: str = "en"):
+logger = logging.getLogger(__name__)
+
+# Identical documents analyzed at the same time share one LLM call
+analysis_flight = SingleFlight("analysis")
+
+
+def create_analysis_chain(language: str = "en", llm=None, output_mode: str | None = None):
     """
     Create a chain for structured travel document analysis
     
     How it works:
     1. User provides travel document text
     2. Prompt instructs LLM to analyze in structured format
-    3. LLM generates JSON response
-    4. Parser converts JSON to Pydantic model
+    3. LLM generates the analysis - as a native structured (schema) output
+       in "native" mode, or as JSON text following the parser's format
+       instructions in "parser" mode
+    4. The output is validated into TravelAnalysis, repairing almost-valid
+       JSON locally; unusable output is retried
     
     Args:
         language: Response language (en/fr)
+        llm: Optional pre-loaded LLM (defaults to load_google_llm())
+        output_mode: "native" or "parser" (defaults to settings)
         
     Returns:
         Runnable chain that outputs TravelAnalysis
     """
     # Load the LLM
-    llm = load_google_llm()
-    
-    # Create Pydantic parser - forces structured output
-    parser = PydanticOutputParser(pydantic_object=TravelAnalysis)
-    
-    # Get format instructions from parser
-    format_instructions = parser.get_format_instructions()
+    if llm is None:
+        llm = load_google_llm()
+    output_mode = output_mode or settings.analysis_output_mode
     
     # Create prompt based on language
     if language == "fr":
@@ -46,7 +67,9 @@ Document de Voyage:
 {travel_text}
 
 Contexte Additionnel:
-{context}
+{context}"""
+        
+        json_instructions = """
 
 {format_instructions}
 
@@ -62,7 +85,9 @@ Tài liệu du lịch:
 {travel_text}
 
 Bối cảnh bổ sung:
-{context}
+{context}"""
+        
+        json_instructions = """
 
 {format_instructions}
 
@@ -78,27 +103,105 @@ Travel Document:
 {travel_text}
 
 Additional Context:
-{context}
+{context}"""
+        
+        json_instructions = """
 
 {format_instructions}
 
 Respond ONLY with valid JSON."""
     
+    if output_mode == "parser":
+        # The schema travels in the prompt - the model answers with JSON text
+        user_template += json_instructions
+        format_instructions = PydanticOutputParser(
+            pydantic_object=TravelAnalysis
+        ).get_format_instructions()
+        model = llm
+    else:
+        # The schema travels as a native structured output - no prompt tokens
+        model = llm.with_structured_output(TravelAnalysis, include_raw=True)
+    
     # Create the chat prompt
     prompt = ChatPromptTemplate.from_messages([
         ("system", system_message),
         ("user", user_template)
     ])
     
-    # Partially fill in format instructions
-    prompt = prompt.partial(format_instructions=format_instructions)
+    if output_mode == "parser":
+        # Partially fill in format instructions
+        prompt = prompt.partial(format_instructions=format_instructions)
     
-    # Chain: prompt → llm → parser
-    chain = prompt | llm | parser
+    # Chain: prompt → llm → validation (with local repair), retried on bad output
+    chain = (prompt | model | RunnableLambda(_to_travel_analysis)).with_retry(
+        retry_if_exception_type=(OutputParserException,),
+        stop_after_attempt=settings.analysis_max_retries + 1,
+        wait_exponential_jitter=False
+    )
     
     return chain
 
 
+def _to_travel_analysis(output):
+    """
+    Turn the model output into a TravelAnalysis
+    
+    Accepts the include_raw dict from native structured output or a plain
+    message from parser mode. Almost-valid JSON is repaired locally before
+    giving up; giving up raises OutputParserException so the chain retries.
+    """
+    with observe_stage("output_parse"):
+        return _parse_travel_analysis(output)
+
+
+def _parse_travel_analysis(output):
+    """Parse, repair and validate one model output (see _to_travel_analysis)"""
+    parse_metrics.increment("attempts")
+    
+    if isinstance(output, dict):
+        if output.get("parsed") is not None:
+            parse_metrics.increment("native_parsed")
+            return output["parsed"]
+        message = output.get("raw")
+    else:
+        message = output
+    
+    # Candidate payloads: native tool-call arguments, then the text content
+    candidates = [call.get("args") for call in getattr(message, "tool_calls", None) or []]
+    content = getattr(message, "content", message)
+    if isinstance(content, str) and content.strip():
+        candidates.append(content)
+    
+    for candidate in candidates:
+        try:
+            repaired = False
+            if isinstance(candidate, str):
+                candidate, repaired = parse_json_object(candidate)
+            result = TravelAnalysis.model_validate(candidate)
+        except (ValueError, ValidationError):
+            continue
+        if repaired:
+            parse_metrics.increment("repaired")
+        return result
+    
+    parse_metrics.increment("parse_failures")
+    raise OutputParserException("Model output is not a valid TravelAnalysis")
+
+
+# Build analysis chains through the shared registry
+chain_registry.register("analysis", create_analysis_chain)
+
+
+def _analysis_cache_key(text: str, context: str, language: str):
+    """Response cache key for a document analysis"""
+    return response_cache.key(
+        "analysis",
+        normalize_text(text, casefold=False),
+        chain_registry.normalize_language(language),
+        context=normalize_text(context, casefold=False)
+    )
+
+
 def analyze_travel_document(text: str, context: str = "", language: str = "en"):
     """
     Analyze travel document text and return structured results
@@ -111,22 +214,158 @@ def analyze_travel_document(text: str, context: str = "", language: str = "en"):
     Returns:
         TravelAnalysis object with structured data
     """
-    # Create the chain
-    chain = create_analysis_chain(language)
+    # Return a cached analysis for the same document if we have one
+    cache_key = _analysis_cache_key(text, context, language)
+    cached = response_cache.get("analysis", cache_key)
+    if cached is not None:
+        return TravelAnalysis(**cached)
+    
+    return analysis_flight.do(cache_key, _run_analysis, text, context, language, cache_key)
+
+
+async def aanalyze_travel_document(text: str, context: str = "", language: str = "en"):
+    """
+    Async version of analyze_travel_document()
+    
+    Identical documents in flight share one analysis, and callers
+    waiting for it or for a Gemini slot hold no worker thread.
+    
+    Args:
+        text: Travel document text
+        context: Additional travel context
+        language: Response language
+        
+    Returns:
+        TravelAnalysis object with structured data
+    """
+    cache_key = _analysis_cache_key(text, context, language)
+    cached = await asyncio.to_thread(response_cache.get, "analysis", cache_key)
+    if cached is not None:
+        return TravelAnalysis(**cached)
+    
+    # A Gemini slot is waited for here, before the call takes a worker thread
+    return await analysis_flight.ado(
+        cache_key, gemini_upstream.run, _run_analysis, text, context, language, cache_key
+    )
+
+
+def _run_analysis(text: str, context: str, language: str, cache_key: str):
+    """Analyze a document that missed the cache"""
+    # Get the prebuilt chain
+    chain = chain_registry.get("analysis", language)
     
-    # Invoke the chain
+    def invoke():
+        with observe_chain("analysis", chain_registry.normalize_language(language)):
+            result = gemini_upstream.call(chain.invoke, {
+                "travel_text": text,
+                "context": context if context else "No additional context provided"
+            })
+        return result.model_dump()
+    
+    # Invoke the chain (other worker processes wait for it with the shared cache backend)
+    parse_metrics.increment("requests")
     try:
-        result = chain.invoke({
-            "travel_text": text,
-            "context": context if context else "No additional context provided"
-        })
-        return result
+        # Only successful analyses are cached, never the fallback below
+        return TravelAnalysis(**response_cache.get_or_compute("analysis", cache_key, invoke))
+    except UpstreamBusyError:
+        # Not an analysis failure - the caller should retry later
+        raise
     except Exception as e:
-        # Fallback if parsing fails
-        print(f"Analysis error: {e}")
-        return TravelAnalysis(
-            summary=f"Analysis completed but encountered formatting issues: {str(e)[:200]}",
-            key_findings=["Analysis was performed but results need manual review"],
-            recommendations=["Verify all travel details with official sources"],
-            next_steps=["Double-check booking confirmations", "Contact travel providers if necessary"]
+        return _fallback_analysis(e)
+
+
+def _fallback_analysis(error: Exception):
+    """Placeholder analysis returned when the chain fails (not cached)"""
+    if isinstance(error, OutputParserException):
+        parse_metrics.increment("fallbacks")
+    logger.warning("Analysis error: %s", error)
+    return TravelAnalysis(
+        summary=f"Analysis completed but encountered formatting issues: {str(error)[:200]}",
+        key_findings=["Analysis was performed but results need manual review"],
+        recommendations=["Verify all travel details with official sources"],
+        next_steps=["Double-check booking confirmations", "Contact travel providers if necessary"]
+    )
+
+
+def _route_by_language(inputs: dict):
+    """Pick the prebuilt analysis chain for an input's language"""
+    return chain_registry.get("analysis", inputs["language"])
+
+
+async def _ainvoke_by_language(inputs: dict):
+    """Run an input through its language's chain (limits, retries, circuit breaker)"""
+    with observe_chain("analysis", inputs["language"]):
+        return await gemini_upstream.acall(_route_by_language(inputs).ainvoke, inputs)
+
+
+def _cached_analyses(cache_keys: list[str]):
+    """Look up many analyses in the response cache (blocking)"""
+    return [response_cache.get("analysis", cache_key) for cache_key in cache_keys]
+
+
+async def analyze_travel_documents_batch(documents: list[dict], max_concurrency: int):
+    """
+    Analyze many travel documents concurrently
+    
+    Cached documents are answered directly and identical documents are
+    analyzed once. The rest go through the response cache like single
+    analyses (so other worker processes' leases are honoured), with at
+    most max_concurrency LLM calls at once across all languages. Failed
+    analyses become the same fallback as analyze_travel_document().
+    
+    Args:
+        documents: Dicts with text, context and language keys
+        max_concurrency: Maximum number of concurrent LLM calls
+        
+    Returns:
+        List of TravelAnalysis objects, or UpstreamBusyErrors for
+        documents the upstream had no capacity for, in input order
+    """
+    results = [None] * len(documents)
+    pending = {}  # cache_key -> (input indexes, chain inputs)
+    
+    keyed = []  # (cache_key, chain inputs) per document
+    for document in documents:
+        language = chain_registry.normalize_language(document.get("language", "en"))
+        context = document.get("context", "")
+        keyed.append((_analysis_cache_key(document["text"], context, language), {
+            "travel_text": document["text"],
+            "context": context if context else "No additional context provided",
+            "language": language
+        }))
+    # Cache I/O off the event loop (the disk and shared backends are SQLite)
+    cached_analyses = await asyncio.to_thread(_cached_analyses, [cache_key for cache_key, _ in keyed])
+    
+    for index, ((cache_key, inputs), cached) in enumerate(zip(keyed, cached_analyses)):
+        if cached is not None:
+            results[index] = TravelAnalysis(**cached)
+        elif cache_key in pending:
+            pending[cache_key][0].append(index)
+        else:
+            pending[cache_key] = ([index], inputs)
+    
+    limit = asyncio.Semaphore(max_concurrency)
+    
+    async def analyze(cache_key: str, inputs: dict):
+        async def invoke():
+            async with limit:
+                return (await _ainvoke_by_language(inputs)).model_dump()
+        
+        try:
+            return TravelAnalysis(**await response_cache.aget_or_compute("analysis", cache_key, invoke))
+        except UpstreamBusyError as e:
+            # Not an analysis failure - the client should retry this document later
+            return e
+        except Exception as e:
+            return _fallback_analysis(e)
+    
+    if pending:
+        parse_metrics.increment("requests", len(pending))
+        outputs = await asyncio.gather(
+            *(analyze(cache_key, inputs) for cache_key, (_, inputs) in pending.items())
         )
+        for (indexes, _), output in zip(pending.values(), outputs):
+            for index in indexes:
+                results[index] = output
+    
+    return results
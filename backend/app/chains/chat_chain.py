@@ -3,12 +3,25 @@ LangChain chains for chat functionality
 Simple, beginner-friendly implementation
 """
 
+import asyncio
+import logging
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from app.config import load_google_llm
+from app.config import load_google_llm, settings
+from app.chains.registry import chain_registry
+from app.services.response_cache import response_cache, normalize_text
+from app.services.semantic_cache import semantic_cache
+from app.services.singleflight import SingleFlight
+from app.services.resilience import gemini_upstream
+from app.services.metrics import observe_chain
 
+logger = logging.getLogger(__name__)
 
-def create_chat_chain(language: str = "en"):
+# Identical questions asked at the same time share one LLM call
+chat_flight = SingleFlight("chat")
+
+
+def create_chat_chain(language: str = "en", llm=None):
     """
     Create a simple chat chain for travel Q&A
     
@@ -20,12 +33,14 @@ def create_chat_chain(language: str = "en"):
     
     Args:
         language: Response language (en/fr)
+        llm: Optional pre-loaded LLM (defaults to load_google_llm())
         
     Returns:
         Runnable chain
     """
     # Load the LLM
-    llm = load_google_llm()
+    if llm is None:
+        llm = load_google_llm()
     
     # Create prompt template based on language
     if language == "fr":
@@ -75,28 +90,185 @@ IMPORTANT: You are not a booking agent. Always advise users to verify details li
     return chain
 
 
-def get_chat_response(message: str, language: str = "en"):
+# Build chat chains through the shared registry
+chain_registry.register("chat", create_chat_chain)
+
+
+def _semantic_lookup(message: str, language: str):
+    """
+    Look up an answer to a similar question
+    
+    Returns:
+        Tuple (answer or None, question vector or None)
+    """
+    if not settings.semantic_cache_enabled:
+        return None, None
+    try:
+        return semantic_cache.lookup(message, chain_registry.normalize_language(language))
+    except Exception as e:
+        # The cache must never break chat - e.g. the embedding API is down
+        logger.warning("Semantic cache error: %s", e)
+        return None, None
+
+
+def _semantic_store(message: str, language: str, response: str, vector):
+    """Remember an answer for future similar questions"""
+    if vector is None:
+        return
+    try:
+        semantic_cache.store(message, chain_registry.normalize_language(language), response, vector)
+    except Exception as e:
+        logger.warning("Semantic cache error: %s", e)
+
+
+def get_chat_response(message: str, language: str = "en", semantic: bool = False):
     """
     Get a chat response from the AI
     
     Args:
         message: User's question
         language: Response language
+        semantic: Also reuse answers to similar (paraphrased) questions.
+            Meant for user questions, not generated prompts.
+        
+    Returns:
+        AI response string
+    """
+    # Return a cached answer for the same question if we have one
+    cache_key = response_cache.key(
+        "chat", normalize_text(message), chain_registry.normalize_language(language)
+    )
+    cached = response_cache.get("chat", cache_key)
+    if cached is not None:
+        return cached
+    
+    return chat_flight.do(
+        (cache_key, semantic), _generate_chat_response, message, language, cache_key, semantic
+    )
+
+
+async def aget_chat_response(message: str, language: str = "en", semantic: bool = False):
+    """
+    Async version of get_chat_response()
+    
+    Identical questions in flight share one answer, and callers waiting
+    for it or for a Gemini slot hold no worker thread.
+    
+    Args:
+        message: User's question
+        language: Response language
+        semantic: Also reuse answers to similar (paraphrased) questions
         
     Returns:
         AI response string
     """
-    # Create the chain
-    chain = create_chat_chain(language)
+    cache_key = response_cache.key(
+        "chat", normalize_text(message), chain_registry.normalize_language(language)
+    )
+    cached = await asyncio.to_thread(response_cache.get, "chat", cache_key)
+    if cached is not None:
+        return cached
     
-    # Invoke the chain with user's message
-    response = chain.invoke({
-        "user_question": message
-    })
+    # An answer to a paraphrase of it (an embedding call, no Gemini slot needed)
+    vector = None
+    if semantic:
+        cached, vector = await asyncio.to_thread(_semantic_lookup, message, language)
+        if cached is not None:
+            return cached
     
+    return await chat_flight.ado(
+        (cache_key, semantic), _agenerate_chat_response, message, language, cache_key, vector
+    )
+
+
+def _generate_chat_response(message: str, language: str, cache_key: str, semantic: bool):
+    """Answer a question that missed the exact-match cache"""
+    # An answer to a paraphrase of it
+    vector = None
+    if semantic:
+        cached, vector = _semantic_lookup(message, language)
+        if cached is not None:
+            return cached
+    
+    # Get the prebuilt chain
+    chain = chain_registry.get("chat", language)
+    
+    def invoke():
+        # Invoke the chain with user's message (limits, retries, circuit breaker)
+        with observe_chain("chat", chain_registry.normalize_language(language)):
+            return gemini_upstream.call(chain.invoke, {
+                "user_question": message
+            })
+    
+    # Stored in the response cache (other worker processes wait for it with the shared backend)
+    response = response_cache.get_or_compute("chat", cache_key, invoke)
+    _semantic_store(message, language, response, vector)
     return response
 
 
+async def _agenerate_chat_response(message: str, language: str, cache_key: str, vector):
+    """
+    Async version of _generate_chat_response(), after the semantic lookup
+    
+    Only the chain call holds a Gemini slot (and a worker thread);
+    waiting for another worker process's answer happens on the event loop.
+    """
+    chain = chain_registry.get("chat", language)
+    
+    async def invoke():
+        with observe_chain("chat", chain_registry.normalize_language(language)):
+            return await gemini_upstream.run(gemini_upstream.call, chain.invoke, {
+                "user_question": message
+            })
+    
+    response = await response_cache.aget_or_compute("chat", cache_key, invoke)
+    await asyncio.to_thread(_semantic_store, message, language, response, vector)
+    return response
+
+
+async def stream_chat_response(message: str, language: str = "en", semantic: bool = False):
+    """
+    Stream a chat response from the AI token by token
+    
+    Args:
+        message: User's question
+        language: Response language
+        semantic: Also reuse answers to similar (paraphrased) questions
+        
+    Yields:
+        Response text chunks as the model produces them
+    """
+    cache_key = response_cache.key(
+        "chat", normalize_text(message), chain_registry.normalize_language(language)
+    )
+    # Cache I/O off the event loop (the disk and shared backends are SQLite)
+    cached = await asyncio.to_thread(response_cache.get, "chat", cache_key)
+    if cached is not None:
+        yield cached
+        return
+    
+    vector = None
+    if semantic:
+        cached, vector = await asyncio.to_thread(_semantic_lookup, message, language)
+        if cached is not None:
+            yield cached
+            return
+    
+    chain = chain_registry.get("chat", language)
+    
+    chunks = []
+    with observe_chain("chat_stream", chain_registry.normalize_language(language)):
+        async with gemini_upstream.aslot():
+            async for chunk in chain.astream({"user_question": message}):
+                chunks.append(chunk)
+                yield chunk
+    
+    # Only complete answers are cached
+    response = "".join(chunks)
+    await asyncio.to_thread(response_cache.set, "chat", cache_key, response)
+    await asyncio.to_thread(_semantic_store, message, language, response, vector)
+
+
 # Example usage (for testing):
 # if __name__ == "__main__":
 #     response = get_chat_response("What are the best places to visit in Paris?", "en")
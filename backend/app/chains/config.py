@@ -1,10 +1,9 @@
-import requests
+import logging
 
 from langchain_core.documents import Document
 import os
 # pretty print
 from pprint import pprint
-from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
 
 def environtmental_variables():
     # os already imported at top
@@ -13,7 +12,7 @@ def environtmental_variables():
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-    print("My Api keys loading...")
+    logging.getLogger(__name__).debug("Loading API keys")
     # print(GOOGLE_API_KEY, OPENAI_API_KEY, GROQ_API_KEY)
 
 # load google llm
@@ -104,6 +103,7 @@ class WeatherAPILoader:
         
         # make a request and store it to ou response 
         # json==dictionary in python
+        import requests
         response=requests.get(url).json()
         return response
 
@@ -119,13 +119,16 @@ def weatherContext(city):
     
 # print(f"fetched data: {fechedData}")
 
-def load_embeddings():
+def load_embeddings(run_sample=False):
+    from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
     environtmental_variables()
     embeddings = GoogleGenerativeAIEmbeddings(
             model="models/text-embedding-004",
             google_api_key=os.getenv("GOOGLE_API_KEY")
         )
     # print("embeddings", embeddings)
+    if not run_sample:
+        return embeddings
         # Test with some sample text
         # Embeddings work by converting text into numerical vectors that capture meaning
     sample_texts = [
@@ -0,0 +1,178 @@
+"""
+Token-budgeted context assembly for research synthesis
+Splits scraped pages into chunks and packs the most relevant ones
+"""
+
+import math
+import re
+from collections import Counter
+
+# Rough size of a token for Gemini-style tokenizers
+CHARS_PER_TOKEN = 4
+
+# Markdown noise that costs tokens but carries no content
+MARKDOWN_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+BARE_URL = re.compile(r"https?://\S+")
+
+WORD = re.compile(r"\w+", re.UNICODE)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+
+def estimate_tokens(text: str):
+    """Estimate the number of tokens in a text"""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def clean_markdown(text: str):
+    """Drop images, link targets and bare URLs from scraped markdown"""
+    text = MARKDOWN_IMAGE.sub("", text)
+    text = MARKDOWN_LINK.sub(r"\1", text)
+    text = BARE_URL.sub("", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def split_into_chunks(text: str, chunk_tokens: int):
+    """
+    Split text into chunks of roughly chunk_tokens tokens
+
+    Paragraphs are kept together where possible; long paragraphs are
+    split on sentence boundaries, and long sentences are cut hard.
+
+    Args:
+        text: Text to split
+        chunk_tokens: Target chunk size in tokens
+
+    Returns:
+        List of chunk strings
+    """
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    pieces = []  # (separator before the piece, text)
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(("\n\n", paragraph))
+            continue
+        separator = "\n\n"
+        for sentence in SENTENCE_END.split(paragraph):
+            while len(sentence) > max_chars:
+                pieces.append((separator, sentence[:max_chars]))
+                sentence = sentence[max_chars:]
+                separator = " "
+            if sentence:
+                pieces.append((separator, sentence))
+                separator = " "
+
+    chunks = []
+    current = ""
+    for separator, piece in pieces:
+        if current and len(current) + len(piece) + len(separator) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}{separator}{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _terms(text: str):
+    return WORD.findall(text.casefold())
+
+
+def rank_chunks(query: str, chunks: list[str]):
+    """
+    Score chunks against the query with BM25
+
+    Args:
+        query: User's research query
+        chunks: Chunk texts
+
+    Returns:
+        List of scores, one per chunk
+    """
+    query_terms = set(_terms(query))
+    chunk_terms = [Counter(_terms(chunk)) for chunk in chunks]
+    if not chunks or not query_terms:
+        return [0.0] * len(chunks)
+
+    average_length = sum(sum(terms.values()) for terms in chunk_terms) / len(chunks) or 1
+    document_frequency = Counter(term for terms in chunk_terms for term in query_terms & terms.keys())
+
+    scores = []
+    for terms in chunk_terms:
+        length = sum(terms.values())
+        score = 0.0
+        for term in query_terms:
+            frequency = terms.get(term, 0)
+            if not frequency:
+                continue
+            idf = math.log(1 + (len(chunks) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average_length))
+        scores.append(score)
+    return scores
+
+
+def assemble_context(query: str, sources: list[tuple[str, str]], token_budget: int, chunk_tokens: int):
+    """
+    Build the synthesis context from scraped pages within a token budget
+
+    How it works:
+    1. Clean each page and split it into chunks
+    2. Rank all chunks by relevance to the query
+    3. Take the best chunk of every source first (so no source is lost),
+       then the remaining chunks by score, while they fit the budget
+    4. Emit the kept chunks grouped by source, in original page order
+
+    Args:
+        query: User's research query
+        sources: (title, markdown) for each scraped page, in result order
+        token_budget: Maximum estimated tokens of the returned context
+        chunk_tokens: Target chunk size in tokens
+
+    Returns:
+        Context text with a "Source: <title>" header per page
+    """
+    chunks = []  # (source index, position in source, text)
+    for source_index, (_, text) in enumerate(sources):
+        for position, chunk in enumerate(split_into_chunks(clean_markdown(text), chunk_tokens)):
+            chunks.append((source_index, position, chunk))
+
+    scores = rank_chunks(query, [chunk for _, _, chunk in chunks])
+    order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+
+    best_per_source = {}
+    for i in order:
+        best_per_source.setdefault(chunks[i][0], i)
+    first_pass = sorted(best_per_source.values(), key=lambda i: scores[i], reverse=True)
+
+    kept = set()
+    sources_used = set()
+    used = 0
+    header_tokens = {index: estimate_tokens(f"Source: {title}\n") for index, (title, _) in enumerate(sources)}
+    for i in first_pass + order:
+        if i in kept:
+            continue
+        source_index, _, text = chunks[i]
+        cost = estimate_tokens(text)
+        if source_index not in sources_used:
+            cost += header_tokens[source_index]
+        if used + cost > token_budget:
+            continue
+        kept.add(i)
+        sources_used.add(source_index)
+        used += cost
+
+    sections = []
+    for source_index, (title, _) in enumerate(sources):
+        selected = sorted((chunks[i][1], chunks[i][2]) for i in kept if chunks[i][0] == source_index)
+        if selected:
+            body = "\n\n".join(text for _, text in selected)
+            sections.append(f"Source: {title}\n{body}")
+    return "\n\n".join(sections)
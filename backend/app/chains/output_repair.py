@@ -0,0 +1,131 @@
+"""
+Local repair of almost-valid JSON returned by the LLM
+Cheap fixes are tried before paying for another model call
+"""
+
+import json
+import re
+import threading
+
+# Markdown code fences around a JSON answer: ```json ... ```
+CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+# Trailing commas before a closing bracket: [1, 2,] / {"a": 1,}
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def _close_brackets(text: str):
+    """Close strings and brackets left open by a truncated answer"""
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    if in_string:
+        text += '"'
+    text = TRAILING_COMMA.sub(r"\1", text.rstrip().rstrip(","))
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str):
+    """
+    Apply cheap fixes to a JSON answer
+
+    How it works:
+    1. Strip markdown code fences and text around the outermost object
+    2. Drop trailing commas
+    3. Close strings and brackets left open by truncation
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        Repaired JSON text (may still be invalid)
+    """
+    text = CODE_FENCE.sub("", text.strip())
+
+    start = text.find("{")
+    if start == -1:
+        return text
+    end = text.rfind("}")
+    text = text[start:end + 1] if end > start else text[start:]
+
+    try:
+        json.loads(text)
+        return text
+    except json.JSONDecodeError:
+        pass
+
+    text = TRAILING_COMMA.sub(r"\1", text)
+    return _close_brackets(text)
+
+
+def parse_json_object(text: str):
+    """
+    Parse a JSON object, repairing it locally if needed
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        Tuple (parsed dict, whether a repair was needed)
+
+    Raises:
+        ValueError: If the text cannot be parsed even after repair
+    """
+    try:
+        value = json.loads(text)
+        repaired = False
+    except json.JSONDecodeError:
+        try:
+            value = json.loads(repair_json(text))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Unrepairable JSON output: {e}") from e
+        repaired = True
+    if not isinstance(value, dict):
+        raise ValueError("Expected a JSON object")
+    return value, repaired
+
+
+class ParseMetrics:
+    """Thread-safe counters for structured output parsing"""
+
+    def __init__(self):
+        self.requests = 0          # analyses requested from the LLM
+        self.attempts = 0          # LLM calls, including retries
+        self.native_parsed = 0     # parsed by the model's structured output
+        self.repaired = 0          # needed a local JSON repair
+        self.parse_failures = 0    # attempts whose output could not be used
+        self.fallbacks = 0         # requests that gave up after all retries
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self):
+        requests = self.requests or 1
+        attempts = self.attempts or 1
+        return {
+            "requests": self.requests,
+            "attempts": self.attempts,
+            "native_parsed": self.native_parsed,
+            "repaired": self.repaired,
+            "parse_failures": self.parse_failures,
+            "fallbacks": self.fallbacks,
+            "parse_failure_rate": round(self.parse_failures / attempts, 4),
+            "retry_rate": round(max(self.attempts - self.requests, 0) / requests, 4),
+        }
@@ -0,0 +1,108 @@
+"""
+Chain registry for prebuilt LangChain chains
+Builds each chain once and hands out the same runnable on every request
+"""
+
+import threading
+from app.config import settings, load_google_llm
+from app.services.metrics import TokenUsageHandler
+
+# Languages with dedicated prompts - anything else falls back to English
+SUPPORTED_LANGUAGES = ("en", "fr", "vi")
+
+
+class ChainRegistry:
+    """
+    Cache of compiled chains keyed by (chain type, language, model config)
+
+    How it works:
+    1. Chain modules register a builder function, e.g. create_chat_chain
+    2. The first get() for a key builds the chain (prompt, parser, LCEL pipe)
+    3. Every later get() for the same key returns the same runnable
+
+    Each built chain carries a token-usage callback for its chain type
+    and language, so token metrics need no per-request setup.
+
+    LCEL runnables are stateless, so one instance can safely serve
+    concurrent requests.
+    """
+
+    def __init__(self, llm_factory=load_google_llm):
+        """
+        Initialize an empty registry
+
+        Args:
+            llm_factory: Callable returning the LLM used to build chains
+        """
+        self.llm_factory = llm_factory
+        self._builders = {}
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def register(self, chain_type: str, builder):
+        """
+        Register a builder for a chain type
+
+        Args:
+            chain_type: Name of the chain (e.g. "chat", "analysis")
+            builder: Callable(language, llm=...) returning a runnable
+        """
+        self._builders[chain_type] = builder
+
+    @staticmethod
+    def model_config():
+        """Model settings that change the built chain"""
+        return (
+            settings.gemini_model, settings.temperature, settings.max_tokens,
+            settings.analysis_output_mode, settings.analysis_max_retries
+        )
+
+    @staticmethod
+    def normalize_language(language: str):
+        """Map unsupported languages to the English prompt"""
+        return language if language in SUPPORTED_LANGUAGES else "en"
+
+    def get(self, chain_type: str, language: str = "en"):
+        """
+        Get the prebuilt chain, building it on first use
+
+        Args:
+            chain_type: Registered chain type
+            language: Response language
+
+        Returns:
+            Runnable chain
+        """
+        language = self.normalize_language(language)
+        key = (chain_type, language, self.model_config())
+
+        chain = self._chains.get(key)
+        if chain is not None:
+            return chain
+
+        with self._lock:
+            # Another thread may have built it while we waited
+            chain = self._chains.get(key)
+            if chain is None:
+                if chain_type not in self._builders:
+                    raise KeyError(f"Unknown chain type: {chain_type}")
+                chain = self._builders[chain_type](language, llm=self.llm_factory()).with_config(
+                    callbacks=[TokenUsageHandler(chain_type, language)]
+                )
+                self._chains[key] = chain
+        return chain
+
+    def warm_up(self):
+        """Build every registered chain for every supported language"""
+        for chain_type in list(self._builders):
+            for language in SUPPORTED_LANGUAGES:
+                self.get(chain_type, language)
+
+    def clear(self):
+        """Drop all built chains (e.g. after changing the LLM factory)"""
+        with self._lock:
+            self._chains.clear()
+
+
+# Global registry instance
+chain_registry = ChainRegistry()
@@ -4,9 +4,9 @@ Loads environment variables and LangChain models
 """
 
 import os
+import logging
 from functools import lru_cache
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 # Load variables from .env file into environment
 load_dotenv()
@@ -25,13 +25,115 @@ class Settings:
     port: int = int(os.getenv("PORT", 8000))
     cors_origins: str = os.getenv("CORS_ORIGINS", "http://localhost:3000")
 
+    # Logging settings
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+
+    # Background job settings
+    job_workers: int = int(os.getenv("JOB_WORKERS", 4))  # jobs run at the same time
+    job_max_queued: int = int(os.getenv("JOB_MAX_QUEUED", 1000))
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", 3))  # tries while upstreams are busy
+    job_retention: float = float(os.getenv("JOB_RETENTION", 24 * 3600))  # seconds finished jobs are kept
+    job_max_wait: float = float(os.getenv("JOB_MAX_WAIT", 30.0))  # longest long-poll, seconds
+    job_lease: float = float(os.getenv("JOB_LEASE", 60.0))  # seconds a dead worker's job stays claimed
+
+    # Startup settings
+    warm_up_blocking: bool = os.getenv("WARM_UP_BLOCKING", "false").lower() in ("1", "true", "yes")  # wait before serving
+
     # AI Model settings
     gemini_model: str = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
     temperature: float = float(os.getenv("TEMPERATURE", 0.7))
     max_tokens: int = int(os.getenv("MAX_TOKENS", 2048))
+    analysis_output_mode: str = os.getenv("ANALYSIS_OUTPUT_MODE", "native")  # native/parser
+    analysis_max_retries: int = int(os.getenv("ANALYSIS_MAX_RETRIES", 1))
 
     # File upload settings
     max_file_size: int = int(os.getenv("MAX_FILE_SIZE", 10 * 1024 * 1024))  # 10MB
+    max_upload_pages: int = int(os.getenv("MAX_UPLOAD_PAGES", 20))
+    upload_chunk_size: int = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))  # 1MB
+    upload_memory_budget: int = int(os.getenv("UPLOAD_MEMORY_BUDGET", 256 * 1024 * 1024))  # in-flight image bytes
+
+    # Image preprocessing settings (before Gemini vision calls)
+    image_max_dimension: int = int(os.getenv("IMAGE_MAX_DIMENSION", 2048))  # longest side, px
+    image_grayscale: bool = os.getenv("IMAGE_GRAYSCALE", "false").lower() in ("1", "true", "yes")
+    image_jpeg_quality: int = int(os.getenv("IMAGE_JPEG_QUALITY", 85))
+
+    # Batch analysis settings
+    batch_max_concurrency: int = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+
+    # Research pipeline settings
+    research_scrape_pages: int = int(os.getenv("RESEARCH_SCRAPE_PAGES", 3))
+    scrape_timeout: float = float(os.getenv("SCRAPE_TIMEOUT", 20.0))  # seconds per URL
+    research_context_tokens: int = int(os.getenv("RESEARCH_CONTEXT_TOKENS", 6000))  # synthesis budget
+    research_chunk_tokens: int = int(os.getenv("RESEARCH_CHUNK_TOKENS", 300))
+    research_index_enabled: bool = os.getenv("RESEARCH_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+    research_index_top_k: int = int(os.getenv("RESEARCH_INDEX_TOP_K", 12))
+    research_index_min_hits: int = int(os.getenv("RESEARCH_INDEX_MIN_HITS", 4))  # chunks needed to skip scraping
+    research_index_min_score: float = float(os.getenv("RESEARCH_INDEX_MIN_SCORE", 0.75))  # cosine similarity
+    research_index_max_age: float = float(os.getenv("RESEARCH_INDEX_MAX_AGE", 7 * 24 * 3600))  # seconds
+    research_index_max_rows: int = int(os.getenv("RESEARCH_INDEX_MAX_ROWS", 200000))  # chunks; oldest pages go first
+
+    # Embedding settings
+    embedding_backend: str = os.getenv("EMBEDDING_BACKEND", "google")  # google/hashing
+    embedding_dimension: int = int(os.getenv("EMBEDDING_DIMENSION", 256))  # hashing backend only
+
+    # Cache settings
+    cache_dir: str = os.getenv("CACHE_DIR", ".cache")
+    response_cache_backend: str = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # memory/disk/shared
+    shared_cache_lease_timeout: float = float(os.getenv("SHARED_CACHE_LEASE_TIMEOUT", 120.0))  # seconds per compute
+    response_cache_max_entries: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 2048))
+    chat_cache_ttl: float = float(os.getenv("CHAT_CACHE_TTL", 6 * 3600))  # seconds
+    analysis_cache_ttl: float = float(os.getenv("ANALYSIS_CACHE_TTL", 24 * 3600))  # seconds
+    semantic_cache_enabled: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    semantic_cache_threshold: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))  # cosine similarity
+    semantic_cache_max_entries: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 2000))  # per language
+    semantic_cache_persist: bool = os.getenv("SEMANTIC_CACHE_PERSIST", "true").lower() in ("1", "true", "yes")
+    tavily_cache_backend: str = os.getenv("TAVILY_CACHE_BACKEND", "memory")  # memory/disk/shared
+    tavily_cache_ttl: float = float(os.getenv("TAVILY_CACHE_TTL", 3600))  # seconds
+    tavily_cache_max_entries: int = int(os.getenv("TAVILY_CACHE_MAX_ENTRIES", 512))
+    page_cache_backend: str = os.getenv("PAGE_CACHE_BACKEND", "shared")  # disk/shared (memory is not kept)
+    page_cache_max_entries: int = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", 5000))
+    page_cache_fresh_ttl: float = float(os.getenv("PAGE_CACHE_FRESH_TTL", 24 * 3600))  # served offline
+    page_cache_stale_ttl: float = float(os.getenv("PAGE_CACHE_STALE_TTL", 7 * 24 * 3600))  # fallback on errors
+    page_cache_negative_ttl: float = float(os.getenv("PAGE_CACHE_NEGATIVE_TTL", 300))  # failed URLs
+
+    # OCR cache settings (extracted text keyed by image content)
+    ocr_cache_max_entries: int = int(os.getenv("OCR_CACHE_MAX_ENTRIES", 256))
+    ocr_cache_ttl: float = float(os.getenv("OCR_CACHE_TTL", 7 * 24 * 3600))  # seconds
+    ocr_cache_persist: bool = os.getenv("OCR_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+    ocr_cache_backend: str = os.getenv("OCR_CACHE_BACKEND", "disk" if ocr_cache_persist else "memory")  # 2nd tier
+
+    # Request profiler settings (off unless one of the first two is set)
+    profile_sample_rate: float = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))  # fraction of requests
+    profile_header_enabled: bool = os.getenv("PROFILE_HEADER_ENABLED", "false").lower() in ("1", "true", "yes")
+    profile_interval: float = float(os.getenv("PROFILE_INTERVAL", 0.005))  # seconds between samples
+    profile_dir: str = os.getenv("PROFILE_DIR", os.path.join(cache_dir, "profiles"))
+
+    # Upstream governor settings (rate 0 = no requests-per-second limit)
+    gemini_rate_limit: float = float(os.getenv("GEMINI_RATE_LIMIT", 10))  # requests per second
+    gemini_burst: int = int(os.getenv("GEMINI_BURST", 10))
+    gemini_max_concurrency: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", 16))
+    gemini_max_queue: int = int(os.getenv("GEMINI_MAX_QUEUE", 64))
+    tavily_rate_limit: float = float(os.getenv("TAVILY_RATE_LIMIT", 5))
+    tavily_burst: int = int(os.getenv("TAVILY_BURST", 5))
+    tavily_max_concurrency: int = int(os.getenv("TAVILY_MAX_CONCURRENCY", 4))
+    tavily_max_queue: int = int(os.getenv("TAVILY_MAX_QUEUE", 32))
+    firecrawl_rate_limit: float = float(os.getenv("FIRECRAWL_RATE_LIMIT", 5))
+    firecrawl_burst: int = int(os.getenv("FIRECRAWL_BURST", 5))
+    firecrawl_max_concurrency: int = int(os.getenv("FIRECRAWL_MAX_CONCURRENCY", 6))
+    firecrawl_max_queue: int = int(os.getenv("FIRECRAWL_MAX_QUEUE", 32))
+    upstream_max_wait: float = float(os.getenv("UPSTREAM_MAX_WAIT", 10.0))  # seconds queued before giving up
+
+    # Upstream resilience settings
+    gemini_timeout: float = float(os.getenv("GEMINI_TIMEOUT", 60.0))  # seconds per request
+    tavily_timeout: float = float(os.getenv("TAVILY_TIMEOUT", 30.0))  # seconds per request
+    upstream_retry_attempts: int = int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", 3))  # total, 1 = no retries
+    upstream_retry_base_delay: float = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", 0.5))  # seconds
+    upstream_retry_max_delay: float = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", 8.0))  # seconds
+    circuit_failure_threshold: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))  # consecutive failures
+    circuit_reset_timeout: float = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30.0))  # seconds open
+    scrape_hedge_enabled: bool = os.getenv("SCRAPE_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+    scrape_hedge_percentile: float = float(os.getenv("SCRAPE_HEDGE_PERCENTILE", 95))  # of recent latencies
+    scrape_hedge_min_delay: float = float(os.getenv("SCRAPE_HEDGE_MIN_DELAY", 2.0))  # seconds
 
     @property
     def cors_origins_list(self):
@@ -41,7 +143,14 @@ class Settings:
 
 # Global settings instance
 settings = Settings()
-print(f"google  api key is: {settings.google_api_key} and port is {settings.port}")
+logging.basicConfig(
+    level=settings.log_level.upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logging.getLogger(__name__).info(
+    "Settings loaded (port %s, Google API key %s)",
+    settings.port, "set" if settings.google_api_key else "missing"
+)
 
 
 @lru_cache()
@@ -50,12 +159,17 @@ def load_google_llm():
     Load Google Gemini LLM with LangChain
     Cached to avoid recreating on every request
     """
+    # Imported on first use: the Google SDK is slow to import
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
     return ChatGoogleGenerativeAI(
         model=settings.gemini_model,
         google_api_key=settings.google_api_key,
         temperature=settings.temperature,
         max_output_tokens=settings.max_tokens,
         convert_system_message_to_human=True,  # Gemini compatibility
+        timeout=settings.gemini_timeout,
+        max_retries=1,  # retried by app.services.resilience
     )
 
 
@@ -64,10 +178,14 @@ def load_google_vision_llm():
     """
     Load Google Gemini with vision capabilities
     """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
     return ChatGoogleGenerativeAI(
         model=settings.gemini_model,
         google_api_key=settings.google_api_key,
         temperature=0.5,  # Lower temp for consistent extraction
         max_output_tokens=settings.max_tokens,
         convert_system_message_to_human=True,
+        timeout=settings.gemini_timeout,
+        max_retries=1,
     )
@@ -3,10 +3,59 @@ Travel AI - FastAPI Main Application
 Entry point for the backend server with LangChain integration
 """
 
-from fastapi import FastAPI
+import asyncio
+import importlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from app.config import settings
-from app.routes import health, analysis, research
+from app.routes import health, analysis, research, jobs
+from app.chains.registry import chain_registry
+from app.services.tavily_service import tavily_service
+from app.services.firecrawl_service import firecrawl_service
+from app.services.gemini_service import gemini_service
+from app.services.semantic_cache import semantic_cache
+from app.services.vector_index import research_index
+from app.services.warmup import warm_up
+from app.services.jobs import job_queue
+from app.services.governor import UpstreamBusyError
+from app.services.metrics import MetricsMiddleware, render_metrics
+from app.utils.timing import ServerTimingMiddleware
+
+
+def _register_warm_up_steps():
+    """Everything the first requests would otherwise load on demand"""
+    warm_up.register("chains", chain_registry.warm_up)
+    warm_up.register("vision_llm", lambda: gemini_service.vision_llm)
+    warm_up.register("tavily_client", lambda: tavily_service.client)
+    warm_up.register("firecrawl_client", lambda: firecrawl_service.client)
+    warm_up.register("image_preprocessing", lambda: importlib.import_module("app.services.image_preprocessing"))
+    if settings.semantic_cache_enabled:
+        warm_up.register("semantic_cache", lambda: semantic_cache.embedder)
+    if settings.research_index_enabled:
+        warm_up.register("research_index", research_index.warm_up)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm up models, clients and indexes concurrently
+
+    By default the server starts accepting requests straight away and
+    /api/ready answers 503 until warm-up finishes; with WARM_UP_BLOCKING
+    startup waits for it instead.
+    """
+    _register_warm_up_steps()
+    task = asyncio.create_task(warm_up.run())
+    if settings.warm_up_blocking:
+        await task
+    # Background job workers (unfinished jobs from a previous run are resumed)
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    task.cancel()
+
 
 # Create FastAPI app
 app = FastAPI(
@@ -14,7 +63,8 @@ app = FastAPI(
     description="Travel AI Assistant API ✈️ - Powered by LangChain",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -26,10 +76,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(UpstreamBusyError)
+async def upstream_busy_handler(request: Request, exc: UpstreamBusyError):
+    """Tell clients to back off instead of returning a 500"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "upstream": exc.upstream},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+# Per-request stage timings (Server-Timing header) and opt-in profiling
+app.add_middleware(ServerTimingMiddleware)
+
+# Record request latency per route (outermost, so it sees every response)
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(health.router)
 app.include_router(analysis.router)
 app.include_router(research.router)
+app.include_router(jobs.router)
 
 
 @app.get("/")
@@ -44,6 +112,13 @@ async def root():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -52,10 +52,33 @@ class AnalysisResponse(BaseModel):
     timestamp: datetime
 
 
+class BatchAnalysisRequest(BaseModel):
+    """Batch travel document analysis request"""
+    items: list[AnalysisRequest] = Field(..., min_length=1, max_length=500, description="Documents to analyze")
+    max_concurrency: int | None = Field(default=None, ge=1, description="Concurrent LLM calls (capped by server setting)")
+
+
+class BatchAnalysisItem(BaseModel):
+    """Result for one document of a batch, in input order"""
+    index: int
+    analysis: AnalysisResponse | None = None
+    error: str | None = None
+    retry_after: int | None = Field(default=None, description="Seconds to wait before retrying, when the upstream was busy")
+
+
+class BatchAnalysisResponse(BaseModel):
+    """Batch analysis response model"""
+    results: list[BatchAnalysisItem]
+    succeeded: int
+    failed: int
+    timestamp: datetime
+
+
 class ImageAnalysisResponse(BaseModel):
     """Image analysis response"""
     extracted_text: str
     analysis: AnalysisResponse
+    page_count: int = 1
 
 
 class ResearchRequest(BaseModel):
@@ -81,3 +104,16 @@ class ResearchResponse(BaseModel):
     image_urls: list[str]  # All image URLs
     sources: list[ResearchResult]  # Keep original sources for reference
     timestamp: datetime
+
+
+class JobResponse(BaseModel):
+    """Background job status (with the result once done)"""
+    job_id: str
+    kind: str
+    state: str  # queued/running/done/failed
+    attempts: int
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    result: dict | None = None  # the endpoint's usual response body
+    error: str | None = None
@@ -3,17 +3,30 @@ Travel document analysis endpoints using LangChain
 """
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse
 from app.models.schemas import (
     ChatRequest, ChatResponse,
     AnalysisRequest, AnalysisResponse,
+    BatchAnalysisRequest, BatchAnalysisResponse, BatchAnalysisItem,
     ImageAnalysisResponse
 )
-from app.chains.chat_chain import get_chat_response
-from app.chains.analysis_chain import analyze_travel_document
+from app.config import settings
+from app.chains.chat_chain import aget_chat_response, stream_chat_response
+from app.chains.analysis_chain import aanalyze_travel_document, analyze_travel_documents_batch
 from app.services.gemini_service import gemini_service
+from app.services.governor import UpstreamBusyError
+from app.utils.sse import sse_event, SSE_HEADERS
+from app.utils.uploads import upload_budget, image_reservation, read_upload
+from app.utils.timing import TimedRoute, current_timings
 from datetime import datetime
 
-router = APIRouter(prefix="/api", tags=["Analysis"])
+router = APIRouter(prefix="/api", tags=["Analysis"], route_class=TimedRoute)
+
+# Attached to every analysis response
+DISCLAIMER = (
+    "⚠️ This analysis is for informational purposes only. "
+    "Always verify travel details with official sources."
+)
 
 
 @router.post("/chat", response_model=ChatResponse)
@@ -29,10 +42,11 @@ async def chat_with_ai(request: ChatRequest):
         AI response
     """
     try:
-        # Use LangChain chat chain
-        response_text = get_chat_response(
+        # Use LangChain chat chain (identical questions in flight share one answer)
+        response_text = await aget_chat_response(
             message=request.message,
-            language=request.language
+            language=request.language,
+            semantic=True
         )
         
         return ChatResponse(
@@ -41,10 +55,60 @@ async def chat_with_ai(request: ChatRequest):
             timestamp=datetime.now()
         )
         
+    except UpstreamBusyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
 
+@router.post("/chat/stream")
+async def chat_with_ai_stream(request: ChatRequest):
+    """
+    Chat with AI and stream the answer as Server-Sent Events
+    
+    Events:
+        token: {"text": ...} for each chunk as soon as the model emits it
+        timing: Server-Timing stages of the whole stream, as a list
+        done: the same payload as ChatResponse
+        error: {"detail": ...} if the chain fails mid-stream
+            (plus "retry_after" when Gemini is over its limits)
+    
+    Args:
+        request: Chat request with message and language
+        
+    Returns:
+        text/event-stream response
+    """
+    async def event_stream():
+        chunks = []
+        try:
+            async for chunk in stream_chat_response(
+                message=request.message,
+                language=request.language,
+                semantic=True
+            ):
+                chunks.append(chunk)
+                yield sse_event("token", {"text": chunk})
+        except UpstreamBusyError as e:
+            yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Chat error: {str(e)}"})
+            return
+        
+        final = ChatResponse(
+            response="".join(chunks),
+            language=request.language,
+            timestamp=datetime.now()
+        )
+        timings = current_timings()
+        if timings is not None:
+            yield sse_event("timing", timings.as_list())
+        yield sse_event("done", final.model_dump(mode="json"))
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.post("/analyze-text", response_model=AnalysisResponse)
 async def analyze_travel_text(request: AnalysisRequest):
     """
@@ -58,62 +122,128 @@ async def analyze_travel_text(request: AnalysisRequest):
         Structured analysis
     """
     try:
-        # Use LangChain analysis chain
-        analysis = analyze_travel_document(
+        # Use LangChain analysis chain (identical documents in flight share one analysis)
+        analysis = await aanalyze_travel_document(
             text=request.text,
             context=request.context,
             language=request.language
         )
         
-        disclaimer = (
-            "⚠️ This analysis is for informational purposes only. "
-            "Always verify travel details with official sources."
-        )
-        
         return AnalysisResponse(
             summary=analysis.summary,
             key_findings=analysis.key_findings,
             recommendations=analysis.recommendations,
             next_steps=analysis.next_steps,
-            disclaimer=disclaimer,
+            disclaimer=DISCLAIMER,
             language=request.language,
             timestamp=datetime.now()
         )
         
+    except UpstreamBusyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
 
 
-@router.post("/analyze-image", response_model=ImageAnalysisResponse)
-async def analyze_travel_image(
-    file: UploadFile = File(...),
-    language: str = Form(default="en"),
-    extract_text_only: bool = Form(default=False)
-):
+@router.post("/analyze-batch", response_model=BatchAnalysisResponse)
+async def analyze_travel_batch(request: BatchAnalysisRequest):
     """
-    Analyze travel document image (itinerary, booking, etc.)
-    Uses Gemini Vision for text extraction
-    Uses LangChain for analysis
+    Analyze many travel documents in one call
+    Documents run concurrently through the analysis chain
     
     Args:
-        file: Image file upload
-        language: Response language (en/fr)
-        extract_text_only: If True, only extract text without analysis
+        request: List of analysis requests and an optional concurrency limit
         
     Returns:
-        Extracted text and analysis
+        Per-document results and errors, in input order
     """
-    # Validate file type
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    max_concurrency = min(
+        request.max_concurrency or settings.batch_max_concurrency,
+        settings.batch_max_concurrency
+    )
     
     try:
-        # Read image bytes
-        image_bytes = await file.read()
+        outputs = await analyze_travel_documents_batch(
+            [item.model_dump() for item in request.items],
+            max_concurrency=max_concurrency
+        )
+    except UpstreamBusyError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch analysis error: {str(e)}")
+    
+    # Nothing could be analyzed - a 503 with Retry-After for the whole request
+    if all(isinstance(output, UpstreamBusyError) for output in outputs):
+        raise max(outputs, key=lambda busy: busy.retry_after)
+    
+    results = []
+    for index, (item, output) in enumerate(zip(request.items, outputs)):
+        if isinstance(output, UpstreamBusyError):
+            results.append(BatchAnalysisItem(index=index, error=str(output), retry_after=output.retry_after))
+            continue
+        results.append(BatchAnalysisItem(
+            index=index,
+            analysis=AnalysisResponse(
+                summary=output.summary,
+                key_findings=output.key_findings,
+                recommendations=output.recommendations,
+                next_steps=output.next_steps,
+                disclaimer=DISCLAIMER,
+                language=item.language,
+                timestamp=datetime.now()
+            )
+        ))
+    
+    failed = sum(1 for r in results if r.error is not None)
+    return BatchAnalysisResponse(
+        results=results,
+        succeeded=len(results) - failed,
+        failed=failed,
+        timestamp=datetime.now()
+    )
+
+
+def image_uploads(file: UploadFile | None, files: list[UploadFile] | None):
+    """
+    Collect and validate the pages of an image upload
+    
+    Args:
+        file: Single "file" part
+        files: "files" parts, one per page
         
-        # Extract text from image using Gemini Vision
-        extracted_text = gemini_service.extract_text_from_image(image_bytes)
+    Returns:
+        List of uploads in page order
+    """
+    uploads = ([file] if file else []) + (files or [])
+    if not uploads:
+        raise HTTPException(status_code=400, detail="At least one image file is required")
+    if len(uploads) > settings.max_upload_pages:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many pages (maximum {settings.max_upload_pages})"
+        )
+    
+    # Validate file types
+    for upload in uploads:
+        if not upload.content_type or not upload.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="File must be an image")
+    return uploads
+
+
+async def image_analysis_response(extracted_text: str, page_count: int, language: str, extract_text_only: bool):
+    """
+    Analyze the text extracted from a document's pages
+    
+    Args:
+        extracted_text: OCR text of all pages
+        page_count: Number of pages
+        language: Response language
+        extract_text_only: If True, skip the analysis
         
+    Returns:
+        ImageAnalysisResponse
+    """
+    try:
         if extract_text_only:
             # Return only extracted text
             return ImageAnalysisResponse(
@@ -126,20 +256,16 @@ async def analyze_travel_image(
                     disclaimer="Text extraction only - no analysis performed",
                     language=language,
                     timestamp=datetime.now()
-                )
+                ),
+                page_count=page_count
             )
         
-        # Perform full analysis using LangChain
-        analysis = analyze_travel_document(
+        # Perform one full analysis over the combined text using LangChain
+        analysis = await aanalyze_travel_document(
             text=extracted_text,
             language=language
         )
         
-        disclaimer = (
-            "⚠️ This analysis is for informational purposes only. "
-            "Always verify travel details with official sources."
-        )
-        
         return ImageAnalysisResponse(
             extracted_text=extracted_text,
             analysis=AnalysisResponse(
@@ -147,16 +273,70 @@ async def analyze_travel_image(
                 key_findings=analysis.key_findings,
                 recommendations=analysis.recommendations,
                 next_steps=analysis.next_steps,
-                disclaimer=disclaimer,
+                disclaimer=DISCLAIMER,
                 language=language,
                 timestamp=datetime.now()
-            )
+            ),
+            page_count=page_count
         )
         
+    except UpstreamBusyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image analysis error: {str(e)}")
 
 
+@router.post("/analyze-image", response_model=ImageAnalysisResponse)
+async def analyze_travel_image(
+    file: UploadFile | None = File(default=None),
+    files: list[UploadFile] | None = File(default=None),
+    language: str = Form(default="en"),
+    extract_text_only: bool = Form(default=False)
+):
+    """
+    Analyze travel document image (itinerary, booking, etc.)
+    Uses Gemini Vision for text extraction
+    Uses LangChain for analysis
+    
+    Multi-page documents can be sent as several "files" parts (or a
+    "file" part followed by "files"). Pages are OCR'd in parallel and
+    analyzed together in upload order.
+    
+    Args:
+        file: Image file upload (single page)
+        files: Image file uploads (one per page)
+        language: Response language (en/fr)
+        extract_text_only: If True, only extract text without analysis
+        
+    Returns:
+        Extracted text and analysis
+    """
+    uploads = image_uploads(file, files)
+    
+    # Reject oversized uploads before reading them, then wait for memory budget
+    # (the files plus their decoded bitmaps)
+    reserved = sum([await image_reservation(upload) for upload in uploads])
+    async with upload_budget.reserve(reserved):
+        # Read image bytes in chunks (413 as soon as a page exceeds the limit)
+        pages = [await read_upload(upload) for upload in uploads]
+        page_count = len(pages)
+        
+        try:
+            # Extract text from all pages in parallel using Gemini Vision
+            extracted_text = await gemini_service.extract_text_from_pages(
+                pages, [upload.content_type for upload in uploads]
+            )
+        except UpstreamBusyError:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Image analysis error: {str(e)}")
+        
+        # The image bytes are not needed for the analysis - release them early
+        del pages
+    
+    return await image_analysis_response(extracted_text, page_count, language, extract_text_only)
+
+
 @router.post("/extract-text")
 async def extract_text_from_image(file: UploadFile = File(...)):
     """
@@ -171,14 +351,18 @@ async def extract_text_from_image(file: UploadFile = File(...)):
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    try:
-        image_bytes = await file.read()
-        extracted_text = gemini_service.extract_text_from_image(image_bytes)
+    async with upload_budget.reserve(await image_reservation(file)):
+        image_bytes = await read_upload(file)
         
-        return {
-            "extracted_text": extracted_text,
-            "timestamp": datetime.now()
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Text extraction error: {str(e)}")
+        try:
+            extracted_text = await gemini_service.aextract_text_from_image(image_bytes, file.content_type)
+            
+            return {
+                "extracted_text": extracted_text,
+                "timestamp": datetime.now()
+            }
+            
+        except UpstreamBusyError:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Text extraction error: {str(e)}")
@@ -2,8 +2,19 @@
 Health check endpoints
 """
 
+import asyncio
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from app.models.schemas import HealthCheckResponse
+from app.services.response_cache import response_cache
+from app.services.semantic_cache import semantic_cache
+from app.services.singleflight import flight_stats
+from app.services.governor import governor_stats
+from app.services.resilience import resilience_stats
+from app.services.warmup import warm_up
+from app.services.jobs import job_queue
+from app.services.gemini_service import gemini_service
+from app.chains.analysis_chain import parse_metrics
 from datetime import datetime
 
 router = APIRouter(prefix="/api", tags=["Health"])
@@ -23,4 +34,39 @@ async def health_check():
         status="healthy",
         timestamp=datetime.now(),
         message="MediCare AI Backend is running! 🏥"
-    )
\ No newline at end of file
+    )
+
+
+@router.get("/ready")
+async def readiness_check():
+    """
+    Check if startup warm-up has finished
+    
+    Returns:
+        Warm-up report, with status 503 until the app is ready
+    """
+    return JSONResponse(status_code=200 if warm_up.ready else 503, content=warm_up.report())
+
+
+@router.get("/stats")
+async def service_stats():
+    """
+    Cache hit ratios, request coalescing, upstream queues, retries,
+    circuit breakers, structured-output parsing, image preprocessing
+    and background jobs
+    
+    Returns:
+        Dictionary of counters
+    """
+    return {
+        "response_cache": response_cache.stats_dict(),
+        "semantic_cache": semantic_cache.stats.as_dict(),
+        "analysis_parsing": parse_metrics.as_dict(),
+        "singleflight": flight_stats(),
+        "upstreams": governor_stats(),
+        "image_preprocessing": gemini_service.preprocessing_stats(),
+        "resilience": resilience_stats(),
+        # The job counts are a SQLite query - off the event loop
+        "jobs": await asyncio.to_thread(job_queue.stats),
+        "timestamp": datetime.now()
+    }
@@ -0,0 +1,192 @@
+"""
+Background job endpoints for slow research and document analysis
+"""
+
+import asyncio
+from datetime import datetime
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.config import settings
+from app.models.schemas import ResearchRequest, AnalysisRequest, JobResponse
+from app.services.jobs import job_queue, FINISHED_STATES
+from app.services.gemini_service import gemini_service
+from app.routes.research import search_travel_research
+from app.routes.analysis import analyze_travel_text, image_uploads, image_analysis_response
+from app.utils.sse import sse_event, SSE_HEADERS
+from app.utils.uploads import upload_budget, upload_size, read_upload
+from app.utils.timing import TimedRoute
+
+router = APIRouter(prefix="/api/jobs", tags=["Jobs"], route_class=TimedRoute)
+
+# Seconds between status events on a job's event stream
+EVENT_INTERVAL = 15.0
+
+
+async def _run_research(payload: dict, inputs: list[bytes]):
+    response = await search_travel_research(ResearchRequest(**payload))
+    return response.model_dump(mode="json")
+
+
+async def _run_text_analysis(payload: dict, inputs: list[bytes]):
+    response = await analyze_travel_text(AnalysisRequest(**payload))
+    return response.model_dump(mode="json")
+
+
+async def _run_image_analysis(payload: dict, inputs: list[bytes]):
+    # Imported on first use, so Pillow is not loaded at startup
+    from app.services.image_preprocessing import decoded_size
+
+    # The stored pages are loaded and decoded now, not when they were uploaded
+    async with upload_budget.reserve(sum(len(page) + decoded_size(page) for page in inputs)):
+        extracted_text = await gemini_service.extract_text_from_pages(inputs, payload.get("content_types"))
+    response = await image_analysis_response(
+        extracted_text, len(inputs), payload["language"], payload["extract_text_only"]
+    )
+    return response.model_dump(mode="json")
+
+
+job_queue.register("research", _run_research)
+job_queue.register("analyze_text", _run_text_analysis)
+job_queue.register("analyze_image", _run_image_analysis)
+
+
+def _timestamp(seconds: float | None):
+    return datetime.fromtimestamp(seconds) if seconds is not None else None
+
+
+def _to_response(job: dict):
+    """Convert a stored job to a JobResponse"""
+    return JobResponse(
+        job_id=job["id"],
+        kind=job["kind"],
+        state=job["state"],
+        attempts=job["attempts"],
+        created_at=_timestamp(job["created_at"]),
+        started_at=_timestamp(job["started_at"]),
+        finished_at=_timestamp(job["finished_at"]),
+        result=job["result"],
+        error=job["error"]
+    )
+
+
+@router.post("/research", response_model=JobResponse, status_code=202)
+async def submit_research_job(request: ResearchRequest):
+    """
+    Queue a travel research request (same input as /api/research)
+
+    Args:
+        request: Research request with query and parameters
+
+    Returns:
+        The queued job; poll /api/jobs/{job_id} for the result
+    """
+    return _to_response(await job_queue.submit("research", request.model_dump()))
+
+
+@router.post("/analyze-text", response_model=JobResponse, status_code=202)
+async def submit_text_analysis_job(request: AnalysisRequest):
+    """
+    Queue a travel document text analysis (same input as /api/analyze-text)
+
+    Args:
+        request: Analysis request with text and context
+
+    Returns:
+        The queued job; poll /api/jobs/{job_id} for the result
+    """
+    return _to_response(await job_queue.submit("analyze_text", request.model_dump()))
+
+
+@router.post("/analyze-image", response_model=JobResponse, status_code=202)
+async def submit_image_analysis_job(
+    file: UploadFile | None = File(default=None),
+    files: list[UploadFile] | None = File(default=None),
+    language: str = Form(default="en"),
+    extract_text_only: bool = Form(default=False)
+):
+    """
+    Queue a travel document image analysis (same input as /api/analyze-image)
+
+    The pages are stored with the job until it has run.
+
+    Args:
+        file: Image file upload (single page)
+        files: Image file uploads (one per page)
+        language: Response language
+        extract_text_only: If True, only extract text without analysis
+
+    Returns:
+        The queued job; poll /api/jobs/{job_id} for the result
+    """
+    uploads = image_uploads(file, files)
+    async with upload_budget.reserve(sum(upload_size(upload) for upload in uploads)):
+        pages = [await read_upload(upload) for upload in uploads]
+        job = await job_queue.submit(
+            "analyze_image",
+            {
+                "language": language,
+                "extract_text_only": extract_text_only,
+                "content_types": [upload.content_type for upload in uploads]
+            },
+            pages
+        )
+    return _to_response(job)
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, wait: float = Query(default=0, ge=0, description="Seconds to wait for the result")):
+    """
+    Get a job's state, and its result once done
+
+    With wait > 0 the request is held until the job finishes or wait
+    seconds pass (capped by the server setting), so clients can long-poll.
+
+    Args:
+        job_id: ID returned on submission
+        wait: Seconds to wait for the job to finish
+
+    Returns:
+        The job
+    """
+    if wait > 0:
+        job = await job_queue.wait(job_id, min(wait, settings.job_max_wait))
+    else:
+        job = await asyncio.to_thread(job_queue.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found (unknown or expired)")
+    return _to_response(job)
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Follow a job as Server-Sent Events
+
+    Events:
+        status: the job (without result) when it is first read, when
+            its state changes, and every 15 seconds as a keep-alive
+        done: the finished job, with its result
+        error: the failed job, with its error
+
+    Args:
+        job_id: ID returned on submission
+
+    Returns:
+        text/event-stream response
+    """
+    job = await asyncio.to_thread(job_queue.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found (unknown or expired)")
+
+    async def event_stream():
+        current = job
+        while current is not None and current["state"] not in FINISHED_STATES:
+            yield sse_event("status", _to_response({**current, "result": None}).model_dump(mode="json"))
+            current = await job_queue.wait(job_id, EVENT_INTERVAL)
+        if current is None:
+            yield sse_event("error", {"detail": "Job not found (unknown or expired)"})
+            return
+        event = "done" if current["state"] == "done" else "error"
+        yield sse_event(event, _to_response(current).model_dump(mode="json"))
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
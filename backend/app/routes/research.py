@@ -2,101 +2,407 @@
 Travel research endpoints using Tavily + LangChain
 """
 
+import asyncio
+import logging
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from app.config import settings
 from app.models.schemas import ResearchRequest, ResearchResponse, ResearchResult
 from app.services.tavily_service import tavily_service
 from app.services.firecrawl_service import firecrawl_service
-from app.chains.chat_chain import get_chat_response
+from app.services.vector_index import research_index
+from app.services.governor import UpstreamBusyError
+from app.chains.chat_chain import aget_chat_response, stream_chat_response
+from app.chains.context import assemble_context
+from app.services.metrics import observe_stage
+from app.utils.timing import TimedRoute, current_timings, timed
+from app.utils.sse import sse_event, SSE_HEADERS
 from datetime import datetime
 
-router = APIRouter(prefix="/api", tags=["Research"])
+router = APIRouter(prefix="/api", tags=["Research"], route_class=TimedRoute)
+logger = logging.getLogger(__name__)
 
+# Keeps background indexing tasks alive until they finish
+_background_tasks = set()
 
-@router.post("/research", response_model=ResearchResponse)
-async def search_travel_research(request: ResearchRequest):
+
+async def _scrape_one(url: str):
     """
-    Search for travel research and information
-    Uses Tavily for search + LangChain for summary
+    Scrape a single URL with a timeout
     
     Args:
-        request: Research request with query and parameters
+        url: The URL to scrape
         
     Returns:
-        Research results with AI-generated summary
+        Scraped data dictionary (with an "error" key on failure)
     """
     try:
-        # Search using Tavily
-        raw_results = tavily_service.search_travel_research(
-            query=request.query,
-            max_results=request.max_results
+        with timed("scrape", url):
+            return await asyncio.wait_for(
+                firecrawl_service.ascrape(url),
+                timeout=settings.scrape_timeout
+            )
+    except asyncio.TimeoutError:
+        # Serve the stored copy if the page has one, negative-cache it otherwise
+        return await asyncio.to_thread(
+            firecrawl_service.fallback, url, f"Scraping timed out after {settings.scrape_timeout}s"
         )
+    except Exception as e:
+        return {"error": f"Scraping error: {str(e)}", "image_urls": []}
+
+
+async def _scrape_indexed(index: int, url: str):
+    """Scrape a URL and return it with its position in the result list"""
+    return index, await _scrape_one(url)
+
+
+async def _scrape_pages(results: list[dict]):
+    """
+    Scrape all result pages concurrently
+    
+    Failed or timed-out pages come back as error dictionaries so the
+    pages that did finish can still be used for the synthesis.
+    
+    Args:
+        results: Formatted Tavily results
         
-        # Format results
-        formatted_results = tavily_service.format_results(raw_results)
+    Returns:
+        List of scraped data dictionaries, in the same order as results
+    """
+    return await asyncio.gather(*(_scrape_one(r["url"]) for r in results))
+
+
+async def _search(request: ResearchRequest):
+    """
+    Search using Tavily (the blocking SDK call runs off the event loop)
+    
+    Args:
+        request: Research request
         
-        # Scrape content and get image URLs from top 3 results
-        scraped_contents = []
-        all_image_urls = []
-        for r in formatted_results[:3]:
-            scraped_data = firecrawl_service.scrape(r["url"])
-            print("🔥 Firecrawl scraped data:", scraped_data)  # Added log
-            if "content" in scraped_data:
-                scraped_contents.append(f"Source: {r['title']}\n{scraped_data['content']}")
-            if "image_urls" in scraped_data and len(scraped_data["image_urls"]) > 0:
-                all_image_urls.extend(scraped_data["image_urls"])
-                r["image_url"] = scraped_data["image_urls"][0] # Keep the first for the source object
-
-        # Generate summary using LangChain chat
-        results_text = "\n\n".join(scraped_contents)
+    Returns:
+        List of formatted results
+    """
+    raw_results = await tavily_service.asearch_travel_research(
+        query=request.query,
+        max_results=request.max_results
+    )
+    return tavily_service.format_results(raw_results)
+
+
+def _apply_scrape(result: dict, scraped_data: dict, scraped_contents: list, all_image_urls: list):
+    """
+    Collect the content and images of one scraped page
+    
+    Args:
+        result: Formatted Tavily result the page belongs to
+        scraped_data: Firecrawl scrape payload
+        scraped_contents: List of (title, markdown) pairs to append to
+        all_image_urls: List of image URLs to extend
+    """
+    logger.debug(
+        "Firecrawl scraped %s: %d chars, %d images%s",
+        result["url"],
+        len(scraped_data.get("markdown") or ""),
+        len(scraped_data.get("image_urls", [])),
+        f", error: {scraped_data['error']}" if "error" in scraped_data else ""
+    )
+    if scraped_data.get("markdown"):
+        scraped_contents.append((result["title"], scraped_data["markdown"]))
+    if scraped_data.get("image_urls"):
+        all_image_urls.extend(scraped_data["image_urls"])
+        result["image_url"] = scraped_data["image_urls"][0] # Keep the first for the source object
+
+
+def _build_context(query: str, scraped_contents: list[tuple[str, str]]):
+    """
+    Pack the most relevant parts of the scraped pages into the token budget
+    
+    Args:
+        query: User's research query
+        scraped_contents: (title, markdown) for each scraped page
+        
+    Returns:
+        Context text for the synthesis prompt
+    """
+    with observe_stage("context_assembly"):
+        return assemble_context(
+            query,
+            scraped_contents,
+            token_budget=settings.research_context_tokens,
+            chunk_tokens=settings.research_chunk_tokens
+        )
+
+
+def _build_synthesis_prompt(query: str, language: str, results_text: str):
+    """
+    Build the prompt that turns scraped pages into one narrative
+    
+    Args:
+        query: User's research query
+        language: Response language
+        results_text: Scraped source texts
         
-        if request.language == "fr":
-            synthesis_prompt = f"""Basé sur les informations de voyage suivantes, rédigez une réponse complète et engageante pour la requête de l'utilisateur '{request.query}'. Intégrez les détails clés dans un récit cohérent.
+    Returns:
+        Prompt string
+    """
+    if language == "fr":
+        return f"""Basé sur les informations de voyage suivantes, rédigez une réponse complète et engageante pour la requête de l'utilisateur '{query}'. Intégrez les détails clés dans un récit cohérent.
 
 {results_text}
 
 Votre réponse doit être bien structurée, informative et facile à lire."""
-        elif request.language == "vi":
-            synthesis_prompt = f"""Dựa trên thông tin du lịch sau đây, hãy viết một câu trả lời tổng hợp đầy đủ và hấp dẫn cho truy vấn của người dùng '{request.query}'. Tích hợp các chi tiết chính vào một bài tường thuật mạch lạc.
+    elif language == "vi":
+        return f"""Dựa trên thông tin du lịch sau đây, hãy viết một câu trả lời tổng hợp đầy đủ và hấp dẫn cho truy vấn của người dùng '{query}'. Tích hợp các chi tiết chính vào một bài tường thuật mạch lạc.
 
 {results_text}
 
 Câu trả lời của bạn phải có cấu trúc tốt, nhiều thông tin và dễ đọc."""
-        else:
-            synthesis_prompt = f"""Based on the following travel information, write a comprehensive and engaging synthesized response for the user's query '{request.query}'. Integrate the key details into a coherent narrative.
+    else:
+        return f"""Based on the following travel information, write a comprehensive and engaging synthesized response for the user's query '{query}'. Integrate the key details into a coherent narrative.
 
 {results_text}
 
 Your response should be well-structured, informative, and easy to read."""
+
+
+def _filter_image_urls(query: str, image_urls: list[str]):
+    """Keep image URLs that mention a query keyword"""
+    query_keywords = query.lower().split()
+    return [
+        url for url in image_urls
+        if any(keyword in url.lower() for keyword in query_keywords)
+    ]
+
+
+def _to_sources(formatted_results: list[dict]):
+    """Convert formatted results to ResearchResult models"""
+    return [
+        ResearchResult(
+            title=r["title"],
+            url=r["url"],
+            content=r["content"],
+            score=r["score"],
+            image_url=r.get("image_url")
+        )
+        for r in formatted_results
+    ]
+
+
+async def _retrieve(request: ResearchRequest):
+    """
+    Answer from the local chunk index when it covers the query
+    
+    Args:
+        request: Research request
+        
+    Returns:
+        Tuple (formatted results, (title, text) contents, image URLs),
+        or None when the index is disabled, stale or insufficient
+    """
+    if not settings.research_index_enabled:
+        return None
+    try:
+        hits = await asyncio.to_thread(research_index.retrieve, request.query)
+    except Exception as e:
+        logger.warning("Research index error: %s", e)
+        return None
+    if hits is None:
+        return None
+    
+    # Group chunks by page, best-scoring page first
+    pages = {}
+    for hit in hits:
+        page = pages.setdefault(hit["url"], {
+            "title": hit["title"],
+            "score": hit["score"],
+            "texts": [],
+            "image_urls": hit["image_urls"]
+        })
+        page["texts"].append(hit["text"])
+    
+    formatted_results = []
+    scraped_contents = []
+    all_image_urls = []
+    for url, page in list(pages.items())[:request.max_results]:
+        formatted_results.append({
+            "title": page["title"],
+            "url": url,
+            "content": page["texts"][0][:500],
+            "score": page["score"],
+            "image_url": page["image_urls"][0] if page["image_urls"] else None
+        })
+        scraped_contents.append((page["title"], "\n\n".join(page["texts"])))
+        all_image_urls.extend(page["image_urls"])
+    return formatted_results, scraped_contents, all_image_urls
+
+
+def _index_pages(pages: list[tuple]):
+    """Add scraped pages to the chunk index (runs in a worker thread)"""
+    for url, title, markdown, image_urls, fetched_at in pages:
+        try:
+            research_index.add_page(url, title, markdown, image_urls, fetched_at)
+        except Exception as e:
+            logger.warning("Research index error for %s: %s", url, e)
+
+
+def _schedule_indexing(top_results: list[dict], scraped_pages: list[dict]):
+    """
+    Index freshly scraped pages in the background
+    
+    The response does not wait for the embedding calls.
+    """
+    if not settings.research_index_enabled:
+        return
+    pages = [
+        (r["url"], r["title"], data["markdown"], data.get("image_urls", []), data.get("fetched_at"))
+        for r, data in zip(top_results, scraped_pages)
+        if data.get("markdown")
+    ]
+    if not pages:
+        return
+    task = asyncio.create_task(asyncio.to_thread(_index_pages, pages))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@router.post("/research", response_model=ResearchResponse)
+async def search_travel_research(request: ResearchRequest):
+    """
+    Search for travel research and information
+    Uses Tavily for search + LangChain for summary
+    
+    Args:
+        request: Research request with query and parameters
+        
+    Returns:
+        Research results with AI-generated summary
+    """
+    try:
+        # Previously indexed content first - search and scrape only if needed
+        retrieved = await _retrieve(request)
+        if retrieved is not None:
+            formatted_results, scraped_contents, all_image_urls = retrieved
+        else:
+            formatted_results = await _search(request)
+            
+            # Scrape content and get image URLs from the top results in parallel
+            top_results = formatted_results[:settings.research_scrape_pages]
+            scraped_pages = await _scrape_pages(top_results)
+            
+            scraped_contents = []
+            all_image_urls = []
+            for r, scraped_data in zip(top_results, scraped_pages):
+                _apply_scrape(r, scraped_data, scraped_contents, all_image_urls)
+            _schedule_indexing(top_results, scraped_pages)
+
+        # Generate summary using LangChain chat over a token-budgeted context
+        results_text = await asyncio.to_thread(_build_context, request.query, scraped_contents)
+        synthesis_prompt = _build_synthesis_prompt(request.query, request.language, results_text)
         
         # Use LangChain chat to generate synthesized response
-        synthesized_response = get_chat_response(synthesis_prompt, request.language)
+        synthesized_response = await aget_chat_response(synthesis_prompt, request.language)
         
         # Filter and limit image URLs based on query keywords
-        query_keywords = request.query.lower().split()
-        filtered_image_urls = [
-            url for url in all_image_urls
-            if any(keyword in url.lower() for keyword in query_keywords)
-        ][:5]
-        
-        # Convert to ResearchResult models for sources
-        sources = [
-            ResearchResult(
-                title=r["title"],
-                url=r["url"],
-                content=r["content"],
-                score=r["score"],
-                image_url=r.get("image_url")
-            )
-            for r in formatted_results
-        ]
+        filtered_image_urls = _filter_image_urls(request.query, all_image_urls)[:5]
         
         return ResearchResponse(
             query=request.query,
             response=synthesized_response,
             image_urls=filtered_image_urls,
-            sources=sources,
+            sources=_to_sources(formatted_results),
             timestamp=datetime.now()
         )
         
+    except UpstreamBusyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Research error: {str(e)}")
+
+
+@router.post("/research/stream")
+async def search_travel_research_stream(request: ResearchRequest):
+    """
+    Search for travel research and stream results as Server-Sent Events
+    
+    Events (in order):
+        sources: ResearchResult list as soon as Tavily returns
+        images: {"url", "image_urls"} as each page scrape completes
+            (url is null when answering from the local chunk index)
+        token: {"text": ...} synthesis chunks as the model emits them
+        timing: Server-Timing stages of the whole stream, as a list
+        done: the same payload as ResearchResponse
+        error: {"detail": ...} if any stage fails
+    
+    Args:
+        request: Research request with query and parameters
+        
+    Returns:
+        text/event-stream response
+    """
+    async def event_stream():
+        try:
+            retrieved = await _retrieve(request)
+            if retrieved is not None:
+                # Everything is local - emit sources and images right away
+                formatted_results, scraped_contents, all_image_urls = retrieved
+                yield sse_event("sources", [
+                    source.model_dump(mode="json") for source in _to_sources(formatted_results)
+                ])
+                page_images = _filter_image_urls(request.query, all_image_urls)
+                if page_images:
+                    yield sse_event("images", {"url": None, "image_urls": page_images})
+            else:
+                formatted_results = await _search(request)
+                yield sse_event("sources", [
+                    source.model_dump(mode="json") for source in _to_sources(formatted_results)
+                ])
+                
+                # Emit images page by page as the scrapes finish
+                top_results = formatted_results[:settings.research_scrape_pages]
+                scraped_pages = [None] * len(top_results)
+                for next_done in asyncio.as_completed([
+                    _scrape_indexed(i, r["url"]) for i, r in enumerate(top_results)
+                ]):
+                    index, scraped_data = await next_done
+                    scraped_pages[index] = scraped_data
+                    page_images = _filter_image_urls(request.query, scraped_data.get("image_urls", []))
+                    if page_images:
+                        yield sse_event("images", {
+                            "url": top_results[index]["url"],
+                            "image_urls": page_images
+                        })
+                
+                # Assemble in result order so the prompt matches /api/research
+                scraped_contents = []
+                all_image_urls = []
+                for r, scraped_data in zip(top_results, scraped_pages):
+                    _apply_scrape(r, scraped_data, scraped_contents, all_image_urls)
+                _schedule_indexing(top_results, scraped_pages)
+            
+            results_text = await asyncio.to_thread(_build_context, request.query, scraped_contents)
+            synthesis_prompt = _build_synthesis_prompt(request.query, request.language, results_text)
+            
+            chunks = []
+            async for chunk in stream_chat_response(synthesis_prompt, request.language):
+                chunks.append(chunk)
+                yield sse_event("token", {"text": chunk})
+            
+            final = ResearchResponse(
+                query=request.query,
+                response="".join(chunks),
+                image_urls=_filter_image_urls(request.query, all_image_urls)[:5],
+                sources=_to_sources(formatted_results),
+                timestamp=datetime.now()
+            )
+            # The header went out before the work - send the stages now
+            timings = current_timings()
+            if timings is not None:
+                yield sse_event("timing", timings.as_list())
+            yield sse_event("done", final.model_dump(mode="json"))
+            
+        except UpstreamBusyError as e:
+            yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Research error: {str(e)}"})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
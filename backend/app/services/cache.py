@@ -0,0 +1,500 @@
+"""
+Cache backends shared by the services and chains
+In-memory LRU, persistent on-disk (SQLite) and process-shared caches with TTLs
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from app.config import settings
+
+
+def make_key(*parts):
+    """
+    Build a stable cache key from JSON-serializable parts
+
+    Args:
+        parts: Values that identify the cached item
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    """Hit/miss counters for a cache"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "sets": self.sets,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hit_ratio, 4),
+        }
+
+
+class MemoryCache:
+    """
+    Thread-safe in-memory LRU cache with per-entry TTL
+
+    Values are stored as-is (no copy), so callers should not mutate them.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float | None = None):
+        """
+        Args:
+            max_entries: Maximum number of entries before LRU eviction
+            default_ttl: Default time-to-live in seconds (None = no expiry)
+        """
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        """Return the cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.stats.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def peek(self, key: str, default=None):
+        """Return the cached value without counting a lookup or refreshing its recency"""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or (entry[0] is not None and entry[0] <= time.time()):
+            return default
+        return entry[1]
+
+    def set(self, key: str, value, ttl: float | None = None):
+        """Store a value, evicting the least recently used entries if full"""
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            self.stats.sets += 1
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def get_or_compute(
+        self, key: str, compute, ttl: float | None = None, lookup: bool = True, max_wait: float | None = None
+    ):
+        """
+        Return the cached value, or compute and store it
+
+        Concurrent callers in one process are coalesced by the callers'
+        SingleFlight groups, so this does not lock the key.
+
+        Args:
+            key: Cache key
+            compute: Function returning the value (None is not cached)
+            ttl: Time-to-live in seconds (defaults to default_ttl)
+            lookup: Check the cache first (False when the caller has just
+                missed with get(), so the miss is not counted twice)
+            max_wait: Unused here (see SharedCache)
+        """
+        value = self.get(key) if lookup else None
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    async def aget_or_compute(
+        self, key: str, compute, ttl: float | None = None, lookup: bool = True, max_wait: float | None = None
+    ):
+        """Async get_or_compute(): compute is a coroutine function"""
+        value = self.get(key) if lookup else None
+        if value is None:
+            value = await compute()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """
+    Persistent cache stored in a SQLite file
+
+    Values must be JSON-serializable. Entries are evicted least recently
+    used first once max_entries is exceeded.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, default_ttl: float | None = None):
+        """
+        Args:
+            path: SQLite database file
+            max_entries: Maximum number of entries before LRU eviction
+            default_ttl: Default time-to-live in seconds (None = no expiry)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str, default=None):
+        """Return the cached value, or default if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return default
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats.misses += 1
+                return default
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats.hits += 1
+        return json.loads(value)
+
+    def peek(self, key: str, default=None):
+        """Return the cached value without counting a lookup or refreshing its recency"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float | None = None):
+        """Store a value, evicting the least recently used entries if full"""
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now),
+            )
+            self.stats.sets += 1
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                self.stats.evictions += overflow
+            self._conn.commit()
+
+    def get_or_compute(
+        self, key: str, compute, ttl: float | None = None, lookup: bool = True, max_wait: float | None = None
+    ):
+        """Return the cached value, or compute and store it (see MemoryCache)"""
+        value = self.get(key) if lookup else None
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    async def aget_or_compute(
+        self, key: str, compute, ttl: float | None = None, lookup: bool = True, max_wait: float | None = None
+    ):
+        """Async get_or_compute(): compute is a coroutine function, SQLite I/O runs in worker threads"""
+        value = await asyncio.to_thread(self.get, key) if lookup else None
+        if value is None:
+            value = await compute()
+            if value is not None:
+                await asyncio.to_thread(self.set, key, value, ttl)
+        return value
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class SharedCache(DiskCache):
+    """
+    SQLite cache shared by all worker processes on a host
+
+    How it works:
+    - The database runs in WAL mode, so readers in every process proceed
+      while one process writes; writers wait on a busy timeout instead of
+      failing
+    - Access times are only rewritten once a minute per entry, so hits do
+      not turn into a write each (eviction is approximately LRU)
+    - get_or_compute() takes a lease on the key in the database: one
+      process computes the value, the others poll until it is stored.
+      A lease expires after lease_timeout, so a crashed process cannot
+      block the key for longer than that, and a waiter gives up after its
+      own max_wait and computes the value itself
+    - aget_or_compute() takes the same lease from async code, waiting
+      on the event loop instead of in a worker thread
+
+    Values must be JSON-serializable.
+    """
+
+    # Seconds between access time updates of one entry
+    ACCESS_RESOLUTION = 60
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10000,
+        default_ttl: float | None = None,
+        lease_timeout: float | None = None
+    ):
+        """
+        Args:
+            path: SQLite database file (the same file in every process)
+            max_entries: Maximum number of entries before LRU eviction
+            default_ttl: Default time-to-live in seconds (None = no expiry)
+            lease_timeout: Longest time one process may hold a key while
+                computing it (defaults to the shared_cache_lease_timeout setting)
+        """
+        super().__init__(path, max_entries=max_entries, default_ttl=default_ttl)
+        self.lease_timeout = settings.shared_cache_lease_timeout if lease_timeout is None else lease_timeout
+        self._owner = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("PRAGMA busy_timeout = 10000")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _read(self, key: str, now: float):
+        """Return (value, last_access) of a live entry, or None (no stats)"""
+        row = self._conn.execute(
+            "SELECT value, expires_at, last_access FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return json.loads(row[0]), row[2]
+
+    def get(self, key: str, default=None):
+        """Return the cached value, or default if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._read(key, now)
+            if entry is None:
+                self.stats.misses += 1
+                return default
+            value, last_access = entry
+            if now - last_access > self.ACCESS_RESOLUTION:
+                self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self.stats.hits += 1
+        return value
+
+    def _claim(self, key: str, owner: str):
+        """Take the key's lease if nobody holds a live one"""
+        now = time.time()
+        with self._lock:
+            claimed = self._conn.execute(
+                "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at <= ?",
+                (key, owner, now + self.lease_timeout, now)
+            ).rowcount == 1
+            self._conn.commit()
+        return claimed
+
+    def _release(self, key: str, owner: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+            self._conn.commit()
+
+    def get_or_compute(
+        self, key: str, compute, ttl: float | None = None, lookup: bool = True, max_wait: float | None = None
+    ):
+        """
+        Return the cached value, or compute and store it - once across
+        all processes sharing the file
+
+        Args:
+            key: Cache key
+            compute: Function returning the value (None is not cached)
+            ttl: Time-to-live in seconds (defaults to default_ttl)
+            lookup: Check the cache first (False when the caller has just
+                missed with get(), so the miss is not counted twice)
+            max_wait: Longest time to wait for another process computing
+                the key before computing it here (defaults to lease_timeout);
+                callers pass their own timeout, so a waiting worker thread
+                is held no longer than computing would have held it
+        """
+        if lookup:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+        owner = f"{self._owner}:{threading.get_ident()}"
+        wait = self.lease_timeout if max_wait is None else min(max_wait, self.lease_timeout)
+        deadline = time.monotonic() + wait
+        delay = 0.01
+        while True:
+            if self._claim(key, owner):
+                try:
+                    # Another process may have stored it since our lookup
+                    with self._lock:
+                        entry = self._read(key, time.time())
+                    if entry is not None:
+                        return entry[0]
+                    return self._compute_and_set(key, compute, ttl)
+                finally:
+                    self._release(key, owner)
+
+            if time.monotonic() >= deadline:
+                # The other process is taking longer than we may wait
+                return self._compute_and_set(key, compute, ttl)
+
+            # Another process is computing it - wait for its result
+            time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, 0.25)
+            with self._lock:
+                entry = self._read(key, time.time())
+            if entry is not None:
+                return entry[0]
+
+    async def aget_or_compute(
+        self, key: str, compute, ttl: float | None = None, lookup: bool = True, max_wait: float | None = None
+    ):
+        """
+        Async get_or_compute(): compute is a coroutine function
+
+        The lease is the same as for blocking callers, but SQLite I/O
+        runs in worker threads and waiting for another process's result
+        happens on the event loop. The lease owner is per call rather
+        than per thread, since each step may run on a different thread.
+        """
+        if lookup:
+            value = await asyncio.to_thread(self.get, key)
+            if value is not None:
+                return value
+
+        owner = f"{self._owner}:{uuid.uuid4().hex}"
+        wait = self.lease_timeout if max_wait is None else min(max_wait, self.lease_timeout)
+        deadline = time.monotonic() + wait
+        delay = 0.01
+        while True:
+            if await asyncio.to_thread(self._claim, key, owner):
+                try:
+                    value = await asyncio.to_thread(self.peek, key)
+                    if value is not None:
+                        return value
+                    return await self._acompute_and_set(key, compute, ttl)
+                finally:
+                    await asyncio.to_thread(self._release, key, owner)
+
+            if time.monotonic() >= deadline:
+                return await self._acompute_and_set(key, compute, ttl)
+
+            await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, 0.25)
+            value = await asyncio.to_thread(self.peek, key)
+            if value is not None:
+                return value
+
+    def _compute_and_set(self, key: str, compute, ttl: float | None):
+        value = compute()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+    async def _acompute_and_set(self, key: str, compute, ttl: float | None):
+        value = await compute()
+        if value is not None:
+            await asyncio.to_thread(self.set, key, value, ttl)
+        return value
+
+
+def create_cache(backend: str, name: str, max_entries: int, default_ttl: float | None = None):
+    """
+    Create a cache for the configured backend
+
+    Args:
+        backend: "memory", "disk" or "shared" (one SQLite file for all
+            worker processes on the host)
+        name: Cache name (used as the SQLite file name for disk and shared caches)
+        max_entries: Size bound
+        default_ttl: Default time-to-live in seconds
+
+    Returns:
+        MemoryCache, DiskCache or SharedCache
+    """
+    if backend == "disk":
+        path = os.path.join(settings.cache_dir, f"{name}.sqlite3")
+        return DiskCache(path, max_entries=max_entries, default_ttl=default_ttl)
+    if backend == "shared":
+        path = os.path.join(settings.cache_dir, f"{name}.sqlite3")
+        return SharedCache(path, max_entries=max_entries, default_ttl=default_ttl)
+    if backend == "memory":
+        return MemoryCache(max_entries=max_entries, default_ttl=default_ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -0,0 +1,72 @@
+"""
+Text embedding backends for the semantic caches
+Google embeddings in production, a local deterministic embedder for tests
+"""
+
+import hashlib
+import re
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.config import settings
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder(Embeddings):
+    """
+    Local, deterministic embedder based on feature hashing
+
+    Words and character trigrams are hashed into a fixed number of
+    dimensions. Paraphrases that share most words land close together,
+    which is enough for tests and offline benchmarks - no network needed.
+    """
+
+    def __init__(self, dimension: int = 256):
+        """
+        Args:
+            dimension: Size of the output vectors
+        """
+        self.dimension = dimension
+
+    def _features(self, text: str):
+        words = WORD.findall(text.casefold())
+        for word in words:
+            yield word, 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.5
+
+    def _embed(self, text: str):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature, weight in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value & 1 else -1.0
+            vector[(value >> 1) % self.dimension] += sign * weight
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str):
+        return self._embed(text)
+
+
+def load_embedder(backend: str | None = None):
+    """
+    Create the configured embedding backend
+
+    Args:
+        backend: "google" or "hashing" (defaults to settings.embedding_backend)
+
+    Returns:
+        LangChain Embeddings instance
+    """
+    backend = backend or settings.embedding_backend
+    if backend == "hashing":
+        return HashingEmbedder(settings.embedding_dimension)
+    if backend == "google":
+        from app.chains.config import load_embeddings
+        return load_embeddings()
+    raise ValueError(f"Unknown embedding backend: {backend}")
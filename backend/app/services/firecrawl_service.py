@@ -2,11 +2,48 @@
 Firecrawl Web Scraping Service
 Handles scraping content and extracting image URLs from URLs
 """
+import asyncio
 import re
 import json
+import time
+import threading
 from typing import Any, Dict
-from firecrawl import FirecrawlApp
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from app.config import settings
+from app.services.cache import create_cache
+from app.services.singleflight import SingleFlight
+from app.services.governor import UpstreamBusyError
+from app.services.resilience import firecrawl_upstream
+from app.services.metrics import observe_stage
+
+# Query parameters that never change the page content
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Canonicalize a URL so equivalent links share one cache entry
+    
+    Lowercases scheme and host, drops default ports, fragments, trailing
+    slashes and tracking parameters, and sorts the query string.
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and (scheme, port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, host, path, query, ""))
 
 
 def _to_dict(obj: Any) -> Dict[str, Any]:
@@ -38,50 +75,217 @@ class FirecrawlService:
     """Service class for Firecrawl scraping operations"""
 
     def __init__(self):
-        """Initialize Firecrawl client"""
-        self.client = FirecrawlApp(api_key=settings.firecrawl_api_key)
+        """Initialize the local page store (the client is created on first use)"""
+        self._client = None
+        self._client_lock = threading.Lock()
+        # pages.sqlite3; the shared backend lets every worker process use it at once
+        self.page_cache = create_cache(
+            settings.page_cache_backend, "pages", max_entries=settings.page_cache_max_entries
+        )
+        # Concurrent scrapes of the same page share one fetch
+        self.flight = SingleFlight("firecrawl_scrape")
+
+    @property
+    def client(self):
+        """Firecrawl client, created on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from firecrawl import FirecrawlApp
+                    self._client = FirecrawlApp(api_key=settings.firecrawl_api_key)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
 
     def scrape(self, url: str):
         """
         Scrape a URL and return its content and image URLs
         
+        Pages are served from the local page store while fresh. Stale pages
+        are refreshed, and served as-is if the refresh fails. URLs that
+        recently errored are not retried until the negative cache expires.
+        Concurrent scrapes of the same URL share one lookup and fetch.
+        
+        Args:
+            url: The URL to scrape
+            
+        Returns:
+            Dictionary with scraped data, including a list of image URLs
+        """
+        cache_key = canonicalize_url(url)
+        return self.flight.do(cache_key, self._scrape, url, cache_key)
+
+    async def ascrape(self, url: str):
+        """
+        Async version of scrape()
+        
+        Callers waiting for a scrape of the same page, or for a Firecrawl
+        slot, hold no worker thread.
+        
         Args:
             url: The URL to scrape
             
         Returns:
             Dictionary with scraped data, including a list of image URLs
         """
+        cache_key = canonicalize_url(url)
+        return await self.flight.ado(cache_key, self._ascrape, url, cache_key)
+
+    def _scrape(self, url: str, cache_key: str):
+        """Serve a page from the page store or fetch it"""
+        entry = self.page_cache.get(cache_key)
+        stored = self._serve_stored(entry)
+        if stored is not None:
+            return stored
+        return self._refresh(url, cache_key, entry)
+
+    async def _ascrape(self, url: str, cache_key: str):
+        """Async version of _scrape(); only a fetch waits for a Firecrawl slot"""
+        entry = await asyncio.to_thread(self.page_cache.get, cache_key)
+        stored = self._serve_stored(entry)
+        if stored is not None:
+            return stored
         try:
-            # Scrape the URL using markdown format and caching
-            scraped_obj = self.client.scrape(url, formats=["markdown"], max_age=3600000)
-
-            # Normalize to dict (handles Document / Pydantic models)
-            data = _to_dict(scraped_obj)
-
-            # Some SDKs nest under "data" or return top-level "markdown"
-            markdown = None
-            if "markdown" in data and isinstance(data["markdown"], str):
-                markdown = data["markdown"]
-            elif "data" in data and isinstance(data["data"], dict) and "markdown" in data["data"]:
-                markdown = data["data"]["markdown"]
-
-            image_urls = []
-            if isinstance(markdown, str):
-                # Find all markdown image URLs: ![alt](url)
-                image_urls = re.findall(r'!\[.*?\]\((.*?)\)', markdown)
-
-            # Build a clean return payload without mutating the SDK object
-            return {
-                "markdown": markdown,
-                "image_urls": image_urls,
-                # include the whole normalized dict in case you need more fields
-                "raw": data,
-            }
+            return await firecrawl_upstream.run(self._refresh, url, cache_key, entry)
+        except UpstreamBusyError as e:
+            return self._busy(entry, e)
 
+    def _serve_stored(self, entry: Dict[str, Any] | None):
+        """The negative-cached error or the fresh stored page for an entry, else None"""
+        if entry is None:
+            return None
+        if "error" in entry:
+            return {"error": entry["error"], "image_urls": [], "cached": True}
+        if time.time() - entry["fetched_at"] < settings.page_cache_fresh_ttl:
+            return self._from_cache(entry)
+        return None
+
+    def _busy(self, entry: Dict[str, Any] | None, error: UpstreamBusyError):
+        """
+        Result when Firecrawl could not be called at all
+        
+        Our own limit or an open circuit, not a page failure - never negative-cached.
+        """
+        if entry is not None:
+            return self._from_cache(entry)
+        return {"error": str(error), "image_urls": []}
+
+    def _refresh(self, url: str, cache_key: str, entry: Dict[str, Any] | None):
+        """Fetch a page that is missing or stale in the page store"""
+        try:
+            # Limits, retries, circuit breaker and a hedged duplicate when slow
+            with observe_stage("firecrawl_scrape"):
+                result = firecrawl_upstream.call(self._fetch, url, hedge=True)
+        except UpstreamBusyError as e:
+            return self._busy(entry, e)
         except Exception as e:
-            # Return a dict with an error key
-            return {"error": f"Scraping error: {str(e)}", "image_urls": []}
+            result = {"error": f"Scraping error: {str(e)}", "image_urls": []}
+
+        if "error" in result:
+            if entry is not None:
+                # Refresh failed - the stale copy beats no content at all
+                return self._from_cache(entry)
+            self.remember_failure(url, result["error"])
+            return result
+
+        self.page_cache.set(
+            cache_key,
+            {
+                "markdown": result["markdown"],
+                "image_urls": result["image_urls"],
+                "fetched_at": time.time(),
+            },
+            ttl=settings.page_cache_fresh_ttl + settings.page_cache_stale_ttl
+        )
+        return result
+
+    def remember_failure(self, url: str, error: str):
+        """
+        Negative-cache a URL that errored or timed out
+        
+        A stored page, even a stale one, is kept instead: it is what
+        callers get when fetching fails.
+        
+        Args:
+            url: The URL that failed
+            error: Error message returned to callers until the entry expires
+        """
+        cache_key = canonicalize_url(url)
+        entry = self.page_cache.get(cache_key)
+        if entry is not None and "error" not in entry:
+            return
+        self.page_cache.set(
+            cache_key,
+            {"error": error, "fetched_at": time.time()},
+            ttl=settings.page_cache_negative_ttl
+        )
+
+    def fallback(self, url: str, error: str):
+        """
+        Result for a URL whose scrape failed outside scrape() (e.g. timed out)
+        
+        Args:
+            url: The URL that failed
+            error: Error message if no copy of the page is stored
+            
+        Returns:
+            The stored page if there is one (however stale), otherwise an
+            error dictionary (and the URL is negative-cached)
+        """
+        entry = self.page_cache.get(canonicalize_url(url))
+        if entry is not None and "error" not in entry:
+            return self._from_cache(entry)
+        self.remember_failure(url, error)
+        return {"error": error, "image_urls": []}
+
+    @staticmethod
+    def _from_cache(entry: Dict[str, Any]):
+        """Build a scrape payload from a page store entry"""
+        return {
+            "markdown": entry["markdown"],
+            "image_urls": list(entry["image_urls"]),
+            "fetched_at": entry["fetched_at"],
+            "cached": True,
+        }
+
+    def _fetch(self, url: str):
+        """
+        Scrape a URL over the network
+        
+        SDK errors are raised (not swallowed) so the resilience layer can
+        tell transient failures from permanent ones.
+        """
+        # Scrape the URL using markdown format and caching; the timeout (ms)
+        # frees the governor slot when a page hangs past scrape_timeout
+        scraped_obj = self.client.scrape(
+            url, formats=["markdown"], max_age=3600000, timeout=int(settings.scrape_timeout * 1000)
+        )
+
+        # Normalize to dict (handles Document / Pydantic models)
+        data = _to_dict(scraped_obj)
+
+        # Some SDKs nest under "data" or return top-level "markdown"
+        markdown = None
+        if "markdown" in data and isinstance(data["markdown"], str):
+            markdown = data["markdown"]
+        elif "data" in data and isinstance(data["data"], dict) and "markdown" in data["data"]:
+            markdown = data["data"]["markdown"]
+
+        image_urls = []
+        if isinstance(markdown, str):
+            # Find all markdown image URLs: ![alt](url)
+            image_urls = re.findall(r'!\[.*?\]\((.*?)\)', markdown)
+
+        # Build a clean return payload without mutating the SDK object
+        return {
+            "markdown": markdown,
+            "image_urls": image_urls,
+            # include the whole normalized dict in case you need more fields
+            "raw": data,
+        }
 
 
 # Global service instance
-firecrawl_service = FirecrawlService()
\ No newline at end of file
+firecrawl_service = FirecrawlService()
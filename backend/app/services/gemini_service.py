@@ -3,87 +3,239 @@ Google Gemini AI Service using LangChain
 Handles image processing and vision tasks
 """
 
+import asyncio
+import hashlib
+import json
+import logging
+import threading
 from langchain_core.messages import HumanMessage
-from app.config import load_google_vision_llm
-from PIL import Image
-import io
-import base64
+from app.config import settings, load_google_vision_llm
+from app.services.cache import MemoryCache, create_cache, make_key
+from app.services.governor import UpstreamBusyError
+from app.services.resilience import gemini_upstream
+from app.services.metrics import TokenUsageHandler, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Prompt for text extraction (part of the OCR cache key)
+OCR_PROMPT = """You are a medical text extractor. Extract ALL text from this medical document/record.
+
+Include:
+- Patient information
+- Test results
+- Doctor's notes
+- Prescriptions
+- Dates and measurements
+- Any handwritten text
+
+Format the output clearly and preserve the structure. If text is unclear, indicate with [unclear].
+
+Extract all text now:"""
 
 
 class GeminiService:
     """Service class for Gemini AI operations using LangChain"""
     
     def __init__(self):
-        """Initialize Gemini vision model"""
-        self.vision_llm = load_google_vision_llm()
+        """Initialize caches and counters (the vision model is loaded on first use)"""
+        self._vision_llm = None
+        self.preprocess_stats = {"images": 0, "bytes_in": 0, "bytes_out": 0}
+        self._stats_lock = threading.Lock()
+        self._ocr_tokens = TokenUsageHandler("vision_ocr", "auto")
+        
+        # OCR results keyed by image content: memory first, then an optional
+        # disk or shared (all worker processes) tier in ocr.sqlite3
+        self.ocr_cache = MemoryCache(
+            max_entries=settings.ocr_cache_max_entries,
+            default_ttl=settings.ocr_cache_ttl
+        )
+        self.ocr_disk_cache = None
+        if settings.ocr_cache_backend != "memory":
+            self.ocr_disk_cache = create_cache(
+                settings.ocr_cache_backend, "ocr",
+                max_entries=settings.ocr_cache_max_entries * 20,
+                default_ttl=settings.ocr_cache_ttl
+            )
+    
+    @property
+    def vision_llm(self):
+        """Gemini vision model, loaded on first use"""
+        if self._vision_llm is None:
+            self._vision_llm = load_google_vision_llm()
+        return self._vision_llm
+    
+    @vision_llm.setter
+    def vision_llm(self, llm):
+        self._vision_llm = llm
+    
+    @staticmethod
+    def _ocr_cache_key(image_bytes: bytes):
+        """
+        Content-address an image for the OCR cache
+        
+        The prompt, model and preprocessing settings are part of the key
+        since they change the extracted text.
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return make_key(
+            "ocr", digest, OCR_PROMPT, settings.gemini_model, settings.max_tokens,
+            settings.image_max_dimension, settings.image_grayscale, settings.image_jpeg_quality
+        )
+    
+    def _prepare_image(self, image_bytes: bytes, content_type: str | None = None):
+        """
+        Preprocess an image and record how many bytes it saved
+        
+        Args:
+            image_bytes: Uploaded image bytes
+            content_type: MIME type of the upload, if known
+            
+        Returns:
+            PreparedImage ready for the vision model
+        """
+        # Imported on first use, so Pillow is not loaded at startup
+        from app.services.image_preprocessing import preprocess_image
+
+        prepared = preprocess_image(image_bytes, content_type=content_type)
+        with self._stats_lock:
+            self.preprocess_stats["images"] += 1
+            self.preprocess_stats["bytes_in"] += prepared.original_size
+            self.preprocess_stats["bytes_out"] += len(prepared.data)
+        logger.info(
+            "Image preprocessed: %d -> %d bytes (%d saved, %s)",
+            prepared.original_size, len(prepared.data), prepared.bytes_saved, prepared.mime_type
+        )
+        return prepared
     
-    def extract_text_from_image(self, image_bytes: bytes):
+    def preprocessing_stats(self):
+        """Images preprocessed and the upload bytes saved before vision calls"""
+        with self._stats_lock:
+            stats = dict(self.preprocess_stats)
+        stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+        stats["saved_ratio"] = round(stats["bytes_saved"] / stats["bytes_in"], 4) if stats["bytes_in"] else 0.0
+        return stats
+    
+    def extract_text_from_image(self, image_bytes: bytes, content_type: str | None = None):
         """
         Extract text from medical record image using Gemini Vision
         
         How it works:
-        1. Convert image bytes to base64
-        2. Create a message with image and text prompt
-        3. LLM analyzes image and extracts text
+        1. Return the cached text if these exact bytes were seen before
+        2. Preprocess the image (orientation, size, encoding)
+        3. Create a message with image and text prompt
+        4. LLM analyzes image and extracts text
         
         Args:
             image_bytes: Image file bytes
+            content_type: MIME type of the upload, if known
             
         Returns:
             Extracted text string
         """
+        cache_key = self._ocr_cache_key(image_bytes)
+        cached = self.ocr_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            # Convert image bytes to base64
-            image_b64 = base64.b64encode(image_bytes).decode('utf-8')
-            
-            # Create prompt for text extraction
-            extraction_prompt = """You are a medical text extractor. Extract ALL text from this medical document/record.
-
-Include:
-- Patient information
-- Test results
-- Doctor's notes
-- Prescriptions
-- Dates and measurements
-- Any handwritten text
-
-Format the output clearly and preserve the structure. If text is unclear, indicate with [unclear].
-
-Extract all text now:"""
+            if self.ocr_disk_cache is None:
+                text = self._extract_text(image_bytes, content_type)
+            else:
+                # With the shared backend, one worker process reads the image and the others wait for it
+                text = self.ocr_disk_cache.get_or_compute(
+                    cache_key, lambda: self._extract_text(image_bytes, content_type) or None, max_wait=settings.gemini_timeout
+                )
+        except UpstreamBusyError:
+            raise
+        except Exception as e:
+            raise Exception(f"Image text extraction error: {str(e)}")
+        
+        if text:
+            self.ocr_cache.set(cache_key, text)
+        return text or ""
+    
+    async def aextract_text_from_image(self, image_bytes: bytes, content_type: str | None = None):
+        """
+        Async version of extract_text_from_image()
+        
+        A memory cache hit is answered on the event loop. Otherwise the
+        Gemini slot is waited for there, before the read takes a worker thread.
+        
+        Args:
+            image_bytes: Image file bytes
+            content_type: MIME type of the upload, if known
             
-            # Create message with image
-            message = HumanMessage(
-                content=[
-                    {"type": "text", "text": extraction_prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": f"data:image/jpeg;base64,{image_b64}"
-                    }
-                ]
+        Returns:
+            Extracted text string
+        """
+        cached = self.ocr_cache.get(self._ocr_cache_key(image_bytes))
+        if cached is not None:
+            return cached
+        return await gemini_upstream.run(self.extract_text_from_image, image_bytes, content_type)
+    
+    def _extract_text(self, image_bytes: bytes, content_type: str | None = None):
+        """Send an image to Gemini Vision and return the text it reads"""
+        # Downscale and re-encode before upload
+        prepared = self._prepare_image(image_bytes, content_type)
+        
+        # Create message with image
+        message = HumanMessage(
+            content=[
+                {"type": "text", "text": OCR_PROMPT},
+                {
+                    "type": "image_url",
+                    "image_url": prepared.to_data_url()
+                }
+            ]
+        )
+        
+        # Invoke the vision model (limits, retries, circuit breaker)
+        with observe_stage("vision_ocr"):
+            response = gemini_upstream.call(
+                self.vision_llm.invoke, [message], config={"callbacks": [self._ocr_tokens]}
             )
+        return response.content
+    
+    async def extract_text_from_pages(self, pages: list[bytes], content_types: list[str] | None = None):
+        """
+        Extract text from a multi-page document, one vision call per page
+        
+        Pages are processed concurrently, so the wall-clock time follows the
+        slowest page rather than the sum of all pages.
+        
+        Args:
+            pages: Image bytes for each page, in reading order
+            content_types: MIME type of each page's upload, if known
             
-            # Invoke the vision model
-            response = self.vision_llm.invoke([message])
-            
-            return response.content
-            
-        except Exception as e:
-            raise Exception(f"Image text extraction error: {str(e)}")
+        Returns:
+            Extracted text of all pages joined in page order
+        """
+        content_types = content_types or [None] * len(pages)
+        texts = await asyncio.gather(*(
+            self.aextract_text_from_image(page, content_type)
+            for page, content_type in zip(pages, content_types)
+        ))
+        if len(texts) == 1:
+            return texts[0]
+        return "\n\n".join(
+            f"--- Page {number} ---\n{text}" for number, text in enumerate(texts, start=1)
+        )
     
-    def analyze_image_directly(self, image_bytes: bytes, language: str = "en"):
+    def analyze_image_directly(self, image_bytes: bytes, language: str = "en", content_type: str | None = None):
         """
         Directly analyze medical image and return structured analysis
         
         Args:
             image_bytes: Image file bytes
             language: Response language
+            content_type: MIME type of the upload, if known
             
         Returns:
             Dictionary with analysis
         """
         try:
-            # Convert image to base64
-            image_b64 = base64.b64encode(image_bytes).decode('utf-8')
+            # Downscale and re-encode before upload
+            prepared = self._prepare_image(image_bytes, content_type)
             
             # Create analysis prompt
             if language == "fr":
@@ -109,16 +261,19 @@ Respond ONLY with valid JSON."""
                     {"type": "text", "text": prompt},
                     {
                         "type": "image_url",
-                        "image_url": f"data:image/jpeg;base64,{image_b64}"
+                        "image_url": prepared.to_data_url()
                     }
                 ]
             )
             
-            # Invoke vision model
-            response = self.vision_llm.invoke([message])
+            # Invoke vision model (limits, retries, circuit breaker)
+            with observe_stage("vision_analysis"):
+                response = gemini_upstream.call(
+                    self.vision_llm.invoke, [message],
+                    config={"callbacks": [TokenUsageHandler("vision_analysis", language)]}
+                )
             
             # Parse JSON response
-            import json
             result = json.loads(response.content)
             return result
             
@@ -129,6 +284,8 @@ Respond ONLY with valid JSON."""
                 "recommendations": ["Consult with a healthcare professional"],
                 "next_steps": ["Schedule appointment with your doctor"]
             }
+        except UpstreamBusyError:
+            raise
         except Exception as e:
             raise Exception(f"Image analysis error: {str(e)}")
 
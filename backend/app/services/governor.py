@@ -0,0 +1,591 @@
+"""
+Per-upstream rate limiting and concurrency control
+Keeps Gemini, Tavily and Firecrawl calls within provider quotas
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from app.config import settings
+
+# Governor name -> _Hold for the slots the current context already holds
+# (set by Governor.run() for the worker thread it starts; never mutated)
+_held = contextvars.ContextVar("governor_held", default={})
+
+
+class UpstreamBusyError(Exception):
+    """
+    An upstream has no capacity left for this request
+
+    Routes let it through so the app returns status_code with a
+    Retry-After header instead of a generic 500.
+    """
+
+    def __init__(self, upstream: str, retry_after: int, status_code: int = 503, reason: str = "busy"):
+        """
+        Args:
+            upstream: Name of the upstream (e.g. "gemini")
+            retry_after: Seconds the client should wait before retrying
+            status_code: 503 when queued work is full, 429 when rate limited
+            reason: Short description for the response body
+        """
+        super().__init__(f"{upstream} is {reason}, retry in {retry_after}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """Requests-per-second limiter that hands out reservations"""
+
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate: Tokens added per second
+            burst: Bucket size (requests allowed back to back)
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how long to wait before using it (seconds)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self):
+        """Give back a reserved token that will not be used"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class _Waiter:
+    """A thread or task queued for a slot"""
+
+    __slots__ = ("granted", "wake")
+
+    def __init__(self, wake):
+        self.granted = False
+        self.wake = wake
+
+
+class Slots:
+    """
+    Counting semaphore that threads and asyncio tasks can both wait on
+
+    Slots go to waiters first come, first served. A task waits on a
+    future of its event loop, so a queued coroutine holds no thread.
+    """
+
+    def __init__(self, count: int):
+        """
+        Args:
+            count: Slots available
+        """
+        self._available = count
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Take a free slot if nobody is waiting ahead (under the lock)"""
+        if self._available > 0 and not self._waiters:
+            self._available -= 1
+            return True
+        return False
+
+    def _settle(self, waiter: _Waiter):
+        """After a wait ends: True if the waiter got a slot, otherwise withdraw it"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def acquire(self, timeout: float):
+        """Wait up to timeout seconds for a slot (blocking); True if taken"""
+        with self._lock:
+            if self._take():
+                return True
+            event = threading.Event()
+            waiter = _Waiter(event.set)
+            self._waiters.append(waiter)
+        event.wait(timeout)
+        return self._settle(waiter)
+
+    async def acquire_async(self, timeout: float):
+        """Wait up to timeout seconds for a slot without holding a thread; True if taken"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            try:
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+            except RuntimeError:
+                # The waiter's loop is closed - pass the slot on
+                self.release()
+
+        with self._lock:
+            if self._take():
+                return True
+            waiter = _Waiter(wake)
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._settle(waiter):
+                self.release()
+            raise
+        return self._settle(waiter)
+
+    def release(self):
+        """Hand a slot to the longest waiter, or free it"""
+        with self._lock:
+            if not self._waiters:
+                self._available += 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+        waiter.wake()
+
+
+class _Hold:
+    """
+    A slot taken by Governor.run() for its worker thread
+
+    Calls that outlive fn (a hedged primary still running) share it;
+    the slot is released when the last user is done. Between retries
+    it may be given up for a while (see Governor.pause()).
+    """
+
+    def __init__(self, governor):
+        self.governor = governor
+        self.users = 1
+        self.owned = True
+        self._lock = threading.Lock()
+
+    def share(self):
+        with self._lock:
+            self.users += 1
+
+    def done(self):
+        with self._lock:
+            self.users -= 1
+            release = self.users == 0 and self.owned
+        if release:
+            self.governor.release()
+
+    def suspend(self):
+        """Give the slot up while nobody else uses it; True if it was"""
+        with self._lock:
+            if self.users > 1 or not self.owned or not self.governor._begin_pause():
+                return False
+            self.owned = False
+        self.governor.release()
+        return True
+
+    def resume(self):
+        """
+        Take a slot again after suspend() (blocking)
+
+        Raises:
+            UpstreamBusyError: No slot came free within max_wait
+        """
+        try:
+            self.governor._acquire_slot()
+        finally:
+            self.governor._end_pause()
+        with self._lock:
+            self.owned = True
+
+
+class GovernorStats:
+    """Queue depth and wait time counters for a governor"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "average_wait_seconds": round(self.wait_seconds / self.acquired, 4) if self.acquired else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 4),
+        }
+
+
+class Governor:
+    """
+    Admission control for one upstream service
+
+    How it works:
+    1. A caller joins the wait queue; if the queue is full it is
+       rejected at once with UpstreamBusyError (503). Blocking callers
+       wait in their thread, async callers on the event loop
+    2. It waits up to max_wait for one of max_concurrency slots
+    3. It takes a token from the rate bucket, sleeping until the token is
+       due; a token due after max_wait is rejected with a 429
+    4. The slot is released when the call finishes
+
+    Async code runs blocking calls through run(): the caller waits for
+    a slot on the event loop and only then takes one of the governor's
+    own worker threads, so queued callers never pile up in the default
+    executor and a slow upstream cannot starve asyncio.to_thread().
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        max_concurrency: int,
+        max_queue: int,
+        max_wait: float
+    ):
+        """
+        Args:
+            name: Upstream name used in errors and stats
+            rate: Requests per second (0 = unlimited)
+            burst: Requests allowed back to back
+            max_concurrency: Calls allowed in flight at once
+            max_queue: Callers allowed to wait for a slot
+            max_wait: Longest time a caller may wait in total (seconds)
+        """
+        self.name = name
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.stats = GovernorStats()
+        self._slots = Slots(max_concurrency)
+        self._lock = threading.Lock()
+        # run() only submits work while holding a slot, and pause() only gives
+        # up max_concurrency slots at once: two threads per slot are enough
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2 * max_concurrency, thread_name_prefix=f"governor-{name}"
+        )
+        self._paused = 0
+
+    def _retry_after(self):
+        """Estimate when a rejected caller could get through (whole seconds)"""
+        if self.rate > 0:
+            return max(1, math.ceil((self.stats.queued + 1) / self.rate))
+        return max(1, math.ceil(self.max_wait / 2))
+
+    def _reject(self, status_code: int, reason: str):
+        with self._lock:
+            self.stats.rejected += 1
+            if status_code == 429:
+                self.stats.rate_limited += 1
+        return UpstreamBusyError(self.name, self._retry_after(), status_code, reason)
+
+    def _join_queue(self):
+        """Count the caller as waiting, or reject it if the queue is full"""
+        with self._lock:
+            if self.stats.queued >= self.max_queue and self.stats.in_flight >= self.max_concurrency:
+                full = True
+            else:
+                full = False
+                self.stats.queued += 1
+                self.stats.max_queued = max(self.stats.max_queued, self.stats.queued)
+        if full:
+            raise self._reject(503, "overloaded")
+
+    def _leave_queue(self, acquired: bool):
+        with self._lock:
+            self.stats.queued -= 1
+            if acquired:
+                self.stats.in_flight += 1
+
+    def _reserve_token(self, start: float):
+        """
+        Take a rate token for a caller holding a slot
+
+        Returns:
+            Seconds to wait before the call may start
+
+        Raises:
+            UpstreamBusyError: The token is due after max_wait (the slot is released)
+        """
+        if self.bucket is None:
+            return 0.0
+        delay = self.bucket.reserve()
+        if delay > self.max_wait - (time.monotonic() - start):
+            self.bucket.refund()
+            self.release()
+            raise self._reject(429, "rate limited")
+        return delay
+
+    def _admitted(self, start: float):
+        waited = time.monotonic() - start
+        with self._lock:
+            self.stats.acquired += 1
+            self.stats.wait_seconds += waited
+            self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+
+    def acquire(self):
+        """
+        Wait for a slot and a rate token (blocking)
+
+        Raises:
+            UpstreamBusyError: The queue is full or the wait would be too long
+        """
+        start = time.monotonic()
+        self._acquire_slot()
+
+        delay = self._reserve_token(start)
+        if delay:
+            time.sleep(delay)
+        self._admitted(start)
+
+    def _acquire_slot(self):
+        """Wait for a slot in this thread (no rate token)"""
+        self._join_queue()
+        acquired = False
+        try:
+            acquired = self._slots.acquire(self.max_wait)
+        finally:
+            self._leave_queue(acquired)
+        if not acquired:
+            raise self._reject(503, "overloaded")
+
+    async def _acquire_slot_async(self):
+        """Wait for a slot on the event loop (no rate token)"""
+        self._join_queue()
+        acquired = False
+        try:
+            acquired = await self._slots.acquire_async(self.max_wait)
+        finally:
+            self._leave_queue(acquired)
+        if not acquired:
+            raise self._reject(503, "overloaded")
+
+    async def acquire_async(self):
+        """
+        Wait for a slot and a rate token without holding a thread
+
+        Raises:
+            UpstreamBusyError: The queue is full or the wait would be too long
+        """
+        start = time.monotonic()
+        await self._acquire_slot_async()
+
+        delay = self._reserve_token(start)
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.bucket.refund()
+                self.release()
+                raise
+        self._admitted(start)
+
+    def release(self):
+        """Give back a slot taken by acquire()"""
+        with self._lock:
+            self.stats.in_flight -= 1
+        self._slots.release()
+
+    def _pace(self):
+        """
+        Wait for a rate token inside a slot held by run() (blocking)
+
+        Raises:
+            UpstreamBusyError: The token is due after max_wait
+        """
+        if self.bucket is None:
+            return
+        delay = self.bucket.reserve()
+        if delay > self.max_wait:
+            self.bucket.refund()
+            raise self._reject(429, "rate limited")
+        if delay:
+            time.sleep(delay)
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold a slot for the duration of a blocking call
+
+        Inside run() the slot is already held; the call only waits for
+        its rate token.
+        """
+        if self.name in _held.get():
+            self._pace()
+            yield
+            return
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        """
+        Hold a slot for the duration of an async call
+
+        The wait happens on the event loop, so queued callers hold no
+        worker thread. A task cancelled while waiting gives up its place
+        (or the slot, if it was just handed one).
+        """
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) inside a slot"""
+        with self.slot():
+            return fn(*args, **kwargs)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a blocking fn(*args, **kwargs) in one of the governor's worker
+        threads once a slot is free
+
+        The wait happens on the event loop, so rejected callers get their
+        503 at once and queued ones hold no thread. Calls that fn makes
+        through this governor (slot(), call()) share the slot and each
+        take a rate token. The slot is released when fn returns (or when
+        a call sharing it through share_slot() ends, if that is later),
+        even if the awaiting task was cancelled before that - so the SDK
+        calls fn makes need a timeout of their own.
+
+        Raises:
+            UpstreamBusyError: The queue is full or the wait would be too long
+        """
+        start = time.monotonic()
+        await self._acquire_slot_async()
+        self._admitted(start)
+
+        # Like asyncio.to_thread(), with the slot marked as held in the copied context
+        hold = _Hold(self)
+        context = contextvars.copy_context()
+        context.run(_held.set, {**_held.get(), self.name: hold})
+
+        def work():
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                hold.done()
+
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, work)
+        except BaseException:
+            self.release()
+            raise
+        return await future
+
+    def _begin_pause(self):
+        with self._lock:
+            if self._paused >= self.max_concurrency:
+                return False
+            self._paused += 1
+            return True
+
+    def _end_pause(self):
+        with self._lock:
+            self._paused -= 1
+
+    def pause(self, seconds: float):
+        """
+        Sleep between two attempts of a call (blocking)
+
+        Inside run() the slot is given up for the sleep and waited for
+        again afterwards, so a backoff does not keep other callers out.
+        It is kept while a call sharing it is still running, or while
+        max_concurrency callers are already pausing (each keeps its
+        worker thread).
+
+        Raises:
+            UpstreamBusyError: No slot came free within max_wait afterwards
+        """
+        hold = _held.get().get(self.name)
+        if hold is None or not hold.suspend():
+            time.sleep(seconds)
+            return
+        try:
+            time.sleep(seconds)
+        finally:
+            hold.resume()
+
+    def share_slot(self):
+        """
+        Keep the slot held by run() until a call outliving fn has ended
+
+        Returns:
+            Function to call when that call ends, or None outside run()
+        """
+        hold = _held.get().get(self.name)
+        if hold is None:
+            return None
+        hold.share()
+        return hold.done
+
+    def without_slot(self, fn, *args, **kwargs):
+        """Run fn so that its calls through this governor take a slot of their own"""
+        held = _held.get()
+        token = _held.set({name: hold for name, hold in held.items() if name != self.name})
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _held.reset(token)
+
+
+# Global governors, one per upstream
+gemini_governor = Governor(
+    "gemini",
+    rate=settings.gemini_rate_limit,
+    burst=settings.gemini_burst,
+    max_concurrency=settings.gemini_max_concurrency,
+    max_queue=settings.gemini_max_queue,
+    max_wait=settings.upstream_max_wait
+)
+tavily_governor = Governor(
+    "tavily",
+    rate=settings.tavily_rate_limit,
+    burst=settings.tavily_burst,
+    max_concurrency=settings.tavily_max_concurrency,
+    max_queue=settings.tavily_max_queue,
+    max_wait=settings.upstream_max_wait
+)
+firecrawl_governor = Governor(
+    "firecrawl",
+    rate=settings.firecrawl_rate_limit,
+    burst=settings.firecrawl_burst,
+    max_concurrency=settings.firecrawl_max_concurrency,
+    max_queue=settings.firecrawl_max_queue,
+    max_wait=settings.upstream_max_wait
+)
+governors = {g.name: g for g in (gemini_governor, tavily_governor, firecrawl_governor)}
+
+
+def governor_stats():
+    """Queue depth and wait time of every upstream"""
+    return {name: governor.stats.as_dict() for name, governor in governors.items()}
@@ -0,0 +1,161 @@
+"""
+Image preprocessing before Gemini vision calls
+Fixes orientation, downscales and re-encodes uploads for OCR
+"""
+
+import io
+import base64
+from dataclasses import dataclass
+from PIL import Image, ImageOps, UnidentifiedImageError
+from app.config import settings
+
+# Formats Gemini accepts as-is, so they can be passed through untouched
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+# EXIF tag holding the camera orientation
+EXIF_ORIENTATION = 0x0112
+
+
+@dataclass
+class PreparedImage:
+    """Image bytes ready to send to the vision model"""
+    data: bytes | memoryview
+    mime_type: str
+    original_size: int
+
+    @property
+    def bytes_saved(self):
+        return self.original_size - len(self.data)
+
+    def to_data_url(self):
+        """
+        Encode as a base64 data URL for a LangChain image_url message part
+
+        The base64 bytes are a temporary, so only the final string stays
+        referenced while the vision call runs.
+        """
+        return f"data:{self.mime_type};base64," + base64.b64encode(self.data).decode("ascii")
+
+
+def _flatten(img: Image.Image, grayscale: bool):
+    """Convert to a JPEG-compatible mode, placing transparency on white"""
+    if grayscale:
+        return img.convert("L")
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    if img.mode not in ("RGB", "L"):
+        return img.convert("RGB")
+    return img
+
+
+def _passthrough(img: Image.Image, max_dimension: int, grayscale: bool):
+    """True if the image can be sent as uploaded, without decoding it"""
+    rotated = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+    oversized = max(img.size) > max_dimension
+    return not (rotated or oversized or grayscale) and img.format in PASSTHROUGH_FORMATS
+
+
+def decoded_size(image_head: bytes, max_dimension: int | None = None, grayscale: bool | None = None):
+    """
+    Estimate the memory preprocess_image() needs to decode an image
+
+    Only the header is parsed, so the first few hundred KB of the upload
+    are enough. The estimate is width x height x bytes per pixel of the
+    decoded bitmap (after JPEG draft scaling); Pillow stores 3-band
+    images with 4 bytes per pixel.
+
+    Args:
+        image_head: The start of the uploaded file
+        max_dimension: Longest side in pixels (defaults to settings)
+        grayscale: Convert to grayscale (defaults to settings)
+
+    Returns:
+        Bytes, 0 for images passed through undecoded or not readable by Pillow
+    """
+    max_dimension = max_dimension or settings.image_max_dimension
+    grayscale = settings.image_grayscale if grayscale is None else grayscale
+    try:
+        with Image.open(io.BytesIO(image_head)) as img:
+            if _passthrough(img, max_dimension, grayscale):
+                return 0
+            if max(img.size) > max_dimension and img.format == "JPEG":
+                img.draft("RGB", (max_dimension, max_dimension))
+            width, height = img.size
+            bands = len(img.getbands())
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        # Decoded nowhere (e.g. HEIC), or a header too long to parse from the head
+        return 0
+    return width * height * (1 if bands == 1 else 4)
+
+
+def preprocess_image(
+    image_bytes: bytes,
+    max_dimension: int | None = None,
+    grayscale: bool | None = None,
+    quality: int | None = None,
+    content_type: str | None = None
+):
+    """
+    Prepare an uploaded image for OCR
+
+    How it works:
+    1. Decode once (JPEGs are decoded at reduced scale when oversized)
+    2. Apply the EXIF orientation
+    3. Downscale so the longest side fits max_dimension
+    4. Optionally convert to grayscale and re-encode as JPEG
+
+    Images that need none of this and are already in a format Gemini
+    accepts are passed through without re-encoding, and so are those
+    whose re-encoded JPEG would not be smaller (unless they needed
+    rotating).
+
+    Args:
+        image_bytes: Uploaded image bytes
+        max_dimension: Longest side in pixels (defaults to settings)
+        grayscale: Convert to grayscale (defaults to settings)
+        quality: JPEG quality (defaults to settings)
+        content_type: MIME type of the upload, sent with images Pillow
+            cannot decode (JPEG if unknown)
+
+    Returns:
+        PreparedImage with the bytes to send and the correct MIME type
+    """
+    max_dimension = max_dimension or settings.image_max_dimension
+    grayscale = settings.image_grayscale if grayscale is None else grayscale
+    quality = quality or settings.image_jpeg_quality
+    original_size = len(image_bytes)
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            source_format = img.format
+            oversized = max(img.size) > max_dimension
+            rotated = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+
+            if _passthrough(img, max_dimension, grayscale):
+                return PreparedImage(image_bytes, PASSTHROUGH_FORMATS[source_format], original_size)
+
+            # Let the JPEG decoder skip detail we are about to throw away
+            if oversized and source_format == "JPEG":
+                img.draft("RGB", (max_dimension, max_dimension))
+
+            processed = ImageOps.exif_transpose(img)
+            processed.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            processed = _flatten(processed, grayscale)
+
+            buffer = io.BytesIO()
+            processed.save(buffer, format="JPEG", quality=quality, optimize=True)
+            # View the encoder output in place instead of copying it out
+            encoded = buffer.getbuffer()
+    except (UnidentifiedImageError, OSError):
+        # Not decodable by Pillow (e.g. HEIC) - let the model try the raw bytes
+        return PreparedImage(image_bytes, content_type or "image/jpeg", original_size)
+
+    # Re-encoding did not pay off (e.g. a small, already well compressed
+    # image) - send the upload itself unless it needed rotating for OCR
+    if len(encoded) >= original_size and source_format in PASSTHROUGH_FORMATS and not rotated:
+        return PreparedImage(image_bytes, PASSTHROUGH_FORMATS[source_format], original_size)
+
+    return PreparedImage(encoded, "image/jpeg", original_size)
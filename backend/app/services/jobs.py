@@ -0,0 +1,503 @@
+"""
+Background jobs for slow requests
+A SQLite job store and a bounded pool of asyncio workers, so clients can
+submit research or document analysis and collect the result later
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from app.config import settings
+from app.services.governor import UpstreamBusyError
+
+logger = logging.getLogger(__name__)
+
+# Seconds between deletions of expired jobs and checks for abandoned ones
+PURGE_INTERVAL = 60
+
+# Seconds between store reads while long-polling a job another process runs
+WAIT_POLL_INTERVAL = 1.0
+
+FINISHED_STATES = ("done", "failed")
+
+
+class JobStore:
+    """
+    Job state in a SQLite file, so results survive a restart
+
+    Uploaded inputs (e.g. document pages) are kept as blobs until the
+    job finishes. The database runs in WAL mode so status reads do not
+    wait for workers writing results.
+
+    Several processes may share the file. A job is run by whichever
+    process claims it first: the claim sets the owner and a lease in one
+    conditional UPDATE, the owner renews the lease while the job runs,
+    and only the owner can record the outcome. Running jobs whose lease
+    has expired (their process died) are queued again.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, state TEXT NOT NULL, payload TEXT NOT NULL, "
+            "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, owner TEXT, lease_until REAL);"
+            "CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, created_at);"
+            "CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs(finished_at);"
+            "CREATE TABLE IF NOT EXISTS job_inputs ("
+            "job_id TEXT NOT NULL, position INTEGER NOT NULL, data BLOB NOT NULL, "
+            "PRIMARY KEY (job_id, position));"
+        )
+        # Files created before leases existed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.commit()
+
+    @staticmethod
+    def _to_dict(row):
+        job_id, kind, state, payload, result, error, attempts, created_at, started_at, finished_at = row
+        return {
+            "id": job_id,
+            "kind": kind,
+            "state": state,
+            "payload": json.loads(payload),
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "attempts": attempts,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+
+    def create(self, kind: str, payload: dict, inputs: list[bytes] = ()):
+        """
+        Store a new queued job
+
+        Args:
+            kind: Registered job kind
+            payload: JSON-serializable job parameters
+            inputs: Binary inputs, kept until the job finishes
+
+        Returns:
+            The job as a dict
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, state, payload, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), now)
+            )
+            self._conn.executemany(
+                "INSERT INTO job_inputs (job_id, position, data) VALUES (?, ?, ?)",
+                [(job_id, position, data) for position, data in enumerate(inputs)]
+            )
+            self._conn.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        """Return the job as a dict, or None if unknown or expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, state, payload, result, error, attempts, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def inputs(self, job_id: str):
+        """Binary inputs of a job, in submission order"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM job_inputs WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+        return [data for (data,) in rows]
+
+    def claim(self, job_id: str, owner: str, lease: float):
+        """
+        Take a queued job for running
+
+        Args:
+            job_id: Job to run
+            owner: ID of the claiming worker process
+            lease: Seconds the claim holds unless renewed
+
+        Returns:
+            True if claimed, False if another process got it first (or
+            it is no longer queued)
+        """
+        now = time.time()
+        with self._lock:
+            claimed = self._conn.execute(
+                "UPDATE jobs SET state = 'running', owner = ?, lease_until = ?, started_at = ? "
+                "WHERE id = ? AND state = 'queued'",
+                (owner, now + lease, now, job_id)
+            ).rowcount
+            self._conn.commit()
+        return claimed == 1
+
+    def renew(self, job_id: str, owner: str, lease: float, attempt: bool = False):
+        """
+        Extend the lease on a running job
+
+        Args:
+            job_id: Running job
+            owner: ID of the worker process that claimed it
+            lease: Seconds from now the claim holds
+            attempt: Also count a new attempt
+
+        Returns:
+            False if the job is no longer held by this owner
+        """
+        with self._lock:
+            renewed = self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, attempts = attempts + ? "
+                "WHERE id = ? AND owner = ? AND state = 'running'",
+                (time.time() + lease, int(attempt), job_id, owner)
+            ).rowcount
+            self._conn.commit()
+        return renewed == 1
+
+    def finish(self, job_id: str, owner: str, result: dict | None = None, error: str | None = None):
+        """
+        Record the outcome of a job and drop its inputs
+
+        Returns:
+            False if the job is no longer held by this owner (nothing is written)
+        """
+        with self._lock:
+            finished = self._conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND owner = ? AND state = 'running'",
+                (
+                    "failed" if error is not None else "done",
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error, time.time(), job_id, owner
+                )
+            ).rowcount
+            if finished:
+                self._conn.execute("DELETE FROM job_inputs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+        return finished == 1
+
+    def release(self, owner: str):
+        """Queue again the running jobs of an owner that is shutting down"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'queued', owner = NULL, lease_until = NULL "
+                "WHERE owner = ? AND state = 'running'", (owner,)
+            )
+            self._conn.commit()
+
+    def recover(self):
+        """
+        Requeue running jobs whose lease expired (their process died)
+
+        Jobs of live processes keep their lease and are left alone.
+
+        Returns:
+            IDs of all queued jobs, oldest first
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'queued', owner = NULL, lease_until = NULL "
+                "WHERE state = 'running' AND (lease_until IS NULL OR lease_until < ?)", (time.time(),)
+            )
+            self._conn.commit()
+            rows = self._conn.execute("SELECT id FROM jobs WHERE state = 'queued' ORDER BY created_at").fetchall()
+        return [job_id for (job_id,) in rows]
+
+    def purge(self, retention: float):
+        """
+        Delete jobs that finished more than retention seconds ago
+
+        Returns:
+            Number of jobs deleted
+        """
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (time.time() - retention,)
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def counts(self):
+        """Number of jobs in each state"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+
+class JobQueue:
+    """
+    Bounded pool of asyncio workers running stored jobs
+
+    How it works:
+    1. submit() stores the job and puts its ID on an in-memory queue;
+       the caller gets the ID back at once
+    2. A fixed number of workers take IDs off the queue, claim the job in
+       the store (skipping it if another process claimed it first) and
+       run the handler registered for the job's kind, renewing the
+       claim's lease while it runs
+    3. When an upstream is busy, the worker waits its Retry-After and
+       tries again (up to max_attempts) - nobody is waiting on an open
+       connection, so backing off costs the client nothing
+    4. Results and errors are written to the store; waiters are woken up
+    5. On start and then periodically, queued jobs and running jobs whose
+       lease expired are queued again, and finished jobs are deleted after
+       the retention period
+    """
+
+    def __init__(
+        self, store: JobStore, workers: int, max_queued: int, max_attempts: int, retention: float, lease: float
+    ):
+        """
+        Args:
+            store: Where job state is kept
+            workers: Jobs run at the same time
+            max_queued: Jobs waiting before submissions are rejected
+            max_attempts: Tries per job when upstreams are busy
+            retention: Seconds finished jobs are kept
+            lease: Seconds a claimed job stays with this process without
+                a renewal (renewed every third of it)
+        """
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.max_attempts = max(1, max_attempts)
+        self.retention = retention
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers = {}
+        self._queue = None
+        self._queued = set()  # IDs on the in-memory queue, so recovery does not add them twice
+        self._tasks = []
+        self._finished = {}  # job ID -> set of asyncio.Event, one per waiter
+
+    def register(self, kind: str, handler):
+        """
+        Add a job kind
+
+        Args:
+            kind: Job kind name
+            handler: Coroutine function (payload, inputs) -> JSON-serializable result
+        """
+        self._handlers[kind] = handler
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _recover(self):
+        for job_id in await asyncio.to_thread(self.store.recover):
+            self._enqueue(job_id)
+
+    async def start(self):
+        """Requeue unfinished jobs and start the workers"""
+        self._queue = asyncio.Queue()
+        self._queued = set()
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintenance_loop()))
+        logger.info("Job workers started (%d, %d jobs queued)", self.workers, self._queue.qsize())
+
+    async def stop(self):
+        """
+        Stop the workers
+
+        Jobs interrupted here are handed back to the queue in the store,
+        for a sibling process or the next start() to run.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self.store.release, self.owner)
+
+    async def submit(self, kind: str, payload: dict, inputs: list[bytes] = ()):
+        """
+        Store a job and queue it
+
+        Args:
+            kind: Registered job kind
+            payload: JSON-serializable job parameters
+            inputs: Binary inputs for the job
+
+        Returns:
+            The job as a dict
+
+        Raises:
+            UpstreamBusyError: Too many jobs are already waiting
+        """
+        if kind not in self._handlers:
+            raise KeyError(f"Unknown job kind: {kind}")
+        if self._queue is None:
+            raise RuntimeError("Job workers are not running")
+        if self._queue.qsize() >= self.max_queued:
+            raise UpstreamBusyError("jobs", retry_after=30, status_code=503, reason="overloaded")
+        job = await asyncio.to_thread(self.store.create, kind, payload, inputs)
+        self._enqueue(job["id"])
+        return job
+
+    async def wait(self, job_id: str, timeout: float):
+        """
+        Wait up to timeout seconds for a job to finish
+
+        Jobs run by this process wake the waiter at once; jobs run by a
+        sibling process are noticed by re-reading the store every second.
+
+        Returns:
+            The job as a dict (None if unknown), finished or not
+        """
+        event = asyncio.Event()
+        self._finished.setdefault(job_id, set()).add(event)
+        try:
+            deadline = time.monotonic() + timeout
+            # Checked after registering, so a job finishing in between is not missed
+            job = await asyncio.to_thread(self.store.get, job_id)
+            while job is not None and job["state"] not in FINISHED_STATES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), min(remaining, WAIT_POLL_INTERVAL))
+                except asyncio.TimeoutError:
+                    pass
+                job = await asyncio.to_thread(self.store.get, job_id)
+            return job
+        finally:
+            # Also when a sibling process ran the job or the wait timed out
+            events = self._finished.get(job_id)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self._finished[job_id]
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                # Never lose the worker; the job is failed below if possible
+                logger.exception("Job %s crashed", job_id)
+                await asyncio.to_thread(self.store.finish, job_id, self.owner, None, f"Job error: {str(e)}")
+            finally:
+                self._queue.task_done()
+            for event in self._finished.pop(job_id, ()):
+                event.set()
+
+    async def _heartbeat(self, job_id: str, attempts: asyncio.Task):
+        """Renew the lease on a running job until cancelled; stop the job if the lease is lost"""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                if not await asyncio.to_thread(self.store.renew, job_id, self.owner, self.lease):
+                    # Another process may have claimed the job - do not run it twice
+                    logger.warning("Job %s lease lost; cancelling it", job_id)
+                    attempts.cancel()
+                    return
+            except Exception as e:
+                logger.warning("Job %s lease renewal error: %s", job_id, e)
+
+    async def _run(self, job_id: str):
+        """Run one job to completion, retrying while upstreams are busy"""
+        if not await asyncio.to_thread(self.store.claim, job_id, self.owner, self.lease):
+            # Finished, expired, or claimed by another process
+            return
+        attempts = asyncio.create_task(self._attempts(job_id))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, attempts))
+        try:
+            await attempts
+        except asyncio.CancelledError:
+            # Cancelled by the heartbeat: the worker carries on with the next job
+            if not (attempts.cancelled() and heartbeat.done()):
+                raise
+        finally:
+            heartbeat.cancel()
+
+    async def _attempts(self, job_id: str):
+        job = await asyncio.to_thread(self.store.get, job_id)
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            await asyncio.to_thread(self.store.finish, job_id, self.owner, None, f"Unknown job kind: {job['kind']}")
+            return
+        if job["attempts"] >= self.max_attempts:
+            # Requeued by recover() after its attempts ran out - e.g. the job
+            # keeps taking its worker process down with it
+            await asyncio.to_thread(
+                self.store.finish, job_id, self.owner, None, f"Job gave up after {job['attempts']} attempts"
+            )
+            return
+        inputs = await asyncio.to_thread(self.store.inputs, job_id)
+
+        # Attempts made before a recovery count towards max_attempts
+        for attempt in range(job["attempts"], self.max_attempts):
+            await asyncio.to_thread(self.store.renew, job_id, self.owner, self.lease, True)
+            try:
+                result = await handler(job["payload"], inputs)
+            except UpstreamBusyError as e:
+                if attempt + 1 < self.max_attempts:
+                    logger.info("Job %s waiting %ss: %s", job_id, e.retry_after, e)
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                error = str(e)
+            except Exception as e:
+                # HTTPException from a reused route handler carries its message in detail
+                error = str(getattr(e, "detail", None) or e)
+            else:
+                await asyncio.to_thread(self.store.finish, job_id, self.owner, result)
+                return
+            await asyncio.to_thread(self.store.finish, job_id, self.owner, None, error)
+            return
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(PURGE_INTERVAL)
+            try:
+                deleted = await asyncio.to_thread(self.store.purge, self.retention)
+                if deleted:
+                    logger.info("Deleted %d expired jobs", deleted)
+                # Jobs of processes that died, or queued by one that has not run them yet
+                await self._recover()
+            except Exception as e:
+                logger.warning("Job maintenance error: %s", e)
+
+    def stats(self):
+        """Workers, queue length and jobs per state (blocking: queries the store)"""
+        return {
+            "workers": self.workers,
+            "queued_in_memory": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": self.store.counts(),
+        }
+
+
+# Global job queue (workers are started by the app's lifespan handler)
+job_queue = JobQueue(
+    JobStore(os.path.join(settings.cache_dir, "jobs.sqlite3")),
+    workers=settings.job_workers,
+    max_queued=settings.job_max_queued,
+    max_attempts=settings.job_max_attempts,
+    retention=settings.job_retention,
+    lease=settings.job_lease
+)
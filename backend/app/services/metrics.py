@@ -0,0 +1,266 @@
+"""
+Prometheus metrics
+Request and per-stage latency histograms, LLM token counters, and the
+cache / upstream counters the services already keep
+"""
+
+import time
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from app.utils.timing import record
+
+# Our own registry, so only this app's series are exported
+registry = CollectorRegistry()
+
+# Upstream and LLM calls take from tens of milliseconds to a minute
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUEST_SECONDS = Histogram(
+    "travel_http_request_duration_seconds",
+    "HTTP request latency by route (whole stream for SSE endpoints)",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry
+)
+STAGE_SECONDS = Histogram(
+    "travel_stage_duration_seconds",
+    "Latency of a pipeline stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry
+)
+CHAIN_SECONDS = Histogram(
+    "travel_chain_invoke_duration_seconds",
+    "Latency of an LLM chain call, including retries",
+    ["chain", "language"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry
+)
+LLM_TOKENS = Counter(
+    "travel_llm_tokens",
+    "LLM tokens used, by chain, language and direction",
+    ["chain", "language", "direction"],
+    registry=registry
+)
+
+# Pre-bound children keep the hot path to a dict lookup and an observe()
+STAGES = (
+    "tavily_search", "firecrawl_scrape", "vision_ocr", "vision_analysis",
+    "output_parse", "context_assembly", "index_retrieve"
+)
+_stage_histograms = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+
+# Server-Timing name of each stage (None = covered by a route-level entry)
+SERVER_TIMING_NAMES = {
+    "tavily_search": "search",
+    "firecrawl_scrape": None,
+    "vision_ocr": "ocr",
+    "vision_analysis": "vision",
+    "output_parse": "parse",
+    "context_assembly": "prompt_build",
+    "index_retrieve": "retrieve",
+}
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """
+    Time a pipeline stage (histogram and Server-Timing entry)
+
+    Args:
+        stage: One of STAGES
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _stage_histograms[stage].observe(elapsed)
+        if SERVER_TIMING_NAMES[stage]:
+            record(SERVER_TIMING_NAMES[stage], elapsed)
+
+
+@contextmanager
+def observe_chain(chain: str, language: str):
+    """
+    Time an LLM chain call (histogram and "llm" Server-Timing entry)
+
+    Args:
+        chain: Chain type (e.g. "chat", "analysis")
+        language: Prompt language
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        CHAIN_SECONDS.labels(chain, language).observe(elapsed)
+        record("llm", elapsed, f"{chain}/{language}")
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """
+    LangChain callback that counts the tokens reported by the model
+
+    One handler is attached per chain and language when the chain is
+    built, so nothing is allocated per request.
+    """
+
+    def __init__(self, chain: str, language: str):
+        """
+        Args:
+            chain: Chain type used as the metric label
+            language: Prompt language used as the metric label
+        """
+        self._input = LLM_TOKENS.labels(chain, language, "input")
+        self._output = LLM_TOKENS.labels(chain, language, "output")
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self._input.inc(usage.get("input_tokens", 0))
+                    self._output.inc(usage.get("output_tokens", 0))
+
+
+class ServiceStatsCollector:
+    """
+    Export the counters the services already keep, read at scrape time
+
+    Cache hit ratios, coalesced requests, governor queues, upstream
+    failures and image preprocessing savings cost nothing extra on the
+    request path this way.
+    """
+
+    def collect(self):
+        # Imported here: the services import this module for their timers
+        from app.services.response_cache import response_cache
+        from app.services.semantic_cache import semantic_cache
+        from app.services.tavily_service import tavily_service
+        from app.services.firecrawl_service import firecrawl_service
+        from app.services.gemini_service import gemini_service
+        from app.services.singleflight import flights
+        from app.services.governor import governors
+        from app.services.resilience import upstreams
+
+        caches = {f"response_{endpoint}": stats for endpoint, stats in response_cache.stats.items()}
+        caches["semantic"] = semantic_cache.stats
+        caches["tavily"] = tavily_service.cache.stats
+        caches["pages"] = firecrawl_service.page_cache.stats
+        caches["ocr"] = gemini_service.ocr_cache.stats
+
+        hits = CounterMetricFamily("travel_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("travel_cache_misses", "Cache misses", labels=["cache"])
+        ratio = GaugeMetricFamily("travel_cache_hit_ratio", "Cache hit ratio since start", labels=["cache"])
+        for name, stats in caches.items():
+            hits.add_metric([name], stats.hits)
+            misses.add_metric([name], stats.misses)
+            ratio.add_metric([name], stats.hit_ratio)
+        yield hits
+        yield misses
+        yield ratio
+
+        coalesced = CounterMetricFamily(
+            "travel_singleflight_coalesced", "Calls that joined an identical in-flight call", labels=["group"]
+        )
+        for name, flight in flights.items():
+            coalesced.add_metric([name], flight.stats.coalesced)
+        yield coalesced
+
+        queued = GaugeMetricFamily("travel_upstream_queued", "Callers waiting for an upstream slot", labels=["upstream"])
+        in_flight = GaugeMetricFamily("travel_upstream_in_flight", "Upstream calls in flight", labels=["upstream"])
+        rejected = CounterMetricFamily(
+            "travel_upstream_rejected", "Calls rejected by admission control", labels=["upstream"]
+        )
+        waited = CounterMetricFamily(
+            "travel_upstream_wait_seconds", "Time spent waiting for an upstream slot", labels=["upstream"]
+        )
+        for name, governor in governors.items():
+            queued.add_metric([name], governor.stats.queued)
+            in_flight.add_metric([name], governor.stats.in_flight)
+            rejected.add_metric([name], governor.stats.rejected)
+            waited.add_metric([name], governor.stats.wait_seconds)
+        yield queued
+        yield in_flight
+        yield rejected
+        yield waited
+
+        errors = CounterMetricFamily(
+            "travel_upstream_errors", "Failed upstream attempts", labels=["upstream", "kind"]
+        )
+        retries = CounterMetricFamily("travel_upstream_retries", "Retried upstream attempts", labels=["upstream"])
+        hedges = CounterMetricFamily("travel_upstream_hedges", "Hedged duplicate requests", labels=["upstream"])
+        circuit = GaugeMetricFamily(
+            "travel_upstream_circuit_open", "1 while the circuit breaker is not closed", labels=["upstream"]
+        )
+        for name, upstream in upstreams.items():
+            errors.add_metric([name, "transient"], upstream.stats.failures)
+            errors.add_metric([name, "permanent"], upstream.stats.permanent_failures)
+            errors.add_metric([name, "short_circuited"], upstream.stats.short_circuited)
+            retries.add_metric([name], upstream.stats.retries)
+            hedges.add_metric([name], upstream.stats.hedges)
+            circuit.add_metric([name], 0 if upstream.breaker.state == "closed" else 1)
+        yield errors
+        yield retries
+        yield hedges
+        yield circuit
+
+        preprocessing = gemini_service.preprocessing_stats()
+        images = CounterMetricFamily(
+            "travel_image_preprocess_images", "Images preprocessed before vision calls"
+        )
+        images.add_metric([], preprocessing["images"])
+        image_bytes = CounterMetricFamily(
+            "travel_image_preprocess_bytes", "Image bytes before (in) and after (out) preprocessing",
+            labels=["direction"]
+        )
+        image_bytes.add_metric(["in"], preprocessing["bytes_in"])
+        image_bytes.add_metric(["out"], preprocessing["bytes_out"])
+        yield images
+        yield image_bytes
+
+
+registry.register(ServiceStatsCollector())
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency per route template
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streaming responses are
+    passed through untouched and the overhead is two clock reads.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Route templates keep the label set small; unknown paths share one label
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - start)
+
+
+def render_metrics():
+    """Return (body, content type) in the Prometheus text format"""
+    return generate_latest(registry), CONTENT_TYPE_LATEST
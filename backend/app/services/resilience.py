@@ -0,0 +1,451 @@
+"""
+Resilience for upstream calls
+Classified retries, circuit breaking and hedged requests, shared by the
+services (Tavily, Firecrawl, Gemini vision) and the chains (Gemini text)
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from app.config import settings
+from app.services.governor import (
+    Governor, UpstreamBusyError, gemini_governor, tavily_governor, firecrawl_governor
+)
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: rate limited, or the provider is struggling
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# Exception class names used by the provider SDKs for transient failures
+# (google.api_core, httpx, requests) - matched by name so no SDK is imported
+RETRYABLE_NAMES = {
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+    "TooManyRequests", "BadGateway", "GatewayTimeout",
+    "ConnectError", "ConnectTimeout", "ReadTimeout", "WriteTimeout", "PoolTimeout",
+    "RemoteProtocolError", "ConnectionError", "Timeout",
+}
+
+
+def _status_code(exc: BaseException):
+    """Find an HTTP status code on an SDK exception, if it carries one"""
+    for source in (exc, getattr(exc, "response", None)):
+        for attribute in ("status_code", "code", "status"):
+            value = getattr(source, attribute, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def is_retryable(exc: BaseException):
+    """
+    Decide whether a failed upstream call is worth retrying
+
+    Timeouts, connection errors, 429 and 5xx responses are transient.
+    Everything else (bad requests, auth errors, our own admission
+    control) fails the same way on every attempt.
+
+    Args:
+        exc: Exception raised by the call
+
+    Returns:
+        True if the call may succeed when retried
+    """
+    if isinstance(exc, UpstreamBusyError):
+        return False
+    if isinstance(exc, (TimeoutError, ConnectionError, concurrent.futures.TimeoutError)):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in RETRYABLE_NAMES for cls in type(exc).__mro__)
+
+
+def backoff_delay(attempt: int, base: float, cap: float):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2^attempt))"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitOpenError(UpstreamBusyError):
+    """The upstream failed repeatedly and is not being called for now"""
+
+    def __init__(self, upstream: str, retry_after: int):
+        super().__init__(upstream, retry_after, status_code=503, reason="unavailable")
+
+
+class CircuitBreaker:
+    """
+    Fail fast while an upstream is down
+
+    How it works:
+    - closed: calls go through; consecutive transient failures are counted
+    - open: after failure_threshold of them, calls fail at once with
+      CircuitOpenError until reset_timeout has passed
+    - half-open: one trial call is let through; success closes the
+      circuit, failure opens it again
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        """
+        Args:
+            name: Upstream name
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds to stay open before a trial call
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpenError: The circuit is open (or a trial call is running)
+        """
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpenError(self.name, max(1, math.ceil(remaining)))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened += 1
+                    logger.warning("Circuit for %s opened after %d failures", self.name, self.failures)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def record_neutral(self):
+        """A call ended without telling us anything about the upstream's health"""
+        with self._lock:
+            self._trial_running = False
+
+
+class LatencyTracker:
+    """Recent call latencies, for picking the hedge delay"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float):
+        """Latency at percentile p (0-100), or None without enough samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < 20:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+class UpstreamStats:
+    """Retry and hedging counters for an upstream"""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.permanent_failures = 0
+        self.short_circuited = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class Upstream:
+    """
+    Resilient calls to one upstream provider
+
+    How it works:
+    1. The circuit breaker rejects the call at once if the upstream is down
+    2. The governor admits it within the rate and concurrency limits
+    3. Transient failures are retried with jittered exponential backoff;
+       other failures are raised straight away
+    4. With hedge=True, a duplicate request is started if the first has
+       not answered by the hedge percentile of recent latencies, and the
+       first successful answer wins
+    """
+
+    def __init__(
+        self,
+        name: str,
+        governor: Governor,
+        attempts: int,
+        base_delay: float,
+        max_delay: float,
+        failure_threshold: int,
+        reset_timeout: float,
+        hedge_percentile: float | None = None,
+        hedge_min_delay: float = 0.0
+    ):
+        """
+        Args:
+            name: Upstream name
+            governor: Admission control for the upstream
+            attempts: Total attempts per call (1 = no retries)
+            base_delay: First backoff step in seconds
+            max_delay: Longest backoff in seconds
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open
+            hedge_percentile: Latency percentile that triggers a hedge (None = never)
+            hedge_min_delay: Never hedge sooner than this (seconds)
+        """
+        self.name = name
+        self.governor = governor
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.latency = LatencyTracker()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.stats = UpstreamStats()
+        # Threads for hedged calls: a primary and a duplicate per slot at most
+        # (the blocking SDK calls cannot be cancelled, their timeouts end them)
+        self._hedge_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2 * governor.max_concurrency, thread_name_prefix=f"hedge-{name}"
+        ) if hedge_percentile is not None else None
+
+    def _timed(self, fn, *args, **kwargs):
+        """One governed attempt, recording its latency on success"""
+        start = time.monotonic()
+        result = self.governor.call(fn, *args, **kwargs)
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def hedge_delay(self):
+        """Seconds to wait before sending a duplicate request"""
+        observed = self.latency.percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, observed or 0.0)
+
+    def _submit_primary(self, fn, *args, **kwargs):
+        """
+        Start the first request of a hedged call
+
+        Inside Governor.run() it shares the slot run() holds, and keeps it
+        until it ends - even when the duplicate wins and fn returns first.
+        """
+        release = self.governor.share_slot()
+        try:
+            primary = self._hedge_executor.submit(
+                contextvars.copy_context().run, self._timed, fn, *args, **kwargs
+            )
+        except BaseException:
+            if release:
+                release()
+            raise
+        if release:
+            primary.add_done_callback(lambda _: release())
+        return primary
+
+    def _hedged(self, fn, *args, **kwargs):
+        """Run fn, and a duplicate of it if the first is slow; first success wins"""
+        primary = self._submit_primary(fn, *args, **kwargs)
+        done, _ = concurrent.futures.wait([primary], timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+
+        # The duplicate takes a slot of its own
+        self.stats.hedges += 1
+        hedge = self._hedge_executor.submit(
+            contextvars.copy_context().run, self.governor.without_slot, self._timed, fn, *args, **kwargs
+        )
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            self.stats.hedge_wins += 1
+                        return future.result()
+                    error = error or future.exception()
+            raise error
+        finally:
+            # A duplicate still queued for a thread is not sent at all
+            for future in pending:
+                future.cancel()
+
+    def _before_attempt(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.stats.short_circuited += 1
+            raise
+
+    def _after_failure(self, exc: Exception, attempt: int):
+        """Record a failed attempt and return the backoff, or None to give up"""
+        if not is_retryable(exc):
+            self.breaker.record_neutral()
+            if not isinstance(exc, UpstreamBusyError):
+                self.stats.permanent_failures += 1
+            return None
+        self.breaker.record_failure()
+        self.stats.failures += 1
+        if attempt + 1 >= self.attempts:
+            return None
+        self.stats.retries += 1
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        logger.info("Retrying %s in %.2fs after: %s", self.name, delay, exc)
+        return delay
+
+    def call(self, fn, *args, hedge: bool = False, **kwargs):
+        """
+        Call fn(*args, **kwargs) with circuit breaking, limits and retries
+
+        Args:
+            fn: Blocking upstream call
+            hedge: Send a duplicate request when the first one is slow
+
+        Returns:
+            The call's result
+        """
+        self.stats.calls += 1
+        run = self._hedged if hedge and self.hedge_percentile is not None else self._timed
+        for attempt in range(self.attempts):
+            self._before_attempt()
+            try:
+                result = run(fn, *args, **kwargs)
+            except Exception as e:
+                delay = self._after_failure(e, attempt)
+                if delay is None:
+                    raise
+                # Inside Governor.run() the slot is free for others meanwhile
+                self.governor.pause(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, fn, *args, **kwargs):
+        """
+        Async version of call() for coroutine functions (no hedging)
+
+        Args:
+            fn: Coroutine function making the upstream call
+
+        Returns:
+            The call's result
+        """
+        self.stats.calls += 1
+        for attempt in range(self.attempts):
+            self._before_attempt()
+            try:
+                async with self.governor.aslot():
+                    start = time.monotonic()
+                    result = await fn(*args, **kwargs)
+                    self.latency.record(time.monotonic() - start)
+            except Exception as e:
+                delay = self._after_failure(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a blocking function that calls this upstream, from async code
+
+        fn runs in a worker thread once the governor has a slot for it;
+        its call() attempts share that slot (see Governor.run()).
+
+        Args:
+            fn: Blocking function making call()s to this upstream
+
+        Returns:
+            fn's result
+        """
+        return await self.governor.run(fn, *args, **kwargs)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """
+        Circuit breaking and limits around a streamed call
+
+        Streams are not retried - part of the answer may already have
+        been sent - but their failures still count towards the circuit.
+        """
+        self.stats.calls += 1
+        self._before_attempt()
+        try:
+            async with self.governor.aslot():
+                yield
+        except Exception as e:
+            self._after_failure(e, self.attempts)
+            raise
+        except BaseException:
+            self.breaker.record_neutral()
+            raise
+        self.breaker.record_success()
+
+
+def _upstream(name: str, governor: Governor, **hedging):
+    return Upstream(
+        name,
+        governor,
+        attempts=settings.upstream_retry_attempts,
+        base_delay=settings.upstream_retry_base_delay,
+        max_delay=settings.upstream_retry_max_delay,
+        failure_threshold=settings.circuit_failure_threshold,
+        reset_timeout=settings.circuit_reset_timeout,
+        **hedging
+    )
+
+
+# Global upstreams
+gemini_upstream = _upstream("gemini", gemini_governor)
+tavily_upstream = _upstream("tavily", tavily_governor)
+firecrawl_upstream = _upstream(
+    "firecrawl",
+    firecrawl_governor,
+    hedge_percentile=settings.scrape_hedge_percentile if settings.scrape_hedge_enabled else None,
+    hedge_min_delay=settings.scrape_hedge_min_delay
+)
+upstreams = {u.name: u for u in (gemini_upstream, tavily_upstream, firecrawl_upstream)}
+
+
+def resilience_stats():
+    """Retry, hedging and circuit breaker state of every upstream"""
+    return {
+        name: {
+            **upstream.stats.as_dict(),
+            "circuit": upstream.breaker.state,
+            "circuit_opened": upstream.breaker.opened,
+            "hedge_delay_seconds": round(upstream.hedge_delay(), 3) if upstream.hedge_percentile else None,
+        }
+        for name, upstream in upstreams.items()
+    }
@@ -0,0 +1,128 @@
+"""
+Response cache for the chat and analysis chains
+Avoids a Gemini round-trip for repeated questions and documents
+"""
+
+import re
+from app.config import settings
+from app.services.cache import CacheStats, create_cache, make_key
+
+
+def normalize_text(text: str, casefold: bool = True):
+    """
+    Normalize user input so trivially different inputs share a cache entry
+
+    Args:
+        text: Raw input text
+        casefold: Also ignore case (safe for questions, not for documents
+            with confirmation codes)
+
+    Returns:
+        Normalized text
+    """
+    text = re.sub(r"\s+", " ", text).strip()
+    if casefold:
+        text = text.casefold().rstrip("?!. ")
+    return text
+
+
+class ResponseCache:
+    """
+    Cache of LLM responses keyed by endpoint, normalized input,
+    language and model settings
+
+    Each endpoint has its own TTL and hit/miss counters.
+    """
+
+    def __init__(self, backend: str, max_entries: int, ttls: dict):
+        """
+        Args:
+            backend: Cache backend name ("memory", "disk" or "shared")
+            max_entries: Size bound shared by all endpoints
+            ttls: Time-to-live in seconds per endpoint
+        """
+        self.cache = create_cache(backend, "responses", max_entries)
+        self.ttls = ttls
+        self.stats = {endpoint: CacheStats() for endpoint in ttls}
+
+    @staticmethod
+    def model_config():
+        """Model settings that change the generated answer"""
+        return {
+            "model": settings.gemini_model,
+            "temperature": settings.temperature,
+            "max_tokens": settings.max_tokens,
+        }
+
+    def key(self, endpoint: str, text: str, language: str, **extra):
+        """Build the cache key for an endpoint call"""
+        return make_key(endpoint, text, language, self.model_config(), extra)
+
+    def get(self, endpoint: str, key: str):
+        """Return the cached response or None"""
+        value = self.cache.get(key)
+        stats = self.stats[endpoint]
+        if value is None:
+            stats.misses += 1
+        else:
+            stats.hits += 1
+        return value
+
+    def set(self, endpoint: str, key: str, value):
+        """Store a JSON-serializable response with the endpoint TTL"""
+        self.cache.set(key, value, ttl=self.ttls[endpoint])
+        self.stats[endpoint].sets += 1
+
+    def get_or_compute(self, endpoint: str, key: str, compute):
+        """
+        Return the cached response, or compute and store it
+
+        Called after a get() miss, so it does not count again (here or in
+        the backend). With the shared backend, a worker process computing
+        the same key makes the others wait for its result instead of
+        computing it too - for at most one Gemini timeout, after which
+        they compute it themselves.
+
+        Args:
+            endpoint: Endpoint name (selects the TTL)
+            key: Cache key
+            compute: Function returning the JSON-serializable response
+        """
+        def compute_and_count():
+            value = compute()
+            if value is not None:
+                self.stats[endpoint].sets += 1
+            return value
+
+        return self.cache.get_or_compute(
+            key, compute_and_count, ttl=self.ttls[endpoint], lookup=False, max_wait=settings.gemini_timeout
+        )
+
+    async def aget_or_compute(self, endpoint: str, key: str, compute):
+        """
+        Async get_or_compute(): compute is a coroutine function
+
+        Waiting for another worker process's lease happens on the event
+        loop, so it holds neither a worker thread nor a Gemini slot.
+        """
+        async def compute_and_count():
+            value = await compute()
+            if value is not None:
+                self.stats[endpoint].sets += 1
+            return value
+
+        return await self.cache.aget_or_compute(
+            key, compute_and_count, ttl=self.ttls[endpoint], lookup=False, max_wait=settings.gemini_timeout
+        )
+
+    def stats_dict(self):
+        """Hit/miss counters per endpoint"""
+        return {endpoint: stats.as_dict() for endpoint, stats in self.stats.items()}
+
+
+# Global cache instance
+response_cache = ResponseCache(
+    backend=settings.response_cache_backend,
+    max_entries=settings.response_cache_max_entries,
+    ttls={"chat": settings.chat_cache_ttl, "analysis": settings.analysis_cache_ttl},
+)
@@ -0,0 +1,322 @@
+"""
+Semantic answer cache for chat
+Serves stored answers to paraphrased questions via embedding similarity
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from app.config import settings
+from app.services.cache import CacheStats, make_key
+from app.services.embeddings import load_embedder
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single worker
+    fcntl = None
+
+# Seconds between writes of a slot's last-used time (hits stay cheap)
+TOUCH_RESOLUTION = 60
+
+
+class VectorSlots:
+    """
+    Fixed-capacity matrix of unit vectors with per-slot metadata
+
+    Vectors live in a memory-mapped float32 file, so a restart maps the
+    existing index instead of re-embedding anything. Metadata lives in a
+    SQLite table next to it. Without a directory everything stays in memory.
+
+    Worker processes can share the files:
+    - Slots are picked from the SQLite table, not from memory, under a
+      file lock, so two processes never fill the same slot
+    - A slot's row is deleted before its vector is overwritten and
+      written again after, so a row always describes the vector in place
+    - Each process reloads the table when another one has changed it,
+      and re-reads a matched row before serving it
+    """
+
+    def __init__(self, directory: str | None, name: str, dimension: int, capacity: int):
+        """
+        Args:
+            directory: Where to persist the index (None = memory only)
+            name: File name prefix
+            dimension: Vector size
+            capacity: Maximum number of vectors
+        """
+        self.dimension = dimension
+        self.capacity = capacity
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.entries = {}  # slot -> dict(question, answer, created_at, last_used)
+        self._lock_path = None
+        self._version = None
+
+        if directory is None:
+            self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        else:
+            os.makedirs(directory, exist_ok=True)
+            prefix = os.path.join(directory, f"{name}-{dimension}x{capacity}")
+            self._lock_path = f"{prefix}.lock"
+            with self._write_lock():
+                mode = "r+" if os.path.exists(f"{prefix}.f32") else "w+"
+                self.vectors = np.memmap(f"{prefix}.f32", dtype=np.float32, mode=mode, shape=(capacity, dimension))
+            self._conn = sqlite3.connect(f"{prefix}.sqlite3", check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS slots ("
+            "slot INTEGER PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.refresh()
+
+    @contextmanager
+    def _write_lock(self):
+        """Exclusive lock across worker processes for changing slots"""
+        if self._lock_path is None or fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """Reload the slot table if another process has changed it"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._version:
+            return
+        self._version = version
+        self.valid[:] = False
+        self.entries = {}
+        for slot, question, answer, created_at, last_used in self._conn.execute("SELECT * FROM slots"):
+            self.entries[slot] = {
+                "question": question, "answer": answer,
+                "created_at": created_at, "last_used": last_used, "saved_used": last_used,
+            }
+            self.valid[slot] = True
+            self.created[slot] = created_at
+
+    def nearest(self, vector: np.ndarray, oldest: float | None = None):
+        """
+        Return (slot, cosine similarity) of the closest vector, or None
+
+        Args:
+            vector: Unit query vector
+            oldest: Skip entries created before this time (expired)
+        """
+        live = self.valid if oldest is None else self.valid & (self.created >= oldest)
+        if not live.any():
+            return None
+        scores = self.vectors @ vector
+        scores[~live] = -np.inf
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def current(self, slot: int):
+        """
+        Re-read a matched slot's entry from the table
+
+        Returns:
+            The entry, or None if another process has since replaced or
+            removed it (the vector that matched may no longer be its own)
+        """
+        entry = self.entries.get(slot)
+        row = self._conn.execute("SELECT question, created_at FROM slots WHERE slot = ?", (slot,)).fetchone()
+        if entry is None or row != (entry["question"], entry["created_at"]):
+            return None
+        return entry
+
+    def touch(self, slot: int):
+        """Mark a slot as recently used (written to the table at most once a minute)"""
+        entry = self.entries[slot]
+        entry["last_used"] = time.time()
+        if entry["last_used"] - entry["saved_used"] >= TOUCH_RESOLUTION:
+            entry["saved_used"] = entry["last_used"]
+            self._conn.execute(
+                "UPDATE slots SET last_used = ? WHERE slot = ? AND created_at = ?",
+                (entry["last_used"], slot, entry["created_at"])
+            )
+            self._conn.commit()
+
+    def insert(self, vector: np.ndarray, question: str, answer: str, oldest: float | None = None):
+        """
+        Store a vector in a free slot, else an expired one, else the least recently used
+
+        Args:
+            vector: Unit vector of the question
+            question: Question text
+            answer: Answer text
+            oldest: Entries created before this time are expired
+
+        Returns:
+            True if a live entry was evicted
+        """
+        with self._write_lock():
+            rows = self._conn.execute("SELECT slot, created_at, last_used FROM slots").fetchall()
+            used = {slot for slot, _, _ in rows}
+            free = next((slot for slot in range(self.capacity) if slot not in used), None)
+            expired = [slot for slot, created_at, _ in rows if oldest is not None and created_at < oldest]
+            evicted = False
+            if free is not None:
+                slot = free
+            elif expired:
+                slot = expired[0]
+            else:
+                slot = min(rows, key=lambda row: row[2])[0]
+                evicted = True
+            if slot in used:
+                # Nobody may match the old entry against the new vector
+                self._conn.execute("DELETE FROM slots WHERE slot = ?", (slot,))
+                self._conn.commit()
+
+            now = time.time()
+            self.vectors[slot] = vector
+            if isinstance(self.vectors, np.memmap):
+                self.vectors.flush()
+            self._conn.execute(
+                "INSERT INTO slots (slot, question, answer, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (slot, question, answer, now, now),
+            )
+            self._conn.commit()
+
+        # Our own commits do not change data_version, so the new entry is added by hand
+        self.refresh()
+        self.entries[slot] = {
+            "question": question, "answer": answer, "created_at": now, "last_used": now, "saved_used": now,
+        }
+        self.valid[slot] = True
+        self.created[slot] = now
+        return evicted
+
+
+class SemanticCache:
+    """
+    Cache of chat answers looked up by question similarity
+
+    How it works:
+    1. Embed the question with the configured embedder
+    2. Find the most similar stored question for the same language
+       (and model settings) with a NumPy dot product over unit vectors
+    3. Return its answer if the cosine similarity reaches the threshold
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        capacity: int,
+        ttl: float | None,
+        directory: str | None = None,
+        embedder=None
+    ):
+        """
+        Args:
+            threshold: Minimum cosine similarity for a hit
+            capacity: Maximum stored questions per language
+            ttl: Time-to-live of an answer in seconds
+            directory: Where to persist the index (None = memory only)
+            embedder: LangChain Embeddings (defaults to load_embedder())
+        """
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl = ttl
+        self.directory = directory
+        self.stats = CacheStats()
+        self._embedder = embedder
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = load_embedder()
+        return self._embedder
+
+    @embedder.setter
+    def embedder(self, embedder):
+        """Swap the embedding backend (drops the in-memory indexes)"""
+        with self._lock:
+            self._embedder = embedder
+            self._indexes.clear()
+
+    def embed(self, question: str):
+        """Embed a question as a unit float32 vector"""
+        vector = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _index(self, language: str, dimension: int):
+        # Answers depend on the chat model; vectors depend on the embedder
+        model = make_key(
+            settings.gemini_model, settings.temperature, settings.max_tokens,
+            type(self.embedder).__name__
+        )[:12]
+        name = f"chat-{language}-{model}"
+        index = self._indexes.get(name)
+        if index is None or index.dimension != dimension:
+            index = VectorSlots(self.directory, name, dimension, self.capacity)
+            self._indexes[name] = index
+        return index
+
+    def lookup(self, question: str, language: str):
+        """
+        Find a stored answer for a similar question
+
+        Args:
+            question: User's question
+            language: Response language
+
+        Returns:
+            Tuple (answer or None, question vector to pass to store())
+        """
+        vector = self.embed(question)
+        oldest = time.time() - self.ttl if self.ttl else None
+        with self._lock:
+            index = self._index(language, len(vector))
+            index.refresh()
+            # Expired entries are skipped, so the best live entry still gets its chance
+            match = index.nearest(vector, oldest)
+            if match is not None:
+                slot, similarity = match
+                entry = index.current(slot) if similarity >= self.threshold else None
+                if entry is not None:
+                    index.touch(slot)
+                    self.stats.hits += 1
+                    return entry["answer"], vector
+            self.stats.misses += 1
+        return None, vector
+
+    def store(self, question: str, language: str, answer: str, vector: np.ndarray | None = None):
+        """
+        Store an answer under its question embedding
+
+        Args:
+            question: User's question
+            language: Response language
+            answer: Generated answer
+            vector: Embedding from lookup() (computed if missing)
+        """
+        if vector is None:
+            vector = self.embed(question)
+        oldest = time.time() - self.ttl if self.ttl else None
+        with self._lock:
+            if self._index(language, len(vector)).insert(vector, question, answer, oldest):
+                self.stats.evictions += 1
+            self.stats.sets += 1
+
+
+# Global cache instance
+semantic_cache = SemanticCache(
+    threshold=settings.semantic_cache_threshold,
+    capacity=settings.semantic_cache_max_entries,
+    ttl=settings.chat_cache_ttl,
+    directory=os.path.join(settings.cache_dir, "semantic") if settings.semantic_cache_persist else None
+)
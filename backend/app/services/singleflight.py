@@ -0,0 +1,176 @@
+"""
+Single-flight request coalescing
+Concurrent identical calls share one in-flight computation
+"""
+
+import asyncio
+import threading
+
+
+class FlightStats:
+    """Counters for a single-flight group"""
+
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+        }
+
+
+class _Call:
+    """One in-flight computation and its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = []  # (loop, future) of async callers
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls that share a key
+
+    How it works:
+    1. The first caller for a key (the leader) runs the function
+    2. Callers arriving while it runs wait for the leader's outcome
+       instead of starting their own computation
+    3. Everyone gets the same result, or the same exception
+    4. The key is released as soon as the call finishes - results are
+       not cached here, that is the caches' job
+
+    do() runs the work in the leader's thread and blocks the others.
+    ado() runs it in a task of its own and the others await a future,
+    so coalesced async callers hold no thread. Both kinds of caller can
+    join the same call. A cancelled or timed-out waiter only stops
+    waiting - the shared computation keeps going and the other waiters
+    still get its result.
+
+    Results are shared between callers, so they should not be mutated.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Group name shown in the stats
+        """
+        self.name = name
+        self.stats = FlightStats()
+        self._calls = {}
+        self._lock = threading.Lock()
+        flights[name] = self
+
+    def _join(self, key):
+        """Find the call running for key or start one (under the lock); returns (call, leader)"""
+        self.stats.calls += 1
+        call = self._calls.get(key)
+        leader = call is None
+        if leader:
+            call = _Call()
+            self._calls[key] = call
+            self.stats.executions += 1
+        else:
+            self.stats.coalesced += 1
+        return call, leader
+
+    def _finish(self, key, call: _Call):
+        """Release the key and wake every waiter"""
+        with self._lock:
+            del self._calls[key]
+        call.done.set()
+        for loop, future in call.waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # The waiter's loop is closed - nobody is left to wake
+                pass
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs), or join an identical call already running
+
+        Args:
+            key: Hashable identity of the call
+            fn: Function to run
+
+        Returns:
+            The function's result
+        """
+        with self._lock:
+            call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    async def ado(self, key, fn, *args, **kwargs):
+        """
+        Await fn(*args, **kwargs), or join an identical call already running
+
+        Args:
+            key: Hashable identity of the call
+            fn: Coroutine function to run
+
+        Returns:
+            The function's result
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            call, leader = self._join(key)
+            # Registered under the lock, so a call finishing now still wakes us
+            call.waiters.append((loop, future))
+        if leader:
+            task = asyncio.ensure_future(self._lead(key, call, fn, *args, **kwargs))
+            _leaders.add(task)
+            task.add_done_callback(_leaders.discard)
+
+        await future
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def _lead(self, key, call: _Call, fn, *args, **kwargs):
+        """Run a shared async computation and record its outcome"""
+        try:
+            call.result = await fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self._finish(key, call)
+
+
+# Every group by name, for the stats endpoint
+flights = {}
+
+# Running ado() computations, kept alive until they finish
+_leaders = set()
+
+
+def flight_stats():
+    """Counters of every single-flight group"""
+    return {name: flight.stats.as_dict() for name, flight in flights.items()}
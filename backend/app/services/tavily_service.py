@@ -3,16 +3,75 @@ Tavily AI Research Service
 Handles travel research searches
 """
 
-from tavily import TavilyClient
+import asyncio
+import re
+import threading
 from app.config import settings
+from app.services.cache import create_cache
+from app.services.singleflight import SingleFlight
+from app.services.governor import UpstreamBusyError
+from app.services.resilience import tavily_upstream
+from app.services.metrics import observe_stage
+
+# Leading words that mark a natural-language question (word order matters)
+QUESTION_WORDS = {
+    "what", "where", "when", "which", "who", "why", "how",
+    "is", "are", "can", "should", "do", "does"
+}
+
+
+def normalize_query(query: str):
+    """
+    Normalize a search query for cache lookups
+    
+    Case, punctuation and whitespace are ignored. Keyword queries
+    ("da nang best time") also ignore word order; questions keep it.
+    
+    Args:
+        query: Raw search query
+        
+    Returns:
+        Normalized query string
+    """
+    words = re.findall(r"\w+", query.casefold())
+    if "?" in query or (words and words[0] in QUESTION_WORDS):
+        return " ".join(words)
+    return " ".join(sorted(words))
+
+
+class ResearchSearchError(Exception):
+    """A Tavily search failed after retries"""
 
 
 class TavilyService:
     """Service class for Tavily research operations"""
     
     def __init__(self):
-        """Initialize Tavily client"""
-        self.client = TavilyClient(api_key=settings.tavily_api_key)
+        """Initialize the search result cache (the client is created on first use)"""
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.cache = create_cache(
+            settings.tavily_cache_backend,
+            "tavily",
+            max_entries=settings.tavily_cache_max_entries,
+            default_ttl=settings.tavily_cache_ttl
+        )
+        # Identical searches in flight at the same time share one API call
+        self.flight = SingleFlight("tavily_search")
+    
+    @property
+    def client(self):
+        """Tavily client, created on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from tavily import TavilyClient
+                    self._client = TavilyClient(api_key=settings.tavily_api_key)
+        return self._client
+    
+    @client.setter
+    def client(self, client):
+        self._client = client
     
     def search_travel_research(self, query: str, max_results: int = 5):
         """
@@ -25,19 +84,70 @@ class TavilyService:
         Returns:
             Dictionary with search results
         """
+        cache_key = normalize_query(query)
+        cached = self._cached(cache_key, max_results)
+        if cached is not None:
+            return cached
+        
+        return self.flight.do((cache_key, max_results), self._search, query, max_results, cache_key)
+    
+    async def asearch_travel_research(self, query: str, max_results: int = 5):
+        """
+        Async version of search_travel_research()
+        
+        Callers waiting for an identical search or for a Tavily slot
+        hold no worker thread.
+        
+        Args:
+            query: Search query
+            max_results: Maximum number of results
+            
+        Returns:
+            Dictionary with search results
+        """
+        cache_key = normalize_query(query)
+        cached = await asyncio.to_thread(self._cached, cache_key, max_results)
+        if cached is not None:
+            return cached
+        
+        # A Tavily slot is waited for here, before the search takes a worker thread
+        return await self.flight.ado(
+            (cache_key, max_results), tavily_upstream.run, self._search, query, max_results, cache_key
+        )
+    
+    def _cached(self, cache_key: str, max_results: int):
+        """Serve from a cached result set at least as large as requested (None on a miss)"""
+        cached = self.cache.get(cache_key)
+        if cached is None or cached["max_results"] < max_results:
+            return None
+        response = dict(cached["response"])
+        response["results"] = response.get("results", [])[:max_results]
+        return response
+    
+    def _search(self, query: str, max_results: int, cache_key: str):
+        """Run a search that missed the cache"""
         try:
-            # Perform search with travel context
-            response = self.client.search(
-                query=query,
-                search_depth="advanced",
-                max_results=max_results,
-                include_images=True
-            )
+            # Perform search with travel context (limits, retries, circuit breaker)
+            with observe_stage("tavily_search"):
+                response = tavily_upstream.call(
+                    self.client.search,
+                    query=query,
+                    search_depth="advanced",
+                    max_results=max_results,
+                    include_images=True,
+                    timeout=settings.tavily_timeout
+                )
             
+            # A concurrent search may have cached a larger result set meanwhile - keep it
+            stored = self.cache.peek(cache_key)
+            if stored is None or stored["max_results"] <= max_results:
+                self.cache.set(cache_key, {"max_results": max_results, "response": response})
             return response
             
+        except UpstreamBusyError:
+            raise
         except Exception as e:
-            raise Exception(f"Research search error: {str(e)}")
+            raise ResearchSearchError(f"Research search error: {str(e)}") from e
     
     def format_results(self, raw_results):
         """
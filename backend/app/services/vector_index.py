@@ -0,0 +1,387 @@
+"""
+Local vector index over scraped research content
+Lets /api/research retrieve relevant chunks instead of re-scraping pages
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from app.config import settings
+from app.chains.context import clean_markdown, split_into_chunks
+from app.services.embeddings import load_embedder
+from app.services.metrics import observe_stage
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single worker
+    fcntl = None
+
+# Dead rows tolerated before the vector file is compacted (also needs dead > live)
+COMPACT_MIN_DEAD_ROWS = 1024
+
+# Rows copied at a time while compacting, to bound memory
+COMPACT_BLOCK_ROWS = 4096
+
+# Share of research_index_max_rows kept when capping, so the next appends
+# do not trigger another compaction straight away
+COMPACT_HEADROOM = 0.9
+
+
+class ChunkVectorIndex:
+    """
+    Append-only index of embedded page chunks
+
+    How it works:
+    - Chunk vectors are appended as raw float32 rows to one file and
+      loaded with np.memmap, so startup maps the file instead of reading it
+    - Chunk and page metadata (URL, title, fetch time, images) live in SQLite
+    - Re-indexing a URL hides its old chunks instead of rewriting the file
+    - A chunk's row is its position in the vector file. Appends hold a
+      file lock shared by all worker processes, and a failed append
+      truncates the file back, so rows and metadata cannot drift apart
+    - Once hidden rows outnumber live ones, or the index outgrows
+      research_index_max_rows, the live rows of fresh pages are copied
+      to a new vector file (the oldest pages are dropped past the cap).
+      Its generation number is committed with the renumbered rows, so a
+      crash leaves either the old file and rows or the new ones
+    """
+
+    def __init__(self, directory: str, embedder=None):
+        """
+        Args:
+            directory: Where the index files live
+            embedder: LangChain Embeddings (defaults to load_embedder())
+        """
+        self.directory = directory
+        self._embedder = embedder
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._active = np.zeros(0, dtype=bool)
+        self._fetched_at = np.zeros(0)
+        self._generation = 0
+        self._conn = None
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = load_embedder()
+        return self._embedder
+
+    @embedder.setter
+    def embedder(self, embedder):
+        self._embedder = embedder
+
+    def _open(self):
+        """Open the metadata store and map the vectors (once)"""
+        if self._conn is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.directory, "chunks.sqlite3"), check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, title TEXT NOT NULL, fetched_at REAL NOT NULL, image_urls TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, url TEXT NOT NULL, text TEXT NOT NULL, active INTEGER NOT NULL);"
+        )
+        self._conn.commit()
+        self._remap()
+
+    def warm_up(self):
+        """Load the embedder and map the index ahead of the first request"""
+        self.embedder
+        with self._lock:
+            self._open()
+
+    def _vectors_path(self, generation: int):
+        """Vector file of a compaction generation"""
+        if generation == 0:
+            return os.path.join(self.directory, "vectors.f32")
+        return os.path.join(self.directory, f"vectors.{generation}.f32")
+
+    def _stored_generation(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _file_rows(self, dimension: int, generation: int):
+        """Complete vector rows in a generation's file"""
+        try:
+            return os.path.getsize(self._vectors_path(generation)) // (dimension * 4)
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def _append_lock(self):
+        """Exclusive lock across worker processes for appending"""
+        with open(os.path.join(self.directory, "append.lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _dimension(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dimension'").fetchone()
+        return int(row[0]) if row else None
+
+    def _committed_rows(self, generation: int):
+        """Rows up to the last committed chunk (later ones may still be truncated away)"""
+        dimension = self._dimension()
+        last = self._conn.execute("SELECT MAX(row) FROM chunks").fetchone()[0]
+        if dimension is None or last is None:
+            return 0
+        return min(last + 1, self._file_rows(dimension, generation))
+
+    def _remap(self):
+        """Map the vector file and rebuild the active-row mask and fetch times"""
+        self._generation = self._stored_generation()
+        rows = self._committed_rows(self._generation)
+        self._active = np.zeros(rows, dtype=bool)
+        self._fetched_at = np.zeros(rows)
+        if not rows:
+            self._vectors = None
+            return
+        self._vectors = np.memmap(
+            self._vectors_path(self._generation), dtype=np.float32, mode="r", shape=(rows, self._dimension())
+        )
+        active = self._conn.execute(
+            "SELECT c.row, p.fetched_at FROM chunks c JOIN pages p ON p.url = c.url "
+            "WHERE c.active = 1 AND c.row < ?",
+            (rows,),
+        ).fetchall()
+        if active:
+            active_rows, fetched_at = zip(*active)
+            self._active[list(active_rows)] = True
+            self._fetched_at[list(active_rows)] = fetched_at
+
+    def _refresh(self):
+        """Remap when another worker process has appended or compacted since the last map"""
+        mapped = len(self._vectors) if self._vectors is not None else 0
+        generation = self._stored_generation()
+        if generation != self._generation or self._committed_rows(generation) != mapped:
+            self._remap()
+
+    def _needs_compaction(self):
+        """True when hidden rows dominate the file or it is over the row cap"""
+        rows = len(self._active)
+        dead = rows - int(self._active.sum())
+        return rows > settings.research_index_max_rows or dead >= max(rows - dead, COMPACT_MIN_DEAD_ROWS)
+
+    def _compact(self):
+        """
+        Rewrite the vector file with the live rows of fresh pages only
+
+        Runs under both locks. Pages older than research_index_max_age are
+        dropped (search never returns them), then the oldest pages until
+        the index fits in COMPACT_HEADROOM of research_index_max_rows.
+        """
+        oldest = time.time() - settings.research_index_max_age
+        limit = int(settings.research_index_max_rows * COMPACT_HEADROOM)
+        pages = self._conn.execute(
+            "SELECT p.url, COUNT(c.row) FROM pages p JOIN chunks c ON c.url = p.url "
+            "WHERE c.active = 1 AND p.fetched_at >= ? GROUP BY p.url ORDER BY p.fetched_at DESC",
+            (oldest,),
+        ).fetchall()
+        kept_urls, total = set(), 0
+        for url, count in pages:
+            if total + count > limit:
+                break
+            kept_urls.add(url)
+            total += count
+
+        mapped = len(self._vectors) if self._vectors is not None else 0
+        kept = [
+            (row, url) for row, url in self._conn.execute(
+                "SELECT row, url FROM chunks WHERE active = 1 AND row < ? ORDER BY row", (mapped,)
+            )
+            if url in kept_urls
+        ]
+
+        # Write the new generation's file completely before the metadata points at it
+        generation = self._generation + 1
+        path = self._vectors_path(generation)
+        rows = np.array([row for row, _ in kept], dtype=np.int64)
+        with open(path, "wb") as f:
+            for start in range(0, len(rows), COMPACT_BLOCK_ROWS):
+                f.write(np.ascontiguousarray(self._vectors[rows[start:start + COMPACT_BLOCK_ROWS]]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        try:
+            keep = {row for row, _ in kept}
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE row = ?",
+                [(row,) for (row,) in self._conn.execute("SELECT row FROM chunks") if row not in keep],
+            )
+            # Ascending, so a row never moves onto one that has not moved yet
+            self._conn.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                [(new, old) for new, (old, _) in enumerate(kept) if new != old],
+            )
+            self._conn.execute("DELETE FROM pages WHERE url NOT IN (SELECT DISTINCT url FROM chunks)")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (str(generation),)
+            )
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            os.remove(path)
+            raise
+
+        previous = self._vectors_path(self._generation)
+        self._remap()
+        try:
+            # Other processes' maps keep the old file's data until they remap
+            os.remove(previous)
+        except OSError:
+            pass
+
+    def add_page(self, url: str, title: str, markdown: str, image_urls: list[str], fetched_at: float | None = None):
+        """
+        Chunk, embed and append a scraped page
+
+        Args:
+            url: Source URL
+            title: Page title
+            markdown: Scraped markdown
+            image_urls: Image URLs found on the page
+            fetched_at: Fetch time (defaults to now)
+        """
+        fetched_at = fetched_at or time.time()
+        with self._lock:
+            self._open()
+            row = self._conn.execute("SELECT fetched_at FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is not None and row[0] >= fetched_at:
+            # Already indexed from this fetch (e.g. served by the page cache)
+            return
+
+        chunks = split_into_chunks(clean_markdown(markdown), settings.research_chunk_tokens)
+        if not chunks:
+            return
+        vectors = np.asarray(self.embedder.embed_documents(chunks), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock, self._append_lock():
+            self._open()
+            # Another process may have compacted into a new file meanwhile
+            self._refresh()
+            path = self._vectors_path(self._generation)
+            dimension = self._dimension()
+            if dimension is None:
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('dimension', ?)", (str(vectors.shape[1]),))
+            elif dimension != vectors.shape[1]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index ({dimension})")
+
+            # Rows are positions in the file; a torn row from a crashed write is cut off
+            start = self._file_rows(vectors.shape[1], self._generation)
+            size = start * vectors.shape[1] * 4
+            try:
+                with open(path, "ab") as f:
+                    f.truncate(size)
+                    f.write(vectors.tobytes())
+                self._conn.execute("UPDATE chunks SET active = 0 WHERE url = ?", (url,))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (row, url, text, active) VALUES (?, ?, ?, 1)",
+                    [(start + i, url, chunk) for i, chunk in enumerate(chunks)],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pages (url, title, fetched_at, image_urls) VALUES (?, ?, ?, ?)",
+                    (url, title, fetched_at, json.dumps(image_urls)),
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                with open(path, "ab") as f:
+                    f.truncate(size)
+                raise
+            self._remap()
+            if self._needs_compaction():
+                self._compact()
+
+    def search(self, query: str, top_k: int, max_age: float | None = None):
+        """
+        Find the chunks most similar to a query
+
+        Args:
+            query: Search query
+            top_k: Number of chunks to return
+            max_age: Ignore pages fetched longer ago than this (seconds)
+
+        Returns:
+            List of dicts with url, title, text, fetched_at, image_urls and score
+        """
+        with self._lock:
+            self._open()
+            self._refresh()
+            if self._vectors is None or not self._active.any():
+                return []
+
+        vector = np.asarray(self.embedder.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+
+        with self._lock:
+            # Another worker process may have compacted while we embedded the query
+            self._refresh()
+            if self._vectors is None or not self._active.any():
+                return []
+
+            # Stale rows are masked before ranking, so they cannot crowd out fresh hits
+            live = self._active
+            if max_age:
+                live = live & (self._fetched_at >= time.time() - max_age)
+            scores = self._vectors @ vector
+            scores[~live] = -np.inf
+            candidates = np.argsort(scores)[::-1][:top_k]
+
+            results = []
+            for row in candidates:
+                if not np.isfinite(scores[row]):
+                    break
+                found = self._conn.execute(
+                    "SELECT c.url, c.text, p.title, p.fetched_at, p.image_urls "
+                    "FROM chunks c JOIN pages p ON p.url = c.url WHERE c.row = ?",
+                    (int(row),),
+                ).fetchone()
+                if found is None:
+                    # Compacted away after the refresh above
+                    continue
+                url, text, title, fetched_at, image_urls = found
+                results.append({
+                    "url": url,
+                    "title": title,
+                    "text": text,
+                    "fetched_at": fetched_at,
+                    "image_urls": json.loads(image_urls),
+                    "score": float(scores[row]),
+                })
+            return results
+
+    def retrieve(self, query: str):
+        """
+        Retrieve chunks for a research query if the index covers it
+
+        Coverage is sufficient when at least research_index_min_hits fresh
+        chunks reach research_index_min_score similarity.
+
+        Returns:
+            List of chunk dicts, or None when search + scrape is needed
+        """
+        with observe_stage("index_retrieve"):
+            hits = self.search(query, settings.research_index_top_k, max_age=settings.research_index_max_age)
+        relevant = [hit for hit in hits if hit["score"] >= settings.research_index_min_score]
+        if len(relevant) < settings.research_index_min_hits:
+            return None
+        return relevant
+
+
+# Global index instance
+research_index = ChunkVectorIndex(os.path.join(settings.cache_dir, "research_index"))
@@ -0,0 +1,72 @@
+"""
+Startup warm-up and readiness
+Loads models, clients and indexes ahead of the first request
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """
+    Concurrent startup steps, and whether the app is ready to serve
+
+    How it works:
+    1. Steps are blocking callables registered by name
+    2. run() starts every step in its own worker thread at once, so slow
+       imports and client construction overlap instead of adding up
+    3. The app is ready once every step has finished. A failed step is
+       logged and reported; the service it warms loads lazily on first
+       use anyway, so it is retried then instead of blocking readiness
+    """
+
+    def __init__(self):
+        self._steps = {}
+        self.results = {}  # name -> {"status", "seconds", "error"}
+        self.state = "pending"  # pending/running/ready/degraded
+        self.seconds = None
+
+    def register(self, name: str, fn):
+        """
+        Add a step
+
+        Args:
+            name: Step name shown in the readiness report
+            fn: Blocking callable doing the work
+        """
+        self._steps[name] = fn
+        self.results[name] = {"status": "pending", "seconds": None, "error": None}
+
+    async def _run_step(self, name: str, fn):
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(fn)
+            self.results[name] = {"status": "ready", "seconds": round(time.perf_counter() - start, 3), "error": None}
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+            self.results[name] = {"status": "failed", "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+
+    async def run(self):
+        """Run every registered step concurrently"""
+        self.state = "running"
+        start = time.perf_counter()
+        await asyncio.gather(*(self._run_step(name, fn) for name, fn in self._steps.items()))
+        self.seconds = round(time.perf_counter() - start, 3)
+        failed = [name for name, result in self.results.items() if result["status"] == "failed"]
+        self.state = "degraded" if failed else "ready"
+        logger.info("Warm-up finished in %.2fs (%s)", self.seconds, self.state)
+
+    @property
+    def ready(self):
+        return self.state in ("ready", "degraded")
+
+    def report(self):
+        """Readiness state, total time and per-step results"""
+        return {"state": self.state, "seconds": self.seconds, "steps": self.results}
+
+
+# Global warm-up, filled in by the app's lifespan handler
+warm_up = WarmUp()
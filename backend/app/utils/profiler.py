@@ -0,0 +1,131 @@
+"""
+Opt-in sampling profiler for individual requests
+Writes collapsed call stacks that flame graph tools can load
+"""
+
+import os
+import random
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from app.config import settings
+
+# Top frames of threads that are parked, not working (file name, function)
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+}
+
+
+class SamplingProfiler:
+    """
+    Sample the Python stacks of all threads at a fixed interval
+
+    How it works:
+    1. A daemon thread reads sys._current_frames() every interval seconds
+    2. Each working thread's stack is folded into "thread;module:function;..."
+       and counted (parked threads are skipped)
+    3. save() writes one "stack count" line per distinct stack - the
+       collapsed format read by speedscope and flamegraph.pl
+
+    Samples cover the whole process while the request runs: the event
+    loop thread and the worker threads doing this request's blocking
+    calls, but also any request running at the same time.
+    """
+
+    def __init__(self, interval: float):
+        """
+        Args:
+            interval: Seconds between samples
+        """
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                    stack.append(f"{module}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def save(self, path: str):
+        """Write the collapsed stacks to path"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# Only one profile at a time, so profiling cannot pile up on a busy server
+_profile_slot = threading.Lock()
+
+
+def should_profile(headers: dict):
+    """
+    Decide whether to profile a request
+
+    A request is profiled when it sends "X-Profile: 1" and header-triggered
+    profiling is enabled, or when it falls in the configured sample rate.
+
+    Args:
+        headers: Lower-cased request headers
+    """
+    if settings.profile_header_enabled and headers.get("x-profile") == "1":
+        return True
+    return settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate
+
+
+def profile_path(label: str):
+    """
+    New output file path for a profile
+
+    Args:
+        label: Short name for the file (e.g. the request path)
+    """
+    safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_")[:60]
+    return os.path.join(
+        settings.profile_dir,
+        f"{datetime.now():%Y%m%d-%H%M%S}-{safe_label}-{random.getrandbits(32):08x}.collapsed"
+    )
+
+
+def start_profile():
+    """Start a profiler, or return None if another request is being profiled"""
+    if not _profile_slot.acquire(blocking=False):
+        return None
+    return SamplingProfiler(settings.profile_interval).start()
+
+
+def finish_profile(profiler: SamplingProfiler, path: str):
+    """Stop a profiler and write its samples to path"""
+    try:
+        profiler.stop()
+        profiler.save(path)
+    finally:
+        _profile_slot.release()
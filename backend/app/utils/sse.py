@@ -0,0 +1,26 @@
+"""
+Server-Sent Events helpers for streaming endpoints
+"""
+
+import json
+
+# Headers that stop proxies from buffering the event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data) -> str:
+    """
+    Format one Server-Sent Event
+    
+    Args:
+        event: Event name (e.g. "token", "done", "error")
+        data: JSON-serializable payload
+        
+    Returns:
+        Encoded event string
+    """
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
@@ -0,0 +1,167 @@
+"""
+Per-request stage timings exposed as a Server-Timing header
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi.routing import APIRoute
+from app.utils.profiler import should_profile, start_profile, finish_profile, profile_path
+
+logger = logging.getLogger(__name__)
+
+# Characters allowed in a Server-Timing metric name (an HTTP token)
+UNSAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class RequestTimings:
+    """
+    Stage durations collected while one request is handled
+
+    asyncio.to_thread() copies the request's context into the worker
+    thread, so stages timed there land in the same collector.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.entries = []  # (name, description, milliseconds)
+        self.endpoint_done = None
+
+    def add(self, name: str, seconds: float, description: str | None = None):
+        self.entries.append((name, description, seconds * 1000))
+
+    def header(self):
+        """Format the entries plus the total as a Server-Timing value"""
+        parts = []
+        for name, description, milliseconds in self.entries:
+            part = UNSAFE_NAME.sub("_", name)
+            if description:
+                part += f';desc="{description.replace(chr(34), "")[:100]}"'
+            parts.append(f"{part};dur={milliseconds:.1f}")
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def as_list(self):
+        """Entries as dicts, for stream endpoints that send them as an event"""
+        return [
+            {"name": name, "description": description, "duration_ms": round(milliseconds, 1)}
+            for name, description, milliseconds in self.entries
+        ]
+
+
+_current = ContextVar("request_timings", default=None)
+
+
+def current_timings():
+    """The collector of the request being handled, or None outside a request"""
+    return _current.get()
+
+
+def record(name: str, seconds: float, description: str | None = None):
+    """Add a stage to the current request's timings (no-op outside a request)"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds, description)
+
+
+@contextmanager
+def timed(name: str, description: str | None = None):
+    """
+    Time a block as a Server-Timing stage
+
+    Args:
+        name: Stage name (e.g. "scrape")
+        description: Optional detail (e.g. the URL)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, description)
+
+
+class TimedRoute(APIRoute):
+    """
+    Route class that splits handler time into endpoint and serialize
+
+    The endpoint is wrapped to mark when it returns; whatever the handler
+    does after that (response validation and JSON encoding) is recorded
+    as the "serialize" stage.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kw):
+            try:
+                return await endpoint(*args, **kw)
+            finally:
+                timings = _current.get()
+                if timings is not None:
+                    timings.endpoint_done = time.perf_counter()
+
+        super().__init__(path, timed_endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timings = _current.get()
+            if timings is not None and timings.endpoint_done is not None:
+                timings.add("serialize", time.perf_counter() - timings.endpoint_done)
+            return response
+
+        return timed_handler
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that collects stage timings for each request and
+    sends them as a Server-Timing header
+
+    Streaming responses send their headers before the work is done, so
+    their header only covers the time to the first byte.
+
+    It also runs the sampling profiler for the requests chosen by
+    should_profile(); the profile file name is returned in X-Profile.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+
+        profiler = path = None
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        if should_profile(headers):
+            profiler = start_profile()
+            if profiler is not None:
+                path = profile_path(scope["path"])
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header().encode("latin-1", "replace")))
+                if path is not None:
+                    headers.append((b"x-profile", os.path.basename(path).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if profiler is not None:
+                await asyncio.to_thread(finish_profile, profiler, path)
+                logger.info("Profile of %s written to %s", scope["path"], path)
@@ -0,0 +1,131 @@
+"""
+Upload handling for the image endpoints
+Chunked, size-capped reads and a server-wide memory budget
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, UploadFile
+from app.config import settings
+
+# Bytes read ahead of an image upload to parse its header (EXIF included)
+IMAGE_HEADER_BYTES = 256 * 1024
+
+
+class MemoryBudget:
+    """
+    Async budget on the number of image bytes held in memory at once
+
+    Requests reserve their upload size, plus the decoded bitmap for
+    images that will be preprocessed, before reading it. When the budget
+    is used up, new uploads wait until earlier ones finish instead of
+    pushing the worker into OOM.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: Maximum number of bytes reserved at once
+        """
+        self.capacity = capacity
+        self.in_use = 0
+        self.waiting = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        """
+        Reserve size bytes for the duration of the block
+
+        A single reservation larger than the whole budget is clamped to
+        the budget, so it runs alone instead of waiting forever.
+        """
+        size = min(size, self.capacity)
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.in_use + size <= self.capacity)
+            finally:
+                self.waiting -= 1
+            self.in_use += size
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_use -= size
+                self._condition.notify_all()
+
+
+def upload_size(file: UploadFile, max_bytes: int | None = None):
+    """
+    Size to reserve for an upload, rejecting known-oversized files early
+
+    Args:
+        file: Uploaded file
+        max_bytes: Size limit (defaults to settings.max_file_size)
+
+    Returns:
+        Declared size, or the size limit when the size is unknown
+    """
+    max_bytes = max_bytes or settings.max_file_size
+    size = getattr(file, "size", None)
+    if size is None:
+        return max_bytes
+    if size > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large (maximum {max_bytes // (1024 * 1024)}MB)"
+        )
+    return size
+
+
+async def image_reservation(file: UploadFile, max_bytes: int | None = None):
+    """
+    Memory to reserve for an image upload that will be preprocessed
+
+    The upload itself plus its decoded bitmap, estimated from the image
+    header before the file is read (a 7MB JPEG photo decodes to ~48MB).
+
+    Args:
+        file: Uploaded file
+        max_bytes: Size limit (defaults to settings.max_file_size)
+
+    Returns:
+        Bytes to reserve
+    """
+    # Imported on first use, so Pillow is not loaded at startup
+    from app.services.image_preprocessing import decoded_size
+
+    size = upload_size(file, max_bytes)
+    head = await file.read(IMAGE_HEADER_BYTES)
+    await file.seek(0)
+    return size + decoded_size(head)
+
+
+async def read_upload(file: UploadFile, max_bytes: int | None = None):
+    """
+    Read an upload in chunks, stopping as soon as it exceeds the limit
+
+    Args:
+        file: Uploaded file
+        max_bytes: Size limit (defaults to settings.max_file_size)
+
+    Returns:
+        File bytes
+    """
+    max_bytes = max_bytes or settings.max_file_size
+    chunks = []
+    total = 0
+    while chunk := await file.read(settings.upload_chunk_size):
+        total += len(chunk)
+        if total > max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large (maximum {max_bytes // (1024 * 1024)}MB)"
+            )
+        chunks.append(chunk)
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+
+# Global budget shared by all image endpoints
+upload_budget = MemoryBudget(settings.upload_memory_budget)
@@ -0,0 +1,47 @@
+"""
+Micro-benchmark: per-request chain construction vs. registry lookup
+
+Run from the backend directory:
+    python -m benchmarks.bench_chain_registry
+
+Uses a fake chat model so no API key or network access is needed.
+"""
+
+import time
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.config import settings
+from app.chains.registry import ChainRegistry
+from app.chains.chat_chain import create_chat_chain
+from app.chains.analysis_chain import create_analysis_chain
+
+ITERATIONS = 2000
+
+
+def _time_per_call(fn, iterations: int = ITERATIONS):
+    """Return the mean wall-clock time of fn() in microseconds"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    # The fake model has no native structured output
+    settings.analysis_output_mode = "parser"
+    llm = FakeListChatModel(responses=["ok"])
+
+    registry = ChainRegistry(llm_factory=lambda: llm)
+    registry.register("chat", create_chat_chain)
+    registry.register("analysis", create_analysis_chain)
+    registry.warm_up()
+
+    print(f"{'chain':<10} {'build per request':>20} {'registry lookup':>18} {'speedup':>10}")
+    for chain_type, builder in (("chat", create_chat_chain), ("analysis", create_analysis_chain)):
+        before = _time_per_call(lambda: builder("en", llm=llm))
+        after = _time_per_call(lambda: registry.get(chain_type, "en"))
+        print(f"{chain_type:<10} {before:>17.1f} us {after:>15.2f} us {before / after:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark: per-process vs. shared cache hit rate across worker processes
+
+Run from the backend directory:
+    python -m benchmarks.bench_shared_cache
+    python -m benchmarks.bench_shared_cache --workers 2,4,8 --requests 4000 --keys 500
+
+Simulates uvicorn workers behind a load balancer: one request stream with
+a skewed (Zipf-like) key popularity is dealt round-robin to N processes.
+Every request calls get_or_compute() on the cache; a miss "computes" the
+value by sleeping, like an LLM call. Reported per backend and worker count:
+hit rate (requests served without computing), computations, wall time and
+cached entries summed over the processes (the duplication of per-process
+caches).
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import tempfile
+import time
+
+BACKENDS = ("memory", "shared")
+
+
+def _request_stream(requests: int, keys: int, skew: float, seed: int):
+    """Keys of each request, most popular first in rank"""
+    rng = random.Random(seed)
+    weights = [1 / (rank ** skew) for rank in range(1, keys + 1)]
+    return [f"question-{k}" for k in rng.choices(range(keys), weights=weights, k=requests)]
+
+
+def _worker(backend: str, path: str, stream: list, compute_seconds: float, max_entries: int, start, results):
+    from app.services.cache import MemoryCache, SharedCache
+
+    if backend == "shared":
+        cache = SharedCache(path, max_entries=max_entries)
+    else:
+        cache = MemoryCache(max_entries=max_entries)
+    computed = 0
+
+    def compute():
+        nonlocal computed
+        computed += 1
+        time.sleep(compute_seconds)
+        return {"answer": "x" * 500}
+
+    start.wait()
+    began = time.perf_counter()
+    for key in stream:
+        cache.get_or_compute(key, compute)
+    results.put({"computed": computed, "entries": len(cache), "seconds": time.perf_counter() - began})
+
+
+def _collect(processes: list, results, timeout: float):
+    """Gather one outcome per worker; exit if a worker dies or the run takes too long"""
+    outcomes = []
+    deadline = time.monotonic() + timeout
+    while len(outcomes) < len(processes):
+        try:
+            outcomes.append(results.get(timeout=1))
+            continue
+        except queue.Empty:
+            pass
+        failed = [process.exitcode for process in processes if process.exitcode not in (None, 0)]
+        if failed or time.monotonic() > deadline:
+            for process in processes:
+                process.terminate()
+            reason = f"a worker exited with code {failed[0]}" if failed else f"no result after {timeout:.0f}s"
+            sys.exit(f"Benchmark aborted: {reason}")
+    return outcomes
+
+
+def run(backend: str, workers: int, stream: list, compute_seconds: float, max_entries: int, timeout: float = 600):
+    context = multiprocessing.get_context("spawn")
+    path = os.path.join(tempfile.mkdtemp(prefix="travel-shared-cache-"), "bench.sqlite3")
+    start = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=_worker,
+            args=(backend, path, stream[i::workers], compute_seconds, max_entries, start, results)
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = _collect(processes, results, timeout)
+    for process in processes:
+        process.join()
+
+    computed = sum(outcome["computed"] for outcome in outcomes)
+    entries = [outcome["entries"] for outcome in outcomes]
+    return {
+        "hit_rate": 1 - computed / len(stream),
+        "computed": computed,
+        "seconds": max(outcome["seconds"] for outcome in outcomes),
+        # Every process sees the same shared file - count it once
+        "entries": max(entries) if backend == "shared" else sum(entries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-process and shared cache hit rates")
+    parser.add_argument("--workers", default="1,2,4,8", help="Comma-separated worker counts")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--keys", type=int, default=400, help="Distinct questions")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of key popularity")
+    parser.add_argument("--compute-ms", type=float, default=5.0, help="Simulated cost of a miss")
+    parser.add_argument("--max-entries", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds allowed per run")
+    args = parser.parse_args()
+
+    stream = _request_stream(args.requests, args.keys, args.skew, args.seed)
+    print(f"{args.requests} requests over {args.keys} keys, {args.compute_ms} ms per miss\n")
+    print(f"{'workers':>8} {'backend':>8} {'hit rate':>9} {'computed':>9} {'seconds':>8} {'entries':>8}")
+    for workers in (int(n) for n in args.workers.split(",")):
+        for backend in BACKENDS:
+            result = run(backend, workers, stream, args.compute_ms / 1000, args.max_entries, args.timeout)
+            print(
+                f"{workers:>8} {backend:>8} {result['hit_rate']:>9.1%} {result['computed']:>9} "
+                f"{result['seconds']:>8.2f} {result['entries']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
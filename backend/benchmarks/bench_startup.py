@@ -0,0 +1,137 @@
+"""
+Startup benchmark: import time per module and warm-up time
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --top 30 --warm-up --output startup.json
+
+Each run imports app.main in a fresh interpreter with "python -X importtime",
+so nothing is cached in the process. Reports the median time to import the
+app, the slowest modules (cumulative, i.e. including what they import)
+and self time per top-level package. With --warm-up, each run also runs
+the startup warm-up steps and reports their durations (this constructs
+the real clients, so the SDKs must be installed; no request is sent).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app.main
+result = {"import_seconds": time.perf_counter() - start}
+if WARM_UP:
+    import asyncio
+    from app.services.warmup import warm_up
+    app.main._register_warm_up_steps()
+    asyncio.run(warm_up.run())
+    result["warm_up"] = warm_up.report()
+print(json.dumps(result))
+"""
+
+
+def _parse_importtime(stderr: str):
+    """Return {module: (self_us, cumulative_us)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def _run_once(warm_up: bool):
+    env = {
+        **os.environ,
+        "GOOGLE_API_KEY": os.environ.get("GOOGLE_API_KEY", "startup-bench"),
+        "FIRECRAWL_API_KEY": os.environ.get("FIRECRAWL_API_KEY", "startup-bench"),
+        "CACHE_DIR": os.environ.get("CACHE_DIR", tempfile.mkdtemp(prefix="travel-startup-")),
+        "LOG_LEVEL": "WARNING",
+    }
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"WARM_UP = {warm_up}\n{IMPORT_SCRIPT}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        sys.exit(f"Importing the app failed:\n{process.stderr[-3000:]}")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["modules"] = _parse_importtime(process.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import and warm-up time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20, help="Slowest modules to list")
+    parser.add_argument("--warm-up", action="store_true", help="Also time the startup warm-up steps")
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    runs = [_run_once(args.warm_up) for _ in range(args.runs)]
+
+    import_seconds = statistics.median(run["import_seconds"] for run in runs)
+    cumulative = defaultdict(list)
+    self_by_package = defaultdict(lambda: [0] * len(runs))
+    for i, run in enumerate(runs):
+        for name, (self_us, cumulative_us) in run["modules"].items():
+            cumulative[name].append(cumulative_us)
+            self_by_package[name.split(".")[0]][i] += self_us
+    slowest = sorted(
+        ((name, statistics.median(values)) for name, values in cumulative.items()),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+    packages = sorted(
+        ((name, statistics.median(values)) for name, values in self_by_package.items()),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+
+    print(f"import app.main: {import_seconds * 1000:.0f} ms (median of {args.runs} runs)\n")
+    print(f"{'module (cumulative)':<60} {'ms':>9}")
+    for name, us in slowest:
+        print(f"{name:<60} {us / 1000:>9.1f}")
+    print(f"\n{'package (self)':<60} {'ms':>9}")
+    for name, us in packages:
+        print(f"{name:<60} {us / 1000:>9.1f}")
+
+    warm_up = None
+    if args.warm_up:
+        warm_up = {
+            "seconds": statistics.median(run["warm_up"]["seconds"] for run in runs),
+            "steps": {
+                name: statistics.median(run["warm_up"]["steps"][name]["seconds"] for run in runs)
+                for name in runs[0]["warm_up"]["steps"]
+            },
+            "failed": sorted({
+                name for run in runs for name, step in run["warm_up"]["steps"].items() if step["status"] == "failed"
+            }),
+        }
+        print(f"\nwarm-up: {warm_up['seconds'] * 1000:.0f} ms (steps run concurrently)")
+        for name, seconds in sorted(warm_up["steps"].items(), key=lambda item: item[1], reverse=True):
+            print(f"  {name:<58} {seconds * 1000:>9.1f}")
+        if warm_up["failed"]:
+            print(f"  failed: {', '.join(warm_up['failed'])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "runs": args.runs,
+                "import_ms": round(import_seconds * 1000, 1),
+                "slowest_modules_ms": {name: round(us / 1000, 1) for name, us in slowest},
+                "package_self_ms": {name: round(us / 1000, 1) for name, us in packages},
+                "warm_up": warm_up,
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
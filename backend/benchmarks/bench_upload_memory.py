@@ -0,0 +1,96 @@
+"""
+Peak memory of concurrent image uploads, with and without the memory budget
+
+Run from the backend directory:
+    python -m benchmarks.bench_upload_memory [--uploads 50] [--budget-mb 64]
+
+Each scenario runs in a fresh subprocess so ru_maxrss reflects only that
+scenario. Uploads go through the same path as /api/analyze-image:
+chunked read, preprocessing and data URL encoding, followed by a
+simulated vision call.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+
+# Simulated Gemini vision latency per page
+VISION_LATENCY = 0.5
+
+
+def _make_photo(width: int = 4000, height: int = 3000):
+    """A ~12 MP noisy JPEG that compresses like a phone photo"""
+    from PIL import Image
+
+    img = Image.effect_noise((width, height), 40).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def _run(uploads: int, budget_bytes: int):
+    from starlette.datastructures import UploadFile
+    from app.services.image_preprocessing import preprocess_image
+    from app.utils.uploads import MemoryBudget, image_reservation, read_upload
+
+    photo = _make_photo()
+    budget = MemoryBudget(budget_bytes)
+
+    async def one_upload():
+        upload = UploadFile(io.BytesIO(photo), size=len(photo))
+        async with budget.reserve(await image_reservation(upload)):
+            image_bytes = await read_upload(upload)
+            prepared = await asyncio.to_thread(preprocess_image, image_bytes)
+            data_url = prepared.to_data_url()
+            await asyncio.sleep(VISION_LATENCY)
+            return len(image_bytes), len(data_url)
+
+    start = time.perf_counter()
+    sizes = await asyncio.gather(*(one_upload() for _ in range(uploads)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "uploads": uploads,
+        "budget_mb": budget_bytes / (1024 * 1024),
+        "upload_mb": sizes[0][0] / (1024 * 1024),
+        "data_url_kb": sizes[0][1] / 1024,
+        "elapsed_s": round(elapsed, 2),
+        # Linux reports ru_maxrss in kilobytes
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uploads", type=int, default=50)
+    parser.add_argument("--budget-mb", type=int, default=64)
+    parser.add_argument("--scenario-budget", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario_budget is not None:
+        print(json.dumps(asyncio.run(_run(args.uploads, args.scenario_budget))))
+        return
+
+    unbounded = 1 << 62
+    for budget in (unbounded, args.budget_mb * 1024 * 1024):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_upload_memory",
+             "--uploads", str(args.uploads), "--scenario-budget", str(budget)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output)
+        label = "no budget" if budget == unbounded else f"{args.budget_mb}MB budget"
+        print(
+            f"{label:<14} uploads={result['uploads']} "
+            f"peak_rss={result['peak_rss_mb']}MB elapsed={result['elapsed_s']}s "
+            f"upload={result['upload_mb']:.1f}MB data_url={result['data_url_kb']:.0f}KB"
+        )
+
+
+if __name__ == "__main__":
+    main()
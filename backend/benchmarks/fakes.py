@@ -0,0 +1,289 @@
+"""
+Deterministic local stand-ins for Gemini, Tavily and Firecrawl
+
+Each fake has a latency distribution, a payload size and an error rate,
+so benchmarks exercise the real request path (chains, caches, governors,
+retries) without network access or API costs.
+
+Usage (before the first request):
+    from benchmarks.fakes import install_fakes
+    fakes = install_fakes(latency_scale=0.1)
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field, replace
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Words the fake payloads are built from
+VOCABULARY = (
+    "beach temple market street food ferry museum island river lantern old town "
+    "night bus visa passport hotel hostel hike waterfall rice terrace coffee pho "
+    "noodle bay cave boat tour ticket season monsoon sunrise bridge garden palace"
+).split()
+
+
+@dataclass
+class Latency:
+    """
+    Latency distribution of a fake upstream
+
+    distribution:
+        "constant" - always median
+        "uniform" - median +/- spread * median
+        "lognormal" - median * exp(N(0, spread)), a long right tail like real APIs
+    """
+
+    distribution: str = "lognormal"
+    median: float = 0.5
+    spread: float = 0.5
+
+    def sample(self, rng: random.Random):
+        if self.distribution == "constant":
+            return self.median
+        if self.distribution == "uniform":
+            return max(0.0, rng.uniform(self.median * (1 - self.spread), self.median * (1 + self.spread)))
+        return self.median * rng.lognormvariate(0, self.spread)
+
+
+@dataclass
+class FakeProfile:
+    """Behaviour of one fake upstream"""
+
+    latency: Latency = field(default_factory=Latency)
+    payload_size: int = 1000  # characters of generated text
+    error_rate: float = 0.0  # fraction of calls failing with a transient error
+
+
+# Rough shape of the real services
+DEFAULT_PROFILES = {
+    "gemini": FakeProfile(Latency("lognormal", 1.2, 0.4), payload_size=1500, error_rate=0.01),
+    "vision": FakeProfile(Latency("lognormal", 2.0, 0.4), payload_size=2000, error_rate=0.01),
+    "tavily": FakeProfile(Latency("lognormal", 0.8, 0.3), payload_size=400, error_rate=0.01),
+    "firecrawl": FakeProfile(Latency("lognormal", 1.5, 0.7), payload_size=20000, error_rate=0.05),
+}
+
+
+class FakeUpstreamError(Exception):
+    """Transient provider failure (retryable, like a real 503)"""
+
+    status_code = 503
+
+
+class _Behaviour:
+    """Seeded randomness shared by a fake's concurrent calls"""
+
+    def __init__(self, profile: FakeProfile, seed: int):
+        self.profile = profile
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def draw(self):
+        """Return (latency, fails) for the next call"""
+        with self._lock:
+            self.calls += 1
+            latency = self.profile.latency.sample(self._rng)
+            fails = self._rng.random() < self.profile.error_rate
+            if fails:
+                self.errors += 1
+        return latency, fails
+
+
+def fake_text(seed_text: str, size: int):
+    """Deterministic pseudo-text of about size characters for a given input"""
+    rng = random.Random(zlib.crc32(seed_text.encode("utf-8")))
+    words = []
+    length = 0
+    while length < size:
+        sentence = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(6, 14)))
+        words.append(sentence.capitalize() + ".")
+        length += len(sentence) + 2
+    return " ".join(words)[:max(size, 1)]
+
+
+def _message_text(messages):
+    """Concatenate the text parts of a prompt"""
+    parts = []
+    for message in messages:
+        content = message.content
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(part.get("text", "") for part in content if isinstance(part, dict))
+    return "\n".join(parts)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Fake Gemini chat/vision model
+
+    Answers with deterministic text, or with a valid TravelAnalysis JSON
+    object when the prompt asks for JSON. Streams in ~20 chunks.
+    """
+
+    behaviour: Any = None
+    chunks: int = 20
+
+    @property
+    def _llm_type(self):
+        return "fake-gemini"
+
+    def _answer(self, messages):
+        prompt = _message_text(messages)
+        size = self.behaviour.profile.payload_size
+        if "JSON" in prompt:
+            text = fake_text(prompt, size)
+            sentences = text.split(". ")
+            content = json.dumps({
+                "summary": sentences[0],
+                "key_findings": sentences[1:4],
+                "recommendations": sentences[4:7],
+                "next_steps": sentences[7:9],
+            })
+        else:
+            content = fake_text(prompt, size)
+        usage = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4,
+        }
+        return content, usage
+
+    def _pieces(self, content: str):
+        step = max(1, len(content) // self.chunks)
+        return [content[i:i + step] for i in range(0, len(content), step)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, fails = self.behaviour.draw()
+        time.sleep(latency)
+        if fails:
+            raise FakeUpstreamError("fake Gemini unavailable")
+        content, usage = self._answer(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, fails = self.behaviour.draw()
+        await asyncio.sleep(latency)
+        if fails:
+            raise FakeUpstreamError("fake Gemini unavailable")
+        content, usage = self._answer(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, fails = self.behaviour.draw()
+        if fails:
+            time.sleep(latency / 2)
+            raise FakeUpstreamError("fake Gemini unavailable")
+        content, _ = self._answer(messages)
+        pieces = self._pieces(content)
+        for piece in pieces:
+            time.sleep(latency / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, fails = self.behaviour.draw()
+        if fails:
+            await asyncio.sleep(latency / 2)
+            raise FakeUpstreamError("fake Gemini unavailable")
+        content, _ = self._answer(messages)
+        pieces = self._pieces(content)
+        for piece in pieces:
+            await asyncio.sleep(latency / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+
+class FakeTavilyClient:
+    """Fake TavilyClient with the search() signature the service uses"""
+
+    def __init__(self, behaviour: _Behaviour):
+        self.behaviour = behaviour
+
+    def search(self, query: str, search_depth: str = "basic", max_results: int = 5, include_images: bool = False, **kwargs):
+        latency, fails = self.behaviour.draw()
+        time.sleep(latency)
+        if fails:
+            raise FakeUpstreamError("fake Tavily unavailable")
+        key = f"{zlib.crc32(query.encode('utf-8')):08x}"
+        results = [
+            {
+                "title": fake_text(f"{query}-title-{i}", 40),
+                "url": f"https://travel.example/{key}/{i}",
+                "content": fake_text(f"{query}-{i}", self.behaviour.profile.payload_size),
+                "score": round(1 - i * 0.07, 2),
+            }
+            for i in range(max_results)
+        ]
+        images = [f"https://img.travel.example/{key}/{i}.jpg" for i in range(3)] if include_images else []
+        return {"query": query, "results": results, "images": images}
+
+
+class FakeFirecrawlApp:
+    """Fake FirecrawlApp with the scrape() signature the service uses"""
+
+    def __init__(self, behaviour: _Behaviour):
+        self.behaviour = behaviour
+
+    def scrape(self, url: str, formats=None, max_age=None, **kwargs):
+        latency, fails = self.behaviour.draw()
+        time.sleep(latency)
+        if fails:
+            raise FakeUpstreamError("fake Firecrawl unavailable")
+        size = self.behaviour.profile.payload_size
+        paragraphs = [fake_text(f"{url}-{i}", 600) for i in range(max(1, size // 600))]
+        images = [f"![photo {i}](https://img.travel.example/page/{zlib.crc32(url.encode()):08x}/{i}.jpg)" for i in range(4)]
+        return {"markdown": "\n\n".join(images[:2] + paragraphs + images[2:]), "metadata": {"sourceURL": url}}
+
+
+def build_profiles(latency_scale: float = 1.0, error_rate: float | None = None, **overrides):
+    """
+    Default profiles with latencies scaled and an optional common error rate
+
+    Args:
+        latency_scale: Multiplier on every median latency
+        error_rate: Override the error rate of every fake
+        overrides: Replacement FakeProfile per upstream name
+    """
+    profiles = {}
+    for name, profile in {**DEFAULT_PROFILES, **overrides}.items():
+        profile = replace(profile, latency=replace(profile.latency, median=profile.latency.median * latency_scale))
+        if error_rate is not None:
+            profile = replace(profile, error_rate=error_rate)
+        profiles[name] = profile
+    return profiles
+
+
+def install_fakes(latency_scale: float = 1.0, error_rate: float | None = None, seed: int = 1234, **overrides):
+    """
+    Swap the real upstream clients for fakes
+
+    Injected through the existing seams: tavily_service.client,
+    firecrawl_service.client, gemini_service.vision_llm and the chain
+    registry's llm_factory (load_google_llm by default).
+
+    Returns:
+        Dict of upstream name -> _Behaviour, for call and error counts
+    """
+    from app.chains.registry import chain_registry
+    from app.services.tavily_service import tavily_service
+    from app.services.firecrawl_service import firecrawl_service
+    from app.services.gemini_service import gemini_service
+
+    profiles = build_profiles(latency_scale, error_rate, **overrides)
+    behaviours = {name: _Behaviour(profile, seed + i) for i, (name, profile) in enumerate(profiles.items())}
+
+    chat_model = FakeChatModel(behaviour=behaviours["gemini"])
+    chain_registry.llm_factory = lambda: chat_model
+    chain_registry.clear()
+    gemini_service.vision_llm = FakeChatModel(behaviour=behaviours["vision"])
+    tavily_service.client = FakeTavilyClient(behaviours["tavily"])
+    firecrawl_service.client = FakeFirecrawlApp(behaviours["firecrawl"])
+    return behaviours
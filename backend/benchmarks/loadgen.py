@@ -0,0 +1,293 @@
+"""
+Offline load test of the API against fake upstreams
+
+Run from the backend directory:
+    python -m benchmarks.loadgen
+    python -m benchmarks.loadgen --endpoints chat,research --concurrency 1,16,64 --latency-scale 0.2
+    python -m benchmarks.loadgen --compare benchmarks/results/<earlier run>.json
+
+The app runs in-process behind httpx's ASGI transport, with Gemini,
+Tavily and Firecrawl replaced by the fakes in benchmarks.fakes, so no
+API key or network access is needed and runs are repeatable.
+
+Each endpoint is driven at each concurrency level by a closed loop of
+workers (each sends its next request when the previous one completes).
+p50/p95/p99 latency, throughput and errors are printed and written as
+JSON to benchmarks/results/, named after the time and git commit.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+QUERIES = [
+    "street food in hanoi old quarter", "best time to visit ha long bay", "visa rules for vietnam",
+    "night markets in chiang mai", "ferry from split to hvar", "budget hostels in lisbon",
+    "temples of angkor in two days", "hiking the sapa rice terraces", "paris museum pass worth it",
+    "monsoon season in goa", "train from tokyo to kyoto", "snorkeling in el nido",
+]
+
+
+def _configure_environment(args):
+    """Settings are read at import time, so this runs before the app is imported"""
+    defaults = {
+        "CACHE_DIR": tempfile.mkdtemp(prefix="travel-loadgen-"),
+        "GOOGLE_API_KEY": "offline",
+        "TAVILY_API_KEY": "offline",
+        "FIRECRAWL_API_KEY": "offline",
+        "LOG_LEVEL": "WARNING",
+        "EMBEDDING_BACKEND": "hashing",
+        # The fakes answer with JSON text, not native structured output
+        "ANALYSIS_OUTPUT_MODE": "parser",
+        "RESPONSE_CACHE_BACKEND": "memory",
+    }
+    if not args.caches:
+        defaults.update({"SEMANTIC_CACHE_ENABLED": "false", "RESEARCH_INDEX_ENABLED": "false"})
+    if not args.keep_limits:
+        # Measure the app, not the production rate limits
+        for upstream in ("GEMINI", "TAVILY", "FIRECRAWL"):
+            defaults.update({
+                f"{upstream}_RATE_LIMIT": "100000",
+                f"{upstream}_BURST": "100000",
+                f"{upstream}_MAX_CONCURRENCY": "1000",
+                f"{upstream}_MAX_QUEUE": "100000",
+            })
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def _make_image(seed: int):
+    """A small noisy JPEG, so every upload has distinct bytes"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (800, 600), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    pixels = image.load()
+    for _ in range(2000):
+        pixels[rng.randrange(800), rng.randrange(600)] = (rng.randrange(256),) * 3
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def _text(i: int):
+    return f"Flight VN{100 + i} Hanoi to Da Nang, hotel booking #{i}, 3 nights. " + QUERIES[i % len(QUERIES)]
+
+
+# name -> (method, path, kind, request builder); kind is json, sse, multipart or get
+ENDPOINTS = {
+    "health": ("GET", "/api/health", "get", lambda i: {}),
+    "chat": ("POST", "/api/chat", "json", lambda i: {"message": f"Question {i}: {QUERIES[i % len(QUERIES)]}?"}),
+    "chat_stream": (
+        "POST", "/api/chat/stream", "sse", lambda i: {"message": f"Question {i}: {QUERIES[i % len(QUERIES)]}?"}
+    ),
+    "analyze_text": ("POST", "/api/analyze-text", "json", lambda i: {"text": _text(i)}),
+    "analyze_batch": (
+        "POST", "/api/analyze-batch", "json", lambda i: {"items": [{"text": _text(i * 8 + j)} for j in range(8)]}
+    ),
+    "research": ("POST", "/api/research", "json", lambda i: {"query": f"{QUERIES[i % len(QUERIES)]} {i}"}),
+    "research_stream": (
+        "POST", "/api/research/stream", "sse", lambda i: {"query": f"{QUERIES[i % len(QUERIES)]} {i}"}
+    ),
+    "analyze_image": ("POST", "/api/analyze-image", "multipart", lambda i: {"seed": i}),
+    "extract_text": ("POST", "/api/extract-text", "multipart", lambda i: {"seed": i}),
+}
+
+
+async def _send(client, name: str, i: int, images: dict):
+    """Send one request; returns (status, seconds, error)"""
+    method, path, kind, build = ENDPOINTS[name]
+    payload = build(i)
+    if kind == "multipart" and payload["seed"] not in images:
+        images[payload["seed"]] = _make_image(payload["seed"])
+
+    start = time.perf_counter()
+    if kind == "multipart":
+        response = await client.request(method, path, files={"file": (f"page{i}.jpg", images[payload["seed"]], "image/jpeg")})
+    elif kind == "get":
+        response = await client.request(method, path)
+    else:
+        response = await client.request(method, path, json=payload)
+    elapsed = time.perf_counter() - start
+
+    error = None
+    if response.status_code >= 400:
+        error = f"HTTP {response.status_code}"
+    elif kind == "sse" and "event: error" in response.text:
+        error = "stream error event"
+    elif name == "analyze_batch" and response.json().get("failed"):
+        error = "batch item failed"
+    return response.status_code, elapsed, error
+
+
+def _percentile(samples: list, p: float):
+    """Nearest-rank percentile of sorted samples"""
+    if not samples:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+def _ms(seconds: float | None):
+    """Seconds to milliseconds, rounded for the report"""
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _summarize(latencies: list, statuses: Counter, errors: int, wall: float):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": dict(statuses),
+        "p50_ms": _ms(_percentile(latencies, 50)),
+        "p95_ms": _ms(_percentile(latencies, 95)),
+        "p99_ms": _ms(_percentile(latencies, 99)),
+        "mean_ms": _ms(sum(latencies) / len(latencies)) if latencies else None,
+        "max_ms": _ms(latencies[-1]) if latencies else None,
+        "rps": round(len(latencies) / wall, 2) if wall else None,
+    }
+
+
+async def _run_level(client, name: str, concurrency: int, requests: int, pool: int, offset: int, images: dict):
+    """Drive one endpoint with a closed loop of `concurrency` workers"""
+    counter = iter(range(requests))
+    latencies, statuses, errors = [], Counter(), 0
+
+    async def worker():
+        nonlocal errors
+        for n in counter:
+            i = offset + (n % pool if pool else n)
+            try:
+                status, seconds, error = await _send(client, name, i, images)
+            except Exception as e:
+                status, seconds, error = "exception", 0.0, str(e)
+            statuses[str(status)] += 1
+            latencies.append(seconds)
+            if error:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _summarize(latencies, statuses, errors, time.perf_counter() - start)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _print_table(results: list):
+    print(f"{'endpoint':<16} {'conc':>5} {'reqs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>8} {'errors':>7}")
+    for row in results:
+        print(
+            f"{row['endpoint']:<16} {row['concurrency']:>5} {row['requests']:>6} {row['p50_ms']:>9} "
+            f"{row['p95_ms']:>9} {row['p99_ms']:>9} {row['rps']:>8} {row['errors']:>7}"
+        )
+
+
+def _print_comparison(results: list, baseline_path: str):
+    """Percentage change against an earlier results file (negative latency = faster)"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(row["endpoint"], row["concurrency"]): row for row in baseline["results"]}
+
+    def delta(new, old):
+        if not old or new is None:
+            return "-"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"\nCompared with {baseline['meta']['commit']} ({baseline['meta']['started_at']}):")
+    print(f"{'endpoint':<16} {'conc':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9}")
+    for row in results:
+        old = previous.get((row["endpoint"], row["concurrency"]))
+        if old is None:
+            continue
+        print(
+            f"{row['endpoint']:<16} {row['concurrency']:>5} "
+            f"{delta(row['p50_ms'], old['p50_ms']):>9} {delta(row['p95_ms'], old['p95_ms']):>9} "
+            f"{delta(row['p99_ms'], old['p99_ms']):>9} {delta(row['rps'], old['rps']):>9}"
+        )
+
+
+async def run(args):
+    import httpx
+    from benchmarks.fakes import install_fakes
+    from app.main import app
+
+    behaviours = install_fakes(latency_scale=args.latency_scale, error_rate=args.error_rate, seed=args.seed)
+    endpoints = [name.strip() for name in args.endpoints.split(",")]
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    results = []
+    images = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadgen", timeout=None) as client:
+        for name in endpoints:
+            if name not in ENDPOINTS:
+                sys.exit(f"Unknown endpoint {name!r} (choose from {', '.join(ENDPOINTS)})")
+            for level_index, concurrency in enumerate(levels):
+                # Distinct inputs per level, so one level does not warm the caches of the next
+                offset = (level_index + 1) * 1_000_000
+                summary = await _run_level(client, name, concurrency, args.requests, args.pool, offset, images)
+                results.append({"endpoint": name, "concurrency": concurrency, **summary})
+                print(f"  {name} x{concurrency}: p50 {summary['p50_ms']} ms, {summary['rps']} rps", file=sys.stderr)
+
+        stats = (await client.get("/api/stats")).json()
+
+    return results, {name: {"calls": b.calls, "errors": b.errors} for name, b in behaviours.items()}, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoints", default=",".join(name for name in ENDPOINTS if name != "health"))
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and level")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier on the fakes' latencies")
+    parser.add_argument("--error-rate", type=float, default=None, help="Error rate of every fake upstream")
+    parser.add_argument("--pool", type=int, default=0, help="Distinct inputs per level (0 = every request unique)")
+    parser.add_argument("--caches", action="store_true", help="Keep the semantic cache and research index on")
+    parser.add_argument("--keep-limits", action="store_true", help="Keep the configured upstream rate limits")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default=None, help="Results file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    _configure_environment(args)
+    started_at = datetime.now()
+    results, upstream_calls, stats = asyncio.run(run(args))
+
+    _print_table(results)
+    meta = {
+        "commit": _git_commit(),
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "args": vars(args),
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{started_at:%Y%m%d-%H%M%S}-{meta['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"meta": meta, "results": results, "upstream_calls": upstream_calls, "stats": stats}, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        _print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()